@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Measures aggregating parsed messages as DmpEventColumns against looping
+over the message objects: events per zone and per hour and event key.
+
+Run from the repository root:
+
+    PYTHONPATH=src python3 benchmarks/bench_columns.py --events 1000000
+"""
+import argparse
+import collections
+import logging
+import time
+from typing import Callable, Tuple
+
+from dmp.dmp_columns import DmpEventColumns, _numpy
+from dmp.dmp_message import message_event_key, parse_message
+
+
+FRAMES = [
+    '\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\',
+    '\x02E65A   1294 &    0Zc\\020\\t "DC\\z 501\\',
+    '\x02159C   1294 &    1Zq\\062\\t "OP\\u 00107"JEFF FOB        \\a 001"PERIMETER       \\',
+    '\x026565   1294 &    0Zd\\060\\t "A1\\z 630"REPEATER LAUNDRY\\a 001"PERIMETER       \\',
+    "\x0227F7   1294 &    0Zs\\014\\t 071\\",
+]
+
+
+def timed(run: Callable[[], object]) -> Tuple[float, object]:
+    start = time.perf_counter()
+    result = run()
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=1000000)
+    args = parser.parse_args()
+
+    # The "u" subsection in the arming frames is unknown and logs a warning
+    # per frame; keep that out of the measurement.
+    logging.disable(logging.WARNING)
+
+    parsed = [parse_message(frame) for frame in FRAMES]
+    messages = [parsed[i % len(parsed)] for i in range(args.events)]
+    received = [1.7e9 + i * 0.5 for i in range(args.events)]
+
+    def objects_per_zone():
+        return collections.Counter(
+            m.zone.number for m in messages if getattr(m, "zone", None) is not None
+        )
+
+    def objects_per_hour_and_key():
+        return collections.Counter(
+            (
+                (t - m.minutes_ago * 60) // 3600 * 3600,
+                message_event_key(type(m)),
+            )
+            for m, t in zip(messages, received)
+        )
+
+    def build_columns():
+        columns = DmpEventColumns()
+        for message, t in zip(messages, received):
+            columns.append(message, t)
+        return columns
+
+    build, columns = timed(build_columns)
+
+    print(
+        f"{args.events:,} events, NumPy {'installed' if _numpy() else 'not installed'}"
+    )
+    print(f"building columns:       {build:.2f}s")
+    for label, objects, column in (
+        ("events per zone", objects_per_zone, lambda: columns.counts("zone")),
+        (
+            "per hour and event key",
+            objects_per_hour_and_key,
+            lambda: columns.bucket_counts(3600, "event_key"),
+        ),
+    ):
+        loop, _ = timed(objects)
+        vectorized, _ = timed(column)
+        print(
+            f"{label + ':':23} objects {loop:.3f}s, columns {vectorized:.3f}s "
+            f"({loop / vectorized:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Measures what checking frame CRCs costs next to parsing the frames, both
+on their own and through DmpFrameDecoder in each CRC mode.
+
+Run from the repository root:
+
+    PYTHONPATH=src python3 benchmarks/bench_crc.py
+"""
+import argparse
+import logging
+import time
+from typing import Callable, Dict
+
+from dmp.dmp_crc import CRC_MODES, frame_crc_matches
+from dmp.dmp_decoder import DmpFrameDecoder
+from dmp.dmp_message import parse_frame
+
+
+FRAMES = [
+    b'\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\\r',
+    b'\x02E65A   1294 &    0Zc\\020\\t "DC\\z 501\\\r',
+    b'\x02159C   1294 &    1Zq\\062\\t "OP\\u 00107"JEFF FOB        \\'
+    b'a 001"PERIMETER       \\\r',
+    b'\x027E0E   1294 &    0Zq\\062\\t "CL\\u 00000"NO CODE REQUIRED\\'
+    b'a 002"INTERIOR        \\\r',
+    b'\x026565   1294 &    0Zd\\060\\t "A1\\z 630"REPEATER LAUNDRY\\'
+    b'a 001"PERIMETER       \\\r',
+    b"\x0227F7   1294 &    0Zs\\014\\t 071\\\r",
+]
+
+
+def best_of(repeat: int, run: Callable[[], None]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def per_frame(iterations: int, repeat: int, check: Callable[[bytes], object]) -> float:
+    """Microseconds per frame for `check`."""
+
+    def run() -> None:
+        for _ in range(iterations):
+            for frame in FRAMES:
+                check(frame)
+
+    return best_of(repeat, run) / (iterations * len(FRAMES)) * 1e6
+
+
+def decoder_rates(iterations: int, repeat: int) -> Dict[str, float]:
+    """
+    Frames a second through a decoder fed 64 frames per chunk, in each CRC
+    mode. The modes take turns, so that they share any noise.
+    """
+    chunk = b"".join(FRAMES) * (64 // len(FRAMES))
+    frames = iterations // 64 * (64 // len(FRAMES) * len(FRAMES))
+    best = dict.fromkeys(CRC_MODES, float("inf"))
+    for _ in range(repeat):
+        for mode in CRC_MODES:
+            decoder = DmpFrameDecoder(crc_mode=mode)
+            start = time.perf_counter()
+            for _ in range(iterations // 64):
+                for _ in decoder.feed(chunk):
+                    pass
+            best[mode] = min(best[mode], time.perf_counter() - start)
+    return {mode: frames / seconds for mode, seconds in best.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # The "u" subsection in the arming frames is unknown and logs a warning
+    # per frame; keep that out of the measurement.
+    logging.disable(logging.WARNING)
+
+    crc = per_frame(
+        args.iterations, args.repeat, lambda f: frame_crc_matches(f, 0, len(f) - 1)
+    )
+    parse = per_frame(
+        args.iterations, args.repeat, lambda f: parse_frame(f, 0, len(f) - 1)
+    )
+    print(f"frame_crc_matches: {crc:.2f} us/frame")
+    print(f"parse_frame:       {parse:.2f} us/frame ({crc / parse:.0%} for the CRC)")
+
+    rates = decoder_rates(args.iterations, args.repeat)
+    for mode, rate in rates.items():
+        print(
+            f"decoder, crc_mode={mode + ':':8}{rate:,.0f} frames/sec "
+            f"({rate / rates['skip'] - 1:+.0%})"
+        )
+
+
+if __name__ == "__main__":
+    main()
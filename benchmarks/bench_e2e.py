@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+End-to-end load harness for the bridge pipeline on localhost.
+
+Runs a DmpMessageListener feeding translate_dmp_to_mqtt, which publishes to
+an in-process MQTT broker stub that records every publish, and a
+DmpCommandScheduler sending ARM_HOME through DmpMessageWriter to a fake
+panel command port that answers the remote link handshake and every command.
+
+Fake panels, in separate load generator processes, open --connections
+connections, each for its own account, and replay frames drawn from --mix at
+a combined --rate frames/sec, checking that every frame gets the right ack.
+
+Reports the sustained acked frames/sec, frame-to-publish latency percentiles
+(from the panel's write to the stub's publish, both on the monotonic clock
+shared by the processes) and command round-trip percentiles.
+
+Run from the repository root:
+
+    PYTHONPATH=src python3 benchmarks/bench_e2e.py --connections 50 --rate 20000
+"""
+import argparse
+import asyncio
+import collections
+import logging
+import multiprocessing
+import random
+import socket
+import time
+from typing import Dict, List, Sequence, Tuple
+
+from dmp.bridge import (
+    ACK_MODES,
+    LISTENER_MODES,
+    DmpMessageListener,
+    DmpMessageWriter,
+    translate_dmp_to_mqtt,
+)
+from dmp.dmp_crc import CRC_MODES, dmp_crc
+from dmp.dmp_mapping import DEFAULT_MAPPING, DmpTopicMapping
+from dmp.dmp_message import parse_message
+from dmp.dmp_scheduler import PRIORITY_ARMING, DmpCommandScheduler
+
+
+# Event key, event type and sections of each kind of event in a mix; {zone}
+# is filled in per frame.
+EVENTS = {
+    "door_open": ("c", '"DO', "z {zone:3d}\\"),
+    "door_closed": ("c", '"DC', "z {zone:3d}\\"),
+    "alarm": ("a", '"BU', 'z {zone:3d}"FRONT DOOR      \\a 001"PERIMETER       \\'),
+    "restore": ("r", '"BU', 'z {zone:3d}"FRONT DOOR      \\a 001"PERIMETER       \\'),
+    "armed": ("q", '"CL', 'u 00107"JEFF FOB        \\a 001"PERIMETER       \\'),
+    "disarmed": ("q", '"OP', 'u 00107"JEFF FOB        \\a 001"PERIMETER       \\'),
+    "system": ("s", "071", ""),
+}
+
+DEFAULT_MIX = (
+    "door_open=40,door_closed=40,restore=10,alarm=2,armed=2,disarmed=2,system=4"
+)
+
+# Distinct frames each connection cycles through.
+FRAMES_PER_CONNECTION = 1000
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in EVENTS:
+            raise argparse.ArgumentTypeError(
+                f"unknown event '{name}', expected one of {', '.join(EVENTS)}"
+            )
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def account_number(connection: int) -> str:
+    return str(connection + 1)
+
+
+def frame(account: str, event: str, zone: int) -> bytes:
+    event_key, event_type, sections = EVENTS[event]
+    body = f"Z{event_key}\\000\\t {event_type}\\{sections.format(zone=zone)}"
+    body = body.replace("\\000\\", f"\\{len(body) + 1:03d}\\", 1)
+    rest = f"  {account:>5} &    0{body}\r".encode()
+    return b"\x02" + f"{dmp_crc(rest):04X}".encode() + rest
+
+
+def ack(account: str) -> bytes:
+    return f"\x02{account:>5}\x06\r".encode()
+
+
+def connection_frames(
+    account: str, mix: Dict[str, float], rng: random.Random
+) -> List[Tuple[bytes, bool]]:
+    """Frames for one connection, with whether the bridge publishes each."""
+    mapping = DmpTopicMapping(DEFAULT_MAPPING)
+    events = rng.choices(list(mix), list(mix.values()), k=FRAMES_PER_CONNECTION)
+    result = []
+    for event in events:
+        data = frame(account, event, rng.randint(1, 999))
+        message = parse_message(data.decode().rstrip("\r"))
+        result.append((data, mapping.publication(message) is not None))
+    return result
+
+
+async def panel(
+    port: int,
+    account: str,
+    frames: List[Tuple[bytes, bool]],
+    rate: float,
+    deadline: float,
+    sent_times: List[float],
+) -> Tuple[int, int]:
+    """
+    Writes `frames` round robin at `rate` frames/sec until `deadline`, then
+    waits for the outstanding acks. Returns the good and the bad acks.
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    expected = ack(account)
+    sent = 0
+
+    # Good and bad acks.
+    acked = [0, 0]
+
+    async def read_acks() -> None:
+        while True:
+            data = await reader.readuntil(b"\r")
+            acked[data != expected] += 1
+
+    acks = asyncio.ensure_future(read_acks())
+    start = time.monotonic()
+    position = 0
+    while time.monotonic() < deadline and not acks.done():
+        due = int((time.monotonic() - start) * rate) + 1 - sent
+        if due > 0:
+            now = time.monotonic()
+            chunk = []
+            for _ in range(due):
+                data, published = frames[position]
+                position = (position + 1) % len(frames)
+                chunk.append(data)
+                if published:
+                    sent_times.append(now)
+            writer.write(b"".join(chunk))
+            sent += due
+            await writer.drain()
+        await asyncio.sleep(max(0.0, start + (sent + 1) / rate - time.monotonic()))
+
+    give_up = time.monotonic() + 10
+    while sum(acked) < sent and time.monotonic() < give_up and not acks.done():
+        await asyncio.sleep(0.01)
+    acks.cancel()
+    writer.close()
+    good, bad = acked
+    # Frames that were never acked count as bad.
+    return good, sent - good
+
+
+def load(
+    port: int,
+    connections: Sequence[int],
+    mix: Dict[str, float],
+    rate: float,
+    duration: float,
+    seed: int,
+    results,
+) -> None:
+    async def run():
+        deadline = time.monotonic() + duration
+        sent_times: Dict[str, List[float]] = {}
+        panels = []
+        for connection in connections:
+            account = account_number(connection)
+            frames = connection_frames(account, mix, random.Random(seed + connection))
+            sent_times[account] = []
+            panels.append(
+                panel(port, account, frames, rate, deadline, sent_times[account])
+            )
+        counts = await asyncio.gather(*panels)
+        return (
+            sum(good for good, _ in counts),
+            sum(bad for _, bad in counts),
+            sent_times,
+        )
+
+    results.put(asyncio.run(run()))
+
+
+class MQTTBrokerStub:
+    """Stands in for the MQTT client and broker, recording every publish."""
+
+    def __init__(self) -> None:
+        self.publishes = 0
+        self.published_times: Dict[str, List[float]] = collections.defaultdict(list)
+
+    def publish(self, topic, payload, qos=0, retain=False) -> None:
+        # dmp/<account>/...
+        self.published_times[topic.split("/", 2)[1]].append(time.monotonic())
+        self.publishes += 1
+
+
+class FakePanelCommandPort:
+    """
+    Answers the command port side of DmpMessageWriter: acks the !V0 hangup,
+    the !V2 remote key and every command after `delay` seconds.
+    """
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self._delay = delay
+        self.handshakes = 0
+        self.commands = 0
+
+    async def handle(self, reader, writer) -> None:
+        while True:
+            try:
+                line = (await reader.readuntil(b"\r")).decode()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            # @<account><command>
+            account, command = line[1:6], line[6:8]
+            if command == "!V" and line[8] == "2":
+                self.handshakes += 1
+            elif command != "!V":
+                self.commands += 1
+            if self._delay:
+                await asyncio.sleep(self._delay)
+            writer.write(f"\x02@{account}+{command}\r".encode())
+        writer.close()
+
+
+async def send_commands(
+    scheduler: DmpCommandScheduler, interval: float, round_trips: List[float]
+) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        start = time.monotonic()
+        await scheduler.submit(
+            "ARM_HOME",
+            DmpMessageWriter.COMMANDS["ARM_HOME"],
+            group="arming",
+            priority=PRIORITY_ARMING,
+        )
+        round_trips.append(time.monotonic() - start)
+
+
+def percentile(samples: Sequence[float], p: int) -> float:
+    return samples[min(len(samples) - 1, len(samples) * p // 100)]
+
+
+async def run(args: argparse.Namespace) -> None:
+    listen_port = free_port()
+    accounts = [account_number(connection) for connection in range(args.connections)]
+
+    command_port = FakePanelCommandPort(args.command_delay)
+    command_server = await asyncio.start_server(command_port.handle, "127.0.0.1", 0)
+    writer = DmpMessageWriter(
+        dmp_server_host="127.0.0.1",
+        dmp_server_port=command_server.sockets[0].getsockname()[1],
+        dmp_account_number=accounts[0],
+        dmp_remote_key="1234",
+    )
+    scheduler = DmpCommandScheduler(writer.send)
+
+    mapping = DmpTopicMapping(DEFAULT_MAPPING)
+    listener = DmpMessageListener(
+        listen_port=listen_port,
+        dmp_server_host=None,
+        dmp_account_number=None,
+        mode=args.listener_mode,
+        accept=mapping.accepts,
+        ack_mode=args.ack_mode,
+        crc_mode=args.crc_mode,
+    )
+    broker = MQTTBrokerStub()
+    bridge = asyncio.ensure_future(
+        translate_dmp_to_mqtt(listener, broker, accounts, topic_mapping=mapping)
+    )
+    round_trips: List[float] = []
+    tasks = [
+        asyncio.ensure_future(scheduler.run()),
+        asyncio.ensure_future(
+            send_commands(scheduler, args.command_interval, round_trips)
+        ),
+    ]
+    await asyncio.sleep(0.5)
+
+    loop = asyncio.get_running_loop()
+    results: multiprocessing.Queue = multiprocessing.Queue()
+    generators = [
+        multiprocessing.Process(
+            target=load,
+            args=(
+                listen_port,
+                range(g, args.connections, args.generators),
+                args.mix,
+                args.rate / args.connections,
+                args.duration,
+                args.seed,
+                results,
+            ),
+        )
+        for g in range(args.generators)
+    ]
+    for generator in generators:
+        generator.start()
+    acked = bad = 0
+    sent_times: Dict[str, List[float]] = {}
+    for _ in generators:
+        good, wrong, times = await loop.run_in_executor(None, results.get)
+        acked += good
+        bad += wrong
+        sent_times.update(times)
+    for generator in generators:
+        generator.join()
+
+    # Acks may go out before the publish, which can lag behind.
+    expected = sum(len(times) for times in sent_times.values())
+    for _ in range(100):
+        if broker.publishes >= expected:
+            break
+        await asyncio.sleep(0.1)
+
+    for task in tasks + [bridge]:
+        task.cancel()
+    await writer.close()
+    command_server.close()
+
+    latencies: List[float] = []
+    for account, times in sent_times.items():
+        published = broker.published_times.get(account, [])
+        latencies.extend(p - s for s, p in zip(times, published))
+    latencies.sort()
+    round_trips.sort()
+
+    print(
+        f"{args.connections} connections, {args.listener_mode} mode, "
+        f"{args.ack_mode} acks, target {args.rate:,.0f} frames/sec"
+    )
+    print(f"Sustained: {acked / args.duration:,.0f} acked frames/sec")
+    if bad:
+        print(f"Missing or wrong acks: {bad}")
+    print(f"Published: {broker.publishes:,} of {expected:,} expected")
+    if latencies:
+        print(
+            "Frame to publish: "
+            + ", ".join(
+                f"p{p} {percentile(latencies, p) * 1000:.2f} ms" for p in (50, 90, 99)
+            )
+        )
+    if round_trips:
+        print(
+            f"Command round trip ({len(round_trips)}, "
+            f"{command_port.handshakes} handshake(s)): "
+            + ", ".join(
+                f"p{p} {percentile(round_trips, p) * 1000:.2f} ms" for p in (50, 99)
+            )
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--connections", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=5000, help="Frames/sec in all")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help=f"Weighted events to replay, from: {', '.join(EVENTS)}",
+    )
+    parser.add_argument("--generators", type=int, default=1)
+    parser.add_argument("--listener-mode", choices=LISTENER_MODES, default="stream")
+    parser.add_argument("--ack-mode", choices=ACK_MODES, default="received")
+    parser.add_argument("--crc-mode", choices=CRC_MODES, default="log")
+    parser.add_argument("--command-interval", type=float, default=0.5)
+    parser.add_argument(
+        "--command-delay",
+        type=float,
+        default=0.0,
+        help="Seconds the fake panel takes to answer each command",
+    )
+    parser.add_argument("--seed", type=int, default=1294)
+    args = parser.parse_args()
+
+    # Arming frames carry a user number subsection, which logs a warning.
+    logging.disable(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Compares frame throughput of the DmpMessageListener modes over localhost.
+
+Each simulated panel opens a connection, writes its frames in bursts and reads
+back one ack per frame; the run ends once every frame has come out of
+`listen()`. A large --burst stands in for a panel replaying its backlog.
+
+Run from the repository root:
+
+    PYTHONPATH=src python3 benchmarks/bench_listener.py --connections 50
+"""
+
+import argparse
+import asyncio
+import socket
+import time
+
+from dmp.bridge import ACK_MODES, LISTENER_MODES, DmpMessageListener
+from dmp.dmp_metrics import DmpMetrics
+
+
+FRAME = b'\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\\r'
+ACK = b"\x02 1294\x06\r"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def panel(port: int, frames: int, burst: int) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    sent = 0
+    while sent < frames:
+        count = min(burst, frames - sent)
+        writer.write(FRAME * count)
+        await reader.readexactly(len(ACK) * count)
+        sent += count
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run(
+    mode: str,
+    ack_mode: str,
+    connections: int,
+    frames: int,
+    burst: int,
+    metrics: bool = False,
+) -> float:
+    port = free_port()
+    listener = DmpMessageListener(
+        listen_port=port,
+        dmp_server_host="127.0.0.1",
+        dmp_account_number="1294",
+        mode=mode,
+        ack_mode=ack_mode,
+        metrics=DmpMetrics() if metrics else None,
+    )
+    messages = listener.listen()
+    # Start the server before the panels connect.
+    first = asyncio.ensure_future(messages.__anext__())
+    await asyncio.sleep(0.1)
+
+    total = connections * frames
+    start = time.perf_counter()
+    panels = asyncio.gather(*(panel(port, frames, burst) for _ in range(connections)))
+    await first
+    for _ in range(total - 1):
+        await messages.__anext__()
+    elapsed = time.perf_counter() - start
+    # Finishes with the last message, which acks it in "delivered" mode.
+    last = asyncio.ensure_future(messages.__anext__())
+    await panels
+    last.cancel()
+    return total / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--connections", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=2000, help="Per connection")
+    parser.add_argument("--burst", type=int, default=10, help="Frames per write")
+    parser.add_argument("--ack-mode", choices=ACK_MODES, default="received")
+    parser.add_argument("--metrics", action="store_true", help="Collect metrics")
+    parser.add_argument("--event-loop", choices=("asyncio", "uvloop"))
+    args = parser.parse_args()
+
+    if args.event_loop == "uvloop":
+        import uvloop
+
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    for mode in LISTENER_MODES:
+        rate = asyncio.run(
+            run(
+                mode,
+                args.ack_mode,
+                args.connections,
+                args.frames,
+                args.burst,
+                args.metrics,
+            )
+        )
+        print(f"{mode:>8}: {rate:,.0f} frames/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Measures the memory held by a large number of parsed DMP messages.
+
+Frames are a mix of zone alarm, low battery, door status and arming messages
+over a few hundred named zones, as a single panel would report them.
+
+Run from the repository root:
+
+    PYTHONPATH=src python3 benchmarks/bench_message_memory.py --messages 1000000
+"""
+import argparse
+import gc
+import itertools
+import tracemalloc
+from typing import Iterator, List
+
+from dmp.dmp_message import parse_message
+
+
+def frame(event_key: str, event_type: str, sections: str) -> str:
+    body = f"Z{event_key}\\000\\t {event_type}\\{sections}"
+    return f"\x020000   1294 &    0{body}".replace(
+        "\\000\\", f"\\{len(body) + 1:03d}\\", 1
+    )
+
+
+def frames(zones: int) -> Iterator[str]:
+    areas = ['a 001"PERIMETER       \\', 'a 002"INTERIOR        \\']
+    for zone in range(1, zones + 1):
+        z = f'z {zone:3d}"ZONE {zone:<11d}\\'
+        area = areas[zone % 2]
+        yield frame("a", '"BU', z + area)
+        yield frame("d", '"A1', z + area)
+        yield frame("c", '"DO', f"z {zone:3d}\\")
+        yield frame("c", '"DC', f"z {zone:3d}\\")
+        yield frame("q", '"CL', area)
+
+
+def measure(count: int, zones: int) -> int:
+    gc.collect()
+    tracemalloc.start()
+    held: List[object] = [
+        parse_message(data)
+        for data in itertools.islice(itertools.cycle(frames(zones)), count)
+    ]
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(held) == count
+    return size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--zones", type=int, default=300)
+    args = parser.parse_args()
+
+    size = measure(args.messages, args.zones)
+    print(
+        f"{args.messages:,} messages: {size / 2 ** 20:,.1f} MiB, "
+        f"{size / args.messages:,.0f} bytes/message"
+    )
+
+
+if __name__ == "__main__":
+    main()
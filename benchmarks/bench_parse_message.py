@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Measures parse_message throughput on the frames used by
+src/dmp/tests/test_dmp_message.py.
+
+Run from the repository root:
+
+    PYTHONPATH=src python3 benchmarks/bench_parse_message.py
+"""
+import argparse
+import logging
+import time
+
+from dmp.dmp_message import parse_message
+
+
+FRAMES = [
+    '\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\',
+    '\x02E65A   1294 &    0Zc\\020\\t "DC\\z 501\\',
+    '\x02159C   1294 &    1Zq\\062\\t "OP\\u 00107"JEFF FOB        \\a 001"PERIMETER       \\',
+    '\x027E0E   1294 &    0Zq\\062\\t "CL\\u 00000"NO CODE REQUIRED\\a 002"INTERIOR        \\',
+    '\x026565   1294 &    0Zd\\060\\t "A1\\z 630"REPEATER LAUNDRY\\a 001"PERIMETER       \\',
+    "\x0227F7   1294 &    0Zs\\014\\t 071\\",
+]
+
+
+def bench(iterations: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for frame in FRAMES:
+                parse_message(frame)
+        best = min(best, time.perf_counter() - start)
+    return iterations * len(FRAMES) / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # The "u" subsection in the arming frames is unknown and logs a warning
+    # per frame; keep that out of the measurement.
+    logging.disable(logging.WARNING)
+
+    rate = bench(args.iterations, args.repeat)
+    print(f"parse_message: {rate:,.0f} messages/sec over {len(FRAMES)} frames")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Parser benchmark suite with a stored baseline and regression thresholds.
+
+Builds synthetic frames for every registered message class, with varied zone,
+area and device names and, for some frames, an unknown subsection the parser
+has to skip. Measures overall parse_message throughput, per-class latency
+percentiles, and the memory each parsed message keeps alive (tracemalloc
+blocks and bytes).
+
+A run is compared against the baseline file, if there is one, and exits with
+status 1 when throughput drops or memory grows past the thresholds.
+Throughput is compared as parsing time relative to a calibration loop timed
+alongside it, which cancels out much of the noise of a shared machine, but
+baselines remain machine specific: record one with --save-baseline before
+judging a change.
+
+Run from the repository root:
+
+    PYTHONPATH=src python3 benchmarks/bench_parser_suite.py --save-baseline
+    PYTHONPATH=src python3 benchmarks/bench_parser_suite.py
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+from dataclasses import MISSING, fields
+from typing import Dict, List, Sequence
+
+from dmp.dmp_message import message_classes, message_event_key, parse_message
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "parser_baseline.json")
+
+NAMES = [
+    "FRONT DOOR",
+    "BACK DOOR",
+    "GARAGE",
+    "REPEATER LAUNDRY",
+    "MASTER BEDROOM WIN",
+    "KITCHEN MOTION",
+    "BASEMENT",
+    "",
+]
+
+# Event types, as they appear in the frame, by the fields a class has.
+EVENT_TYPES = {
+    "zone": ['"BU', '"FI', '"A1', '"SV', '"PN'],
+    "device_zone": ['"DO', '"DC', '"ON', '"OF'],
+    "device": ['"DA', '"IC', '"AA'],
+    "area": ['"CL', '"OP', '"LA'],
+    "equipment_id": ['"RP', '"AD', '"TS'],
+    "service_code": ["000", "009", "071"],
+}
+
+# Subsections the parser does not know; arming frames carry a user number.
+UNKNOWN = ['u 00107"JEFF FOB        \\', "l 12345\\"]
+
+
+def frame(event_key: str, event_type: str, sections: str) -> str:
+    body = f"Z{event_key}\\000\\t {event_type}\\{sections}"
+    return f"\x020000   1294 &    0{body}".replace(
+        "\\000\\", f"\\{len(body) + 1:03d}\\", 1
+    )
+
+
+def named(code: str, rng: random.Random, required_name: bool = False) -> str:
+    name = rng.choice(NAMES)
+    if name or required_name:
+        return f'{code} {rng.randint(1, 999):3d}"{name:<16}\\'
+    return f"{code} {rng.randint(1, 999):3d}\\"
+
+
+def class_frames(cls, rng: random.Random, count: int) -> List[str]:
+    names = {f.name for f in fields(cls)}
+    required = {f.name for f in fields(cls) if f.default is MISSING}
+    if "device" in names:
+        kind = "device_zone" if "zone" in names else "device"
+    elif "zone" in names:
+        kind = "zone"
+    else:
+        kind = next(k for k in ("area", "equipment_id", "service_code") if k in names)
+
+    result = []
+    for _ in range(count):
+        sections = []
+        if "device" in names:
+            sections.append(named("v", rng))
+        if "zone" in names:
+            sections.append(named("z", rng))
+        if "area" in names and ("area" in required or rng.random() < 0.5):
+            sections.append(named("a", rng, required_name=True))
+        if "equipment_id" in names:
+            sections.append(f"g {rng.randint(1, 999999):6d}\\")
+        if "service_code" in names and (
+            "service_code" in required or rng.random() < 0.5
+        ):
+            sections.append(f"m{rng.choice(' YN')}{rng.randint(0, 99999):05d}\\")
+        if rng.random() < 0.2:
+            sections.insert(rng.randint(0, len(sections)), rng.choice(UNKNOWN))
+        result.append(
+            frame(
+                message_event_key(cls),
+                rng.choice(EVENT_TYPES[kind]),
+                "".join(sections),
+            )
+        )
+    return result
+
+
+def calibrate(frames: Sequence[str]) -> None:
+    """Work of a similar kind to parsing that does not depend on the parser."""
+    for data in frames:
+        match = _CALIBRATION_REGEX.match(data)
+        dict(zip(match.groups(), data.split("\\")))
+
+
+_CALIBRATION_REGEX = re.compile(r"\x02(.{4})  ([ \d]{5}) &([ \d]{5})Z([a-z])")
+
+
+def throughput(frames: Sequence[str], repeat: int) -> Dict[str, float]:
+    """
+    The best throughput, and the lowest cost relative to `calibrate` over the
+    same frames timed right before, which varies less between runs on a busy
+    machine.
+    """
+    best, relative = float("inf"), float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        calibrate(frames)
+        calibrated = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for data in frames:
+            parse_message(data)
+        elapsed = time.perf_counter() - start
+
+        best = min(best, elapsed)
+        relative = min(relative, elapsed / calibrated)
+    return {"throughput": len(frames) / best, "relative_cost": relative}
+
+
+def latencies(frames: Sequence[str], repeat: int) -> Dict[str, float]:
+    timer = time.perf_counter_ns
+    samples = []
+    for _ in range(repeat):
+        for data in frames:
+            start = timer()
+            parse_message(data)
+            samples.append(timer() - start)
+    samples.sort()
+    return {
+        f"p{p}_ns": float(samples[min(len(samples) - 1, len(samples) * p // 100)])
+        for p in (50, 90, 99)
+    }
+
+
+def memory(frames: Sequence[str]) -> Dict[str, float]:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    held = [parse_message(data) for data in frames]
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    # The list holding the messages is not the parser's doing.
+    size -= sys.getsizeof(held)
+    return {"blocks": blocks / len(held), "bytes": size / len(held)}
+
+
+def run(frames_per_class: int, repeat: int, seed: int) -> Dict[str, object]:
+    rng = random.Random(seed)
+    per_class = {
+        cls.__name__: class_frames(cls, rng, frames_per_class)
+        for cls in message_classes().values()
+    }
+    everything = [data for frames in per_class.values() for data in frames]
+    rng.shuffle(everything)
+
+    return {
+        **throughput(everything, repeat),
+        "classes": {
+            name: {**latencies(frames, repeat), **memory(frames)}
+            for name, frames in sorted(per_class.items())
+        },
+    }
+
+
+def compare(
+    result: Dict[str, object],
+    baseline: Dict[str, object],
+    throughput_threshold: float,
+    memory_threshold: float,
+) -> List[str]:
+    """Returns a description of every regression past the thresholds."""
+    failures = []
+    # A drop in throughput by a fraction t is a rise in cost by 1 / (1 - t).
+    ceiling = baseline["relative_cost"] / (1 - throughput_threshold)
+    if result["relative_cost"] > ceiling:
+        failures.append(
+            f"relative cost {result['relative_cost']:.2f} is above {ceiling:.2f} "
+            f"({baseline['relative_cost']:.2f} baseline); throughput "
+            f"{result['throughput']:,.0f} msgs/s vs {baseline['throughput']:,.0f}"
+        )
+    for name, stats in result["classes"].items():
+        base = baseline["classes"].get(name)
+        if not base:
+            continue
+        for key in ("blocks", "bytes"):
+            ceiling = base[key] * (1 + memory_threshold)
+            if stats[key] > ceiling:
+                failures.append(
+                    f"{name} {key}/message {stats[key]:.1f} is above "
+                    f"{ceiling:.1f} ({base[key]:.1f} baseline)"
+                )
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames-per-class", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1294)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--throughput-threshold",
+        type=float,
+        default=0.2,
+        help="Largest tolerated drop in throughput, as a fraction",
+    )
+    parser.add_argument(
+        "--memory-threshold",
+        type=float,
+        default=0.05,
+        help="Largest tolerated growth in blocks or bytes per message",
+    )
+    args = parser.parse_args()
+
+    # Unknown subsections log a warning per frame.
+    logging.disable(logging.WARNING)
+
+    result = run(args.frames_per_class, args.repeat, args.seed)
+
+    print(
+        f"parse_message: {result['throughput']:,.0f} messages/sec, "
+        f"{result['relative_cost']:.2f}x the calibration loop"
+    )
+    print(
+        f"{'class':<26} {'p50 ns':>8} {'p90 ns':>8} {'p99 ns':>8} "
+        f"{'blocks':>7} {'bytes':>7}"
+    )
+    for name, stats in result["classes"].items():
+        print(
+            f"{name:<26} {stats['p50_ns']:>8,.0f} {stats['p90_ns']:>8,.0f} "
+            f"{stats['p99_ns']:>8,.0f} {stats['blocks']:>7.2f} {stats['bytes']:>7.1f}"
+        )
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as fp:
+            json.dump(result, fp, indent=2, sort_keys=True)
+            fp.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; record one with --save-baseline")
+        return
+
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    failures = compare(
+        result, baseline, args.throughput_threshold, args.memory_threshold
+    )
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    if failures:
+        sys.exit(1)
+    print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Measures translate_dmp_to_mqtt alone: messages/sec from a listener yielding
+already parsed messages to an MQTT client that discards every publish.
+
+Run from the repository root:
+
+    PYTHONPATH=src python3 benchmarks/bench_translate.py --messages 200000
+"""
+
+import argparse
+import asyncio
+import time
+
+from dmp.bridge import translate_dmp_to_mqtt
+from dmp.dmp_message import parse_message
+from dmp.dmp_state import DmpStateStore
+
+
+FRAMES = [
+    '\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\',
+    '\x02E65A   1294 &    0Zc\\020\\t "DC\\z 501\\',
+    '\x027E0E   1294 &    0Zq\\062\\t "CL\\u 00000"NO CODE REQUIRED\\a 001"PERIMETER       \\',
+    '\x02159C   1294 &    1Zq\\062\\t "OP\\u 00107"JEFF FOB        \\a 001"PERIMETER       \\',
+    '\x026565   1294 &    0Zd\\060\\t "A1\\z 630"REPEATER LAUNDRY\\a 001"PERIMETER       \\',
+]
+
+
+class _Listener:
+    def __init__(self, messages) -> None:
+        self._messages = messages
+
+    async def listen(self):
+        for message in self._messages:
+            yield message
+
+
+class _NullMQTTClient:
+    is_connected = True
+
+    def publish(self, topic, payload, **kwargs) -> None:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--state-store", action="store_true", help="Keep a DmpStateStore up to date"
+    )
+    args = parser.parse_args()
+
+    parsed = [parse_message(frame) for frame in FRAMES]
+    messages = [parsed[i % len(parsed)] for i in range(args.messages)]
+
+    best = 0.0
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        asyncio.run(
+            translate_dmp_to_mqtt(
+                _Listener(messages),
+                _NullMQTTClient(),
+                ["1294"],
+                state=DmpStateStore() if args.state_store else None,
+            )
+        )
+        best = max(best, args.messages / (time.perf_counter() - start))
+    print(f"{best:,.0f} messages/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Load test of listener worker processes sharing one port with SO_REUSEPORT.
+
+For each worker count, starts that many processes running a protocol-mode
+DmpMessageListener and translate_dmp_to_mqtt (publishing to a client that
+discards everything), then drives them from separate load generator
+processes for a fixed time and reports the acked frames/sec. Scaling is only
+meaningful with more cores than workers plus load generators.
+
+Run from the repository root:
+
+    PYTHONPATH=src python3 benchmarks/bench_workers.py --max-workers 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import time
+
+from dmp.bridge import DmpMessageListener, translate_dmp_to_mqtt
+
+
+FRAME = b'\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\\r'
+ACK = b"\x02 1294\x06\r"
+
+
+class _NullMQTTClient:
+    def publish(self, topic, payload, **kwargs) -> None:
+        pass
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def worker(port: int) -> None:
+    listener = DmpMessageListener(
+        listen_port=port,
+        dmp_server_host=None,
+        dmp_account_number="1294",
+        mode="protocol",
+        reuse_port=True,
+    )
+    asyncio.run(translate_dmp_to_mqtt(listener, _NullMQTTClient(), ["1294"]))
+
+
+async def panel(port: int, burst: int, deadline: float) -> int:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    acked = 0
+    while time.monotonic() < deadline:
+        writer.write(FRAME * burst)
+        await reader.readexactly(len(ACK) * burst)
+        acked += burst
+    writer.close()
+    return acked
+
+
+def load(port: int, connections: int, burst: int, duration: float, results) -> None:
+    async def run() -> int:
+        deadline = time.monotonic() + duration
+        counts = await asyncio.gather(
+            *(panel(port, burst, deadline) for _ in range(connections))
+        )
+        return sum(counts)
+
+    results.put(asyncio.run(run()))
+
+
+def measure(workers: int, args: argparse.Namespace) -> float:
+    port = free_port()
+    processes = [
+        multiprocessing.Process(target=worker, args=(port,)) for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(1)
+
+    results: multiprocessing.Queue = multiprocessing.Queue()
+    generators = [
+        multiprocessing.Process(
+            target=load,
+            args=(port, args.connections, args.burst, args.duration, results),
+        )
+        for _ in range(args.generators)
+    ]
+    for generator in generators:
+        generator.start()
+    total = sum(results.get() for _ in generators)
+    for generator in generators:
+        generator.join()
+
+    for process in processes:
+        process.terminate()
+        process.join()
+    return total / args.duration
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--generators", type=int, default=2)
+    parser.add_argument("--connections", type=int, default=16, help="Per generator")
+    parser.add_argument("--burst", type=int, default=10, help="Frames per write")
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    baseline = None
+    for workers in range(1, args.max_workers + 1):
+        rate = measure(workers, args)
+        baseline = baseline or rate
+        print(
+            f"{workers} worker(s): {rate:,.0f} frames/sec, "
+            f"{rate / baseline:.2f}x of 1 worker"
+        )
+
+
+if __name__ == "__main__":
+    main()
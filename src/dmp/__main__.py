@@ -1,19 +1,34 @@
 #!/usr/bin/env python3
 import argparse
 import asyncio
+import datetime
+import functools
 import logging
+import os
+import signal
+import sys
+import time
+from typing import List, Optional
 
-from dmp.bridge import run_dmp_mqtt_bridge
+from gmqtt import Client as MQTTClient
 
+from dmp.bridge import (
+    ACK_MODES,
+    LISTENER_MODES,
+    run_dmp_mqtt_bridge,
+    translate_dmp_to_mqtt,
+)
+from dmp.dmp_config import DmpAccountConfig, load_accounts
+from dmp.dmp_crc import CRC_MODES
+from dmp.dmp_ingest import INGEST_FORMATS, ingest_files
+from dmp.dmp_journal import DmpJournalListener, journal_accounts
+from dmp.dmp_logging import FRAME_LOG, LOG_LEVELS, configure_logging
+from dmp.dmp_mapping import DEFAULT_MAPPING, DmpTopicMapping, load_mapping
+from dmp.dmp_queue import OVERLOAD_POLICIES
+from dmp.dmp_workers import run_workers
 
-async def main() -> None:
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="%(asctime)s %(levelname)-8s %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
-    logging.getLogger("gmqtt").setLevel(logging.INFO)
 
+def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Bridge between DMP security system and MQTT broker"
     )
@@ -23,23 +38,28 @@ async def main() -> None:
         help="Port to listen on for messages from MQTT, configured via the NET route",
         required=True,
     )
+    parser.add_argument(
+        "--config",
+        type=str,
+        help="JSON file listing the DMP accounts to bridge, instead of --dmp-*",
+    )
     parser.add_argument(
         "--dmp-server-host",
         type=str,
         help="Host for the DMP security system",
-        required=True,
     )
     parser.add_argument(
         "--dmp-server-port",
         type=int,
         help="Port for sending commands to the DMP security system",
-        required=True,
-    )
-    parser.add_argument(
-        "--dmp-account-number", type=str, help="DMP account number", required=True
     )
+    parser.add_argument("--dmp-account-number", type=str, help="DMP account number")
+    parser.add_argument("--dmp-remote-key", type=str, help="DMP remote key")
     parser.add_argument(
-        "--dmp-remote-key", type=str, help="DMP remote key", required=True
+        "--dmp-idle-timeout",
+        type=float,
+        default=30.0,
+        help="Seconds to keep the authenticated command connection open when idle",
     )
     parser.add_argument(
         "--mqtt-broker-host", type=str, help="Host for the MQTT broker", required=True
@@ -56,19 +76,408 @@ async def main() -> None:
         help="Password for connecting to the MQTT broker",
         required=True,
     )
+    parser.add_argument(
+        "--listener-mode",
+        choices=LISTENER_MODES,
+        default="stream",
+        help="Serve panel connections with asyncio streams or a bare asyncio.Protocol",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=10000,
+        help="Parsed messages held for MQTT before the overload policy applies",
+    )
+    parser.add_argument(
+        "--overload-policy",
+        choices=OVERLOAD_POLICIES,
+        default="delay",
+        help="Delay panel acks, drop status messages, or spill to disk when full",
+    )
+    parser.add_argument(
+        "--spill-path",
+        type=str,
+        help="File for the 'spill' overload policy (default: a temporary file)",
+    )
+    parser.add_argument(
+        "--ack-mode",
+        choices=ACK_MODES,
+        default="received",
+        help="Ack panel frames once queued, or only once published to MQTT",
+    )
+    parser.add_argument(
+        "--ack-deadline",
+        type=float,
+        default=0.05,
+        help="Longest time in seconds to batch acks of published messages",
+    )
+    parser.add_argument(
+        "--no-publish-cache",
+        dest="publish_cache",
+        action="store_false",
+        help="Publish every retained state, even when it has not changed",
+    )
+    parser.add_argument(
+        "--publish-refresh-interval",
+        type=float,
+        help="Seconds after which an unchanged retained state is published again",
+    )
+    parser.add_argument(
+        "--topic-mapping",
+        type=str,
+        help="JSON file mapping DMP events to MQTT topics (default: built-in topics)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics on this port; worker N uses the port plus N",
+    )
+    parser.add_argument(
+        "--spool-path",
+        type=str,
+        help="File to keep publishes in while the MQTT broker is unreachable",
+    )
+    parser.add_argument(
+        "--spool-max-bytes",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="Size of the spool; alarms get a quarter of this on top, never evicted",
+    )
+    parser.add_argument(
+        "--journal-path",
+        type=str,
+        help="Directory to journal every raw frame in, for 'python -m dmp replay'",
+    )
+    parser.add_argument(
+        "--journal-segment-bytes",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="Size at which the journal starts a new segment file",
+    )
+    parser.add_argument(
+        "--crc-mode",
+        choices=CRC_MODES,
+        default="log",
+        help="Ignore frame CRCs, log frames that fail the check, or also drop them",
+    )
+    parser.add_argument(
+        "--dedup-window",
+        type=float,
+        help="Seconds within which a frame received again is not published again",
+    )
+    parser.add_argument(
+        "--state-store",
+        action="store_true",
+        help="Keep zone, area and device states to republish after reconnecting; "
+        "parses every zone, area and device frame in full, even unpublished ones",
+    )
+    add_logging_args(parser)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes sharing --listen-port through SO_REUSEPORT; "
+        "with more than one, the publish cache is off and --state-store not allowed",
+    )
+    parser.add_argument(
+        "--event-loop",
+        choices=("asyncio", "uvloop"),
+        default="asyncio",
+        help="Event loop implementation; uvloop falls back to asyncio if not installed",
+    )
     args = parser.parse_args()
 
+    single = (
+        args.dmp_server_host,
+        args.dmp_server_port,
+        args.dmp_account_number,
+        args.dmp_remote_key,
+    )
+    if args.config is None and None in single:
+        parser.error(
+            "either --config or all of --dmp-server-host, --dmp-server-port, "
+            "--dmp-account-number and --dmp-remote-key are required"
+        )
+    if args.workers > 1 and args.state_store:
+        parser.error("--state-store cannot be used with --workers")
+    return args
+
+
+def add_logging_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="INFO")
+    parser.add_argument(
+        "--log-sample-rate",
+        type=float,
+        default=100.0,
+        help="Most per-frame and per-publish log records a second of each kind, "
+        "or 0 for all",
+    )
+
+
+def load_accounts_from_args(args: argparse.Namespace) -> List[DmpAccountConfig]:
+    if args.config is not None:
+        return load_accounts(args.config)
+
+    return [
+        DmpAccountConfig(
+            account_number=args.dmp_account_number,
+            server_host=args.dmp_server_host,
+            server_port=args.dmp_server_port,
+            remote_key=args.dmp_remote_key,
+        )
+    ]
+
+
+def install_event_loop(event_loop: str) -> None:
+    if event_loop != "uvloop":
+        return
+
+    try:
+        import uvloop
+    except ImportError:
+        logging.warning("uvloop is not installed, using the asyncio event loop")
+        return
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logging.info("Using the uvloop event loop")
+
+
+async def main(args: argparse.Namespace, worker: Optional[int] = None) -> None:
+    if worker is None:
+        worker_kwargs = dict(
+            spill_path=args.spill_path,
+            spool_path=args.spool_path,
+            journal_path=args.journal_path,
+            publish_cache=args.publish_cache,
+            state_store=args.state_store,
+            metrics_port=args.metrics_port,
+        )
+    else:
+        # Only the first worker takes commands, so each is sent to the panel once.
+        # No worker sees every state change, so none can tell whether the broker
+        # already holds a state and they all publish every one, nor republish
+        # the latest states after reconnecting.
+        worker_kwargs = dict(
+            mqtt_client_id=f"dmp-mqtt-{worker}",
+            handle_commands=worker == 0,
+            reuse_port=True,
+            spill_path=f"{args.spill_path}.{worker}" if args.spill_path else None,
+            spool_path=f"{args.spool_path}.{worker}" if args.spool_path else None,
+            journal_path=(
+                f"{args.journal_path}.{worker}" if args.journal_path else None
+            ),
+            publish_cache=False,
+            state_store=False,
+            metrics_port=(
+                args.metrics_port + worker if args.metrics_port is not None else None
+            ),
+        )
+
     await run_dmp_mqtt_bridge(
         listen_port=args.listen_port,
-        dmp_server_host=args.dmp_server_host,
-        dmp_server_port=args.dmp_server_port,
-        dmp_account_number=args.dmp_account_number,
-        dmp_remote_key=args.dmp_remote_key,
+        accounts=load_accounts_from_args(args),
+        dmp_idle_timeout=args.dmp_idle_timeout,
         mqtt_broker_host=args.mqtt_broker_host,
         mqtt_username=args.mqtt_username,
         mqtt_password=args.mqtt_password,
+        listener_mode=args.listener_mode,
+        queue_size=args.queue_size,
+        overload_policy=args.overload_policy,
+        ack_mode=args.ack_mode,
+        ack_deadline=args.ack_deadline,
+        publish_refresh_interval=args.publish_refresh_interval,
+        topic_mapping=load_mapping(args.topic_mapping) if args.topic_mapping else None,
+        spool_max_bytes=args.spool_max_bytes,
+        journal_segment_bytes=args.journal_segment_bytes,
+        crc_mode=args.crc_mode,
+        dedup_window=args.dedup_window,
+        **worker_kwargs,
     )
 
 
+def parse_time(value: str) -> float:
+    """Seconds since the epoch, or an ISO 8601 date and time in local time."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time: {value}")
+
+
+def parse_replay_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m dmp replay",
+        description="Replay journaled DMP frames through the topic mapping",
+    )
+    parser.add_argument("journal", help="Directory given as --journal-path")
+    parser.add_argument("--start", type=parse_time, help="Replay frames from then")
+    parser.add_argument("--end", type=parse_time, help="Replay frames until then")
+    parser.add_argument("--account", type=str, help="Replay only this account")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        help="Replay at this multiple of the original pace (default: at once)",
+    )
+    parser.add_argument(
+        "--topic-mapping",
+        type=str,
+        help="JSON file mapping DMP events to MQTT topics (default: built-in topics)",
+    )
+    parser.add_argument(
+        "--mqtt-broker-host",
+        type=str,
+        help="Publish to this MQTT broker instead of printing the publishes",
+    )
+    parser.add_argument("--mqtt-username", type=str)
+    parser.add_argument("--mqtt-password", type=str)
+    add_logging_args(parser)
+    return parser.parse_args(argv)
+
+
+class _PrintingMQTTClient:
+    def publish(self, topic, payload, qos=0, retain=False) -> None:
+        print(f"{topic} {payload}" + (" (retained)" if retain else ""))
+
+
+async def replay(args: argparse.Namespace) -> None:
+    mapping = (
+        load_mapping(args.topic_mapping)
+        if args.topic_mapping
+        else DmpTopicMapping(DEFAULT_MAPPING)
+    )
+    listener = DmpJournalListener(
+        args.journal,
+        start=args.start,
+        end=args.end,
+        account_number=args.account,
+        speed=args.speed,
+        accept=mapping.accepts,
+    )
+    accounts = [args.account] if args.account else journal_accounts(args.journal)
+
+    if args.mqtt_broker_host:
+        mqtt_client = MQTTClient("dmp-mqtt-replay")
+        if args.mqtt_username:
+            mqtt_client.set_auth_credentials(args.mqtt_username, args.mqtt_password)
+        await mqtt_client.connect(args.mqtt_broker_host)
+    else:
+        mqtt_client = _PrintingMQTTClient()
+
+    started = time.monotonic()
+    await translate_dmp_to_mqtt(listener, mqtt_client, accounts, topic_mapping=mapping)
+    elapsed = time.monotonic() - started
+    logging.info(
+        f"Replayed {listener.frames} frames in {elapsed:.1f}s "
+        f"({listener.invalid_frames} invalid)"
+    )
+    if args.mqtt_broker_host:
+        await mqtt_client.disconnect()
+
+
+def parse_ingest_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m dmp ingest",
+        description="Decode raw DMP receiver captures into JSON Lines or CSV",
+    )
+    parser.add_argument("files", nargs="+", help="Raw receiver capture files")
+    parser.add_argument(
+        "--output", type=str, help="File to write the records to (default: stdout)"
+    )
+    parser.add_argument("--format", choices=INGEST_FORMATS, default="jsonl")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes decoding chunks in parallel (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--chunk-bytes",
+        type=int,
+        default=16 * 1024 * 1024,
+        help="Size of the chunks, split on frame boundaries, that files are decoded in",
+    )
+    add_logging_args(parser)
+    return parser.parse_args(argv)
+
+
+def configure_ingest_logging(level: str, sample_rate: float) -> None:
+    configure_logging(level, sample_rate)
+    if level != "DEBUG":
+        # Invalid frames and unknown subsections are counted in the summary
+        # instead.
+        FRAME_LOG.setLevel(logging.ERROR)
+
+
+def ingest(args: argparse.Namespace) -> None:
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        stats = ingest_files(
+            args.files,
+            output,
+            fmt=args.format,
+            workers=args.workers,
+            chunk_bytes=args.chunk_bytes,
+            initializer=functools.partial(
+                configure_ingest_logging, args.log_level, args.log_sample_rate
+            ),
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    seconds = max(stats.seconds, 1e-9)
+    logging.info(
+        f"Ingested {stats.files} files, {stats.bytes / 1e6:,.1f} MB, in "
+        f"{stats.seconds:.1f}s with {args.workers} workers: "
+        f"{stats.bytes / 1e6 / seconds:,.1f} MB/s, "
+        f"{stats.frames / seconds:,.0f} frames/s"
+    )
+    logging.info(
+        f"{stats.frames} frames, {stats.messages} messages, "
+        f"{stats.invalid_frames} invalid frames"
+    )
+    if stats.unknown_subsections:
+        logging.info(
+            "Unknown subsections: "
+            + ", ".join(
+                f"{code} x{count}"
+                for code, count in stats.unknown_subsections.most_common()
+            )
+        )
+
+
+def run_worker(worker: int, args: argparse.Namespace) -> None:
+    # The supervisor stops the workers on Ctrl-C.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_logging(args.log_level, args.log_sample_rate)
+    install_event_loop(args.event_loop)
+    asyncio.run(main(args, worker))
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    if sys.argv[1:2] == ["replay"]:
+        args = parse_replay_args(sys.argv[2:])
+        configure_logging(args.log_level, args.log_sample_rate)
+        asyncio.run(replay(args))
+        sys.exit()
+    if sys.argv[1:2] == ["ingest"]:
+        args = parse_ingest_args(sys.argv[2:])
+        configure_ingest_logging(args.log_level, args.log_sample_rate)
+        ingest(args)
+        sys.exit()
+
+    args = parse_args()
+    configure_logging(args.log_level, args.log_sample_rate)
+    if args.workers > 1:
+        if args.publish_cache:
+            logging.warning(
+                "The publish cache is off with --workers, so every retained "
+                "state is published"
+            )
+        run_workers(args.workers, run_worker, (args,))
+    else:
+        install_event_loop(args.event_loop)
+        asyncio.run(main(args))
@@ -1,215 +1,1174 @@
 #!/usr/bin/env python3
 import asyncio
+import collections
 import logging
-from typing import AsyncGenerator
+import socket
+import time
+from typing import (
+    AsyncGenerator,
+    Callable,
+    Collection,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
-from gmqtt import Client as MQTTClient
+from gmqtt import Client as MQTTClient, Subscription
 
-from dmp.dmp_message import (
-    DmpArmingStatusMessage,
-    DmpDeviceStatusMessage,
-    DmpLowBatteryMessage,
-    DmpMessage,
-    DmpZoneAlarmMessage,
-    parse_message as dmp_parse_message,
-)
+from dmp.dmp_command import DmpCommandResponse, parse_command_response
+from dmp.dmp_config import DmpAccountConfig
+from dmp.dmp_crc import CRC_MODES
+from dmp.dmp_decoder import DmpFrameDecoder
+from dmp.dmp_dedup import DmpFrameDeduplicator
+from dmp.dmp_journal import DmpFrameJournal
+from dmp.dmp_logging import FRAME_LOG, PUBLISH_LOG
+from dmp.dmp_mapping import DEFAULT_MAPPING, DmpTopicMapping
+from dmp.dmp_message import DmpFrameFilter, DmpMessage
+from dmp.dmp_metrics import DmpMetrics, serve_metrics
+from dmp.dmp_publish_cache import DmpPublishCache
+from dmp.dmp_queue import DmpMessageQueue
+from dmp.dmp_scheduler import PRIORITY_ARMING, DmpCommandScheduler
+from dmp.dmp_spool import DmpOutboundSpool, is_alarm_message
+from dmp.dmp_state import DmpStateStore
 from dmp.dmp_types import DmpEventType
-from dmp.exceptions import DmpInvalidMessageException
+from dmp.exceptions import (
+    DmpCommandException,
+    DmpCommandRejectedException,
+    DmpCommandTimeoutException,
+    DmpInvalidMessageException,
+    DmpSpoolFullException,
+)
 
 
 async def run_dmp_mqtt_bridge(
     listen_port: int,
-    dmp_server_host: str,
-    dmp_server_port: int,
-    dmp_account_number: str,
-    dmp_remote_key: str,
+    accounts: Sequence[DmpAccountConfig],
     mqtt_broker_host: str,
     mqtt_username: str,
     mqtt_password: str,
+    listener_mode: str = "stream",
+    dmp_idle_timeout: float = 30.0,
+    mqtt_client_id: str = "dmp-mqtt",
+    handle_commands: bool = True,
+    reuse_port: bool = False,
+    queue_size: int = 10000,
+    overload_policy: str = "delay",
+    spill_path: Optional[str] = None,
+    ack_mode: str = "received",
+    ack_deadline: float = 0.05,
+    publish_cache: bool = True,
+    publish_refresh_interval: Optional[float] = None,
+    seed_timeout: float = 1.0,
+    topic_mapping: Optional[DmpTopicMapping] = None,
+    metrics_port: Optional[int] = None,
+    spool_path: Optional[str] = None,
+    spool_max_bytes: int = 64 * 1024 * 1024,
+    journal_path: Optional[str] = None,
+    journal_segment_bytes: int = 64 * 1024 * 1024,
+    crc_mode: str = "log",
+    dedup_window: Optional[float] = None,
+    state_store: bool = False,
+    state: Optional[DmpStateStore] = None,
 ) -> None:
-    dmp_writer = DmpMessageWriter(
-        dmp_server_host=dmp_server_host,
-        dmp_server_port=dmp_server_port,
-        dmp_account_number=dmp_account_number,
-        dmp_remote_key=dmp_remote_key,
-    )
+    """
+    Bridges every panel in `accounts` through one listener and one MQTT
+    client. Incoming frames are routed by the account number in their header,
+    and commands on dmp/<account>/alarm/set go to that account's panel.
+
+    When several workers share the listen port (`reuse_port`), only the one
+    with `handle_commands` subscribes to commands, so each is sent once.
+
+    With `publish_cache`, retained states are only published when they
+    change, or every `publish_refresh_interval` seconds if given. The cache
+    starts from the states the broker retains, which it collects for up to
+    `seed_timeout` seconds after connecting.
+
+    Messages are published as `topic_mapping` says, by default following
+    `DEFAULT_MAPPING`.
+
+    With `metrics_port`, serves Prometheus metrics on that port.
+
+    With `spool_path`, publishes made while the broker is unreachable wait in
+    a `DmpOutboundSpool` of `spool_max_bytes` there, and are replayed in
+    order once it is back, including after a restart.
+
+    With `journal_path`, every raw frame received is kept in a
+    `DmpFrameJournal` in that directory, in segments of
+    `journal_segment_bytes`, for `python -m dmp replay`.
+
+    `crc_mode` says whether the CRC of each frame is checked, and what
+    happens to frames that fail, as for `DmpFrameDecoder`.
+
+    With `dedup_window`, a frame received again within that many seconds,
+    as panels do when they miss an ack, is acked but not published again.
+    Workers sharing the listen port each only see their own connections'
+    frames.
 
-    command_topic = f"dmp/{dmp_account_number}/alarm/set"
+    With `state_store`, the state of every zone, area and device is kept in
+    `state`, or a `DmpStateStore` of its own, and retained topics are all
+    published again whenever the MQTT client reconnects. The store needs the
+    body of every zone, area and device frame, including those the mapping
+    does not publish, which makes parsing them several times slower.
+    """
 
-    mqtt_client = MQTTClient("dmp-mqtt")
+    mapping = topic_mapping or DmpTopicMapping(DEFAULT_MAPPING)
+
+    writers: Dict[str, DmpMessageWriter] = {}
+    schedulers: Dict[str, DmpCommandScheduler] = {}
+    for account in accounts if handle_commands else ():
+        writer = DmpMessageWriter(
+            dmp_server_host=account.server_host,
+            dmp_server_port=account.server_port,
+            dmp_account_number=account.account_number,
+            dmp_remote_key=account.remote_key,
+            idle_timeout=dmp_idle_timeout,
+        )
+        writers[account.account_number] = writer
+        schedulers[account.account_number] = DmpCommandScheduler(writer.send)
+
+    cache = DmpPublishCache(publish_refresh_interval) if publish_cache else None
+
+    mqtt_client = MQTTClient(mqtt_client_id)
     mqtt_client.set_auth_credentials(mqtt_username, mqtt_password)
 
     async def on_mqtt_message_received(client, topic, payload, qos, properties) -> int:
-        assert topic == command_topic
-        if payload == b"ARM_HOME":
-            await dmp_writer.arm_home()
-        elif payload == b"ARM_AWAY":
-            await dmp_writer.arm_away()
+        if not topic.endswith("/set"):
+            # A retained state, while seeding the cache.
+            if cache is not None:
+                cache.seed(topic, payload.decode("utf-8"))
+            return 0
+
+        # dmp/<account>/alarm/set
+        scheduler = schedulers.get(topic.split("/")[1])
+        if not scheduler:
+            logging.warning(f"Command for unknown account: {topic}")
+            return 0
+
+        command = payload.decode("utf-8")
+        msgs = DmpMessageWriter.COMMANDS.get(command)
+        if msgs:
+            # ARM_HOME and ARM_AWAY supersede each other while queued.
+            scheduler.submit(command, msgs, group="arming", priority=PRIORITY_ARMING)
         else:
-            logging.warning(f"Unknown command payload: {payload.decode('utf-8')}")
+            logging.warning(f"Unknown command payload: {command}")
         return 0
 
     mqtt_client.on_message = on_mqtt_message_received
 
     logging.info(f"Connecting to MQTT server: {mqtt_broker_host}")
     await mqtt_client.connect(mqtt_broker_host)
-    mqtt_client.subscribe(command_topic)
+    if handle_commands:
+        mqtt_client.subscribe("dmp/+/alarm/set")
+    if cache is not None:
+        # The broker sends retained messages right after subscribing.
+        topic_filters = list(mapping.retained_topic_filters)
+        if topic_filters:
+            mqtt_client.subscribe([Subscription(f) for f in topic_filters])
+            await asyncio.sleep(seed_timeout)
+            mqtt_client.unsubscribe(topic_filters)
+        logging.info(f"Seeded publish cache with {len(cache)} retained states")
+
+    queue = DmpMessageQueue(
+        maxsize=queue_size, policy=overload_policy, spill_path=spill_path
+    )
+    spool = DmpOutboundSpool(spool_path, spool_max_bytes) if spool_path else None
+    journal = (
+        DmpFrameJournal(journal_path, journal_segment_bytes) if journal_path else None
+    )
+    dedup = DmpFrameDeduplicator(dedup_window) if dedup_window else None
+    if not state_store:
+        state = None
+    elif state is None:
+        state = DmpStateStore()
+    metrics = None
+    if metrics_port is not None:
+        metrics = DmpMetrics()
+        _add_bridge_collectors(metrics, queue, cache, schedulers, spool, dedup, state)
+        await serve_metrics(metrics, metrics_port)
+
+    # Skip the body of frames that would not be published or change a state.
+    accept: DmpFrameFilter = mapping.accepts
+    if state is not None:
+        accept = _accept_either(mapping.accepts, state.accepts)
 
     listener = DmpMessageListener(
         listen_port=listen_port,
-        dmp_server_host=dmp_server_host,
-        dmp_account_number=dmp_account_number,
+        dmp_server_host=accounts[0].server_host if len(accounts) == 1 else None,
+        dmp_account_number=accounts[0].account_number if len(accounts) == 1 else None,
+        mode=listener_mode,
+        accept=accept,
+        reuse_port=reuse_port,
+        queue=queue,
+        ack_mode=ack_mode,
+        ack_deadline=ack_deadline,
+        metrics=metrics,
+        journal=journal,
+        crc_mode=crc_mode,
+        dedup=dedup,
+    )
+    scheduler_tasks = [
+        asyncio.ensure_future(scheduler.run()) for scheduler in schedulers.values()
+    ]
+    try:
+        await translate_dmp_to_mqtt(
+            listener,
+            mqtt_client,
+            [account.account_number for account in accounts],
+            publish_cache=cache,
+            topic_mapping=mapping,
+            metrics=metrics,
+            spool=spool,
+            state=state,
+        )
+    finally:
+        for task in scheduler_tasks:
+            task.cancel()
+        await asyncio.gather(*(writer.close() for writer in writers.values()))
+        if spool is not None:
+            spool.close()
+        if journal is not None:
+            journal.close()
+
+
+def _accept_either(first: DmpFrameFilter, second: DmpFrameFilter) -> DmpFrameFilter:
+    def accept(event_key: str, event_type: DmpEventType) -> bool:
+        return first(event_key, event_type) or second(event_key, event_type)
+
+    return accept
+
+
+def _add_bridge_collectors(
+    metrics: DmpMetrics,
+    queue: DmpMessageQueue,
+    cache: Optional[DmpPublishCache],
+    schedulers: Dict[str, DmpCommandScheduler],
+    spool: Optional[DmpOutboundSpool] = None,
+    dedup: Optional[DmpFrameDeduplicator] = None,
+    state: Optional[DmpStateStore] = None,
+) -> None:
+    metrics.add_collector(
+        "gauge",
+        "Messages waiting in the listener queue",
+        lambda: [("dmp_queue_depth", {}, queue.qsize())],
+    )
+    metrics.add_collector(
+        "gauge",
+        "Most messages ever waiting in the listener queue",
+        lambda: [("dmp_queue_max_depth", {}, queue.max_depth)],
+    )
+    metrics.add_collector(
+        "counter",
+        "Times the listener queue became overloaded",
+        lambda: [("dmp_queue_overloaded_total", {}, queue.high_watermark_hits)],
+    )
+    metrics.add_collector(
+        "counter",
+        "Messages dropped by the listener queue",
+        lambda: [("dmp_queue_dropped_total", {}, queue.dropped)],
+    )
+    metrics.add_collector(
+        "counter",
+        "Messages spilled to disk by the listener queue",
+        lambda: [("dmp_queue_spilled_total", {}, queue.spilled)],
+    )
+    if cache is not None:
+        metrics.add_collector(
+            "counter",
+            "Retained publishes skipped for an unchanged payload",
+            lambda: [("dmp_mqtt_publishes_suppressed_total", {}, cache.suppressed)],
+        )
+
+    if spool is not None:
+        metrics.add_collector(
+            "gauge",
+            "Publishes waiting in the spool for the MQTT broker",
+            lambda: [("dmp_spool_depth", {}, len(spool))],
+        )
+        metrics.add_collector(
+            "gauge",
+            "Bytes of the spool in use",
+            lambda: [("dmp_spool_bytes", {}, spool.used_bytes)],
+        )
+        metrics.add_collector(
+            "counter",
+            "Publishes evicted from the full spool",
+            lambda: [("dmp_spool_evicted_total", {}, spool.evicted)],
+        )
+
+    if dedup is not None:
+        metrics.add_collector(
+            "counter",
+            "Retransmitted frames acked but not published again",
+            lambda: [("dmp_duplicate_frames_total", {}, dedup.duplicates)],
+        )
+        metrics.add_collector(
+            "gauge",
+            "Frames remembered to recognize retransmits",
+            lambda: [("dmp_dedup_entries", {}, len(dedup))],
+        )
+
+    if state is not None:
+        metrics.add_collector(
+            "gauge",
+            "Zones, areas and devices in the state store",
+            lambda: [("dmp_state_entities", {}, len(state))],
+        )
+        metrics.add_collector(
+            "counter",
+            "Times retained states were published again after reconnecting",
+            lambda: [("dmp_state_resyncs_total", {}, state.resyncs)],
+        )
+
+    def command_stats():
+        for account_number, scheduler in schedulers.items():
+            for command, stats in scheduler.stats.items():
+                labels = {"account": account_number, "command": command}
+                yield "dmp_command_latency_seconds_sum", labels, stats.total_latency
+                yield "dmp_command_latency_seconds_count", labels, stats.count
+
+    def command_failures():
+        for account_number, scheduler in schedulers.items():
+            for command, stats in scheduler.stats.items():
+                labels = {"account": account_number, "command": command}
+                yield "dmp_command_failures_total", labels, stats.failures
+
+    metrics.add_collector(
+        "summary",
+        "Time from receiving a command to the panel accepting it",
+        command_stats,
+    )
+    metrics.add_collector("counter", "Commands the panel failed", command_failures)
+    metrics.add_collector(
+        "gauge",
+        "Commands waiting to be sent to the panel",
+        lambda: [
+            ("dmp_command_queue_depth", {"account": account}, scheduler.queue_depth)
+            for account, scheduler in schedulers.items()
+        ],
     )
-    await translate_dmp_to_mqtt(listener, mqtt_client, dmp_account_number)
 
 
 async def translate_dmp_to_mqtt(
     listener: "DmpMessageListener",
     mqtt_client: MQTTClient,
-    dmp_account_number: str,
+    dmp_account_numbers: Collection[str],
+    publish_cache: Optional[DmpPublishCache] = None,
+    topic_mapping: Optional[DmpTopicMapping] = None,
+    metrics: Optional[DmpMetrics] = None,
+    spool: Optional[DmpOutboundSpool] = None,
+    state: Optional[DmpStateStore] = None,
 ) -> None:
-    def publish(topic: str, payload: str, **kwargs) -> None:
-        logging.debug(f"Publishing to MQTT: {topic} --> {payload}")
-        mqtt_client.publish(topic, payload, **kwargs)
-
-    async for message in listener.listen():
-        if isinstance(message, DmpZoneAlarmMessage):
-            publish(
-                f"dmp/{dmp_account_number}/alarm",
-                "triggered",
-                retain=True,
-            )
-        elif isinstance(message, DmpLowBatteryMessage):
-            publish(
-                f"dmp/{dmp_account_number}/low_battery",
-                message.zone.name or message.zone.number,
-            )
-        elif isinstance(message, DmpArmingStatusMessage):
-            if message.event_type == DmpEventType.AREA_DISARMED:
-                status = "disarmed"
-            elif message.event_type == DmpEventType.AREA_ARMED:
-                status = "armed_home" if message.area.number == "001" else "armed_away"
-            else:
-                logging.warning(f"Unknown arming status message: {message}")
+    """
+    Publishes every message from `listener` for one of `dmp_account_numbers`
+    as `topic_mapping` says.
+
+    With a `spool`, publishes are spooled instead while the MQTT client is
+    not connected, and after that until the spool has been replayed.
+
+    With a `state` store, every message updates it, and each time the MQTT
+    client connects again every retained topic is published again from it.
+    """
+
+    publication = (topic_mapping or DmpTopicMapping(DEFAULT_MAPPING)).publication
+    dmp_account_numbers = frozenset(dmp_account_numbers)
+    spooled = asyncio.Event()
+    replay = None
+    if spool is not None:
+        replay = asyncio.ensure_future(_replay_spool(spool, mqtt_client, spooled))
+    resync = None
+    if state is not None:
+        resync = asyncio.ensure_future(_resync_state(state, mqtt_client, spool))
+
+    try:
+        async for message in listener.listen():
+            if message.account_number not in dmp_account_numbers:
+                PUBLISH_LOG.warning("Message for unknown account: %s", message)
                 continue
-            publish(
-                f"dmp/{dmp_account_number}/alarm",
-                status,
-                retain=True,
-            )
-        elif isinstance(message, DmpDeviceStatusMessage):
-            on_events = {
-                DmpEventType.DOOR_STATUS_OPEN,
-                DmpEventType.DOOR_STATUS_HELD_OPEN,
-                DmpEventType.DOOR_STATUS_FORCED_OPEN,
-                DmpEventType.OUTPUT_STATUS_ON,
-                DmpEventType.OUTPUT_STATUS_PULSE,
-                DmpEventType.OUTPUT_STATUS_TEMPORAL,
-            }
-            zone = message.zone
-            if zone:
-                publish(
-                    f"dmp/{dmp_account_number}/status/{zone.number}",
-                    "on" if message.event_type in on_events else "off",
-                    retain=True,
+            if metrics is not None:
+                metrics.messages.inc(type(message), message.event_type)
+            if state is not None:
+                state.update(message)
+
+            published = publication(message)
+            if published is None:
+                PUBLISH_LOG.debug("No topic for message: %s", message)
+                continue
+
+            topic, payload, qos, retain = published
+            if retain and state is not None:
+                state.retained(published)
+            if (
+                retain
+                and publish_cache is not None
+                and not publish_cache.should_publish(topic, payload)
+            ):
+                PUBLISH_LOG.debug(
+                    "Unchanged, not publishing: %s --> %s", topic, payload
+                )
+                continue
+            if metrics is not None:
+                metrics.mqtt_publishes.inc(retain)
+            if spool is not None and (spool or not mqtt_client.is_connected):
+                PUBLISH_LOG.debug("Spooling: %s --> %s", topic, payload)
+                try:
+                    spool.append(published, keep=is_alarm_message(message))
+                    spooled.set()
+                    continue
+                except DmpSpoolFullException as e:
+                    logging.error(f"Publishing without the spool: {e}")
+            PUBLISH_LOG.debug("Publishing to MQTT: %s --> %s", topic, payload)
+            mqtt_client.publish(topic, payload, qos=qos, retain=retain)
+    finally:
+        if resync is not None:
+            resync.cancel()
+        if replay is not None:
+            replay.cancel()
+            spool.sync()
+
+
+async def _replay_spool(
+    spool: DmpOutboundSpool, mqtt_client: MQTTClient, spooled: asyncio.Event
+) -> None:
+    """
+    Publishes what is in `spool`, oldest first, whenever the MQTT client is
+    connected, checking at least every `spool.sync_interval` seconds, which
+    is also how often the spool is synced while idle.
+    """
+
+    while True:
+        try:
+            await asyncio.wait_for(spooled.wait(), spool.sync_interval)
+        except asyncio.TimeoutError:
+            spool.sync()
+        spooled.clear()
+
+        replayed = 0
+        while spool and mqtt_client.is_connected:
+            topic, payload, qos, retain = spool.peek()
+            mqtt_client.publish(topic, payload, qos=qos, retain=retain)
+            spool.pop()
+            replayed += 1
+            # Let the listener and the MQTT client run between batches.
+            if replayed % 100 == 0:
+                await asyncio.sleep(0)
+        if replayed:
+            logging.info(f"Replayed {replayed} spooled publishes")
+
+
+# How often in seconds to check whether the MQTT client has connected again.
+_RESYNC_POLL_INTERVAL = 0.1
+
+
+async def _resync_state(
+    state: DmpStateStore,
+    mqtt_client: MQTTClient,
+    spool: Optional[DmpOutboundSpool],
+) -> None:
+    """
+    Publishes `state.snapshot()` in one burst each time the MQTT client has
+    connected again, but only once `spool` has been replayed, so that older
+    publishes do not overwrite it.
+    """
+
+    synced = mqtt_client.is_connected
+    while True:
+        await asyncio.sleep(_RESYNC_POLL_INTERVAL)
+        if not mqtt_client.is_connected:
+            synced = False
+            continue
+        if synced or spool:
+            continue
+
+        publications = state.snapshot()
+        for topic, payload, qos, retain in publications:
+            mqtt_client.publish(topic, payload, qos=qos, retain=retain)
+        state.resyncs += 1
+        synced = True
+        logging.info(f"Republished {len(publications)} retained states")
+
+
+LISTENER_MODES = ("stream", "protocol")
+ACK_MODES = ("received", "delivered")
+
+
+class _DmpAckBatch:
+    """
+    Acks owed to one panel connection, sent together in as few writes as
+    possible. `flush` is called once a read buffer has been processed; acks
+    that only become ready later, as their messages are delivered, are
+    flushed once the listener queue is empty or `deadline` seconds after the
+    first of them, whichever comes first.
+    """
+
+    def __init__(
+        self, write: Callable[[bytes], None], queue: DmpMessageQueue, deadline: float
+    ) -> None:
+        self._write = write
+        self._queue = queue
+        self._deadline = deadline
+        self._acks: List[bytes] = []
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._closed = False
+
+    def add(self, ack: bytes) -> None:
+        self._acks.append(ack)
+
+    def on_delivery(self, ack: bytes) -> Callable[[], None]:
+        """Returns a callback that adds `ack` once its message is delivered."""
+
+        def delivered() -> None:
+            self._acks.append(ack)
+            if not self._queue.qsize():
+                self.flush()
+            elif self._handle is None:
+                self._handle = asyncio.get_running_loop().call_later(
+                    self._deadline, self.flush
                 )
 
+        return delivered
+
+    def flush(self) -> None:
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        if self._acks and not self._closed:
+            self._write(b"".join(self._acks))
+        self._acks.clear()
+
+    def close(self) -> None:
+        # Acks still owed are never sent, so the panel sends those events again.
+        self._closed = True
+        self.flush()
+
 
 class DmpMessageListener:
+    """
+    Accepts connections from panels, acks every frame and yields the parsed
+    messages from `listen()`.
+
+    Each frame is acked with the account number from its own header, so one
+    listener serves any number of accounts; `dmp_account_number`, if given,
+    is only used for frames too malformed to carry one.
+
+    In "stream" mode each connection is served by a coroutine reading from a
+    StreamReader. "protocol" mode skips the stream layer and decodes frames
+    directly from `asyncio.Protocol.data_received`, which costs less per frame
+    when many panels or receivers share the port.
+
+    Frames rejected by `accept` are acked but never have their body parsed.
+
+    Parsed messages wait for `listen()` in a bounded `DmpMessageQueue`; under
+    its "delay" overload policy a frame is not acked until its message has
+    been queued.
+
+    Acks for all the frames in one read are sent in a single write. With
+    `ack_mode` "delivered", a message's frame is instead acked only once the
+    consumer of `listen()` has finished with it and asks for the next one,
+    so a message lost before then is sent again by the panel. Those acks are
+    batched too, but never held back more than `ack_deadline` seconds.
+
+    With `metrics`, counts frames per panel and times each message from the
+    read of its frame until the consumer of `listen()` is done with it.
+
+    With `reuse_port`, the port is bound with SO_REUSEPORT so that several
+    worker processes can each run a listener on it and the kernel spreads
+    incoming connections between them.
+
+    With `journal`, every raw frame is journaled with the panel it came from,
+    and the journal is flushed every `journal.flush_interval` seconds.
+
+    Frames are checked against their CRC as `crc_mode` says; see
+    `DmpFrameDecoder`. Frames it rejects are acked like other invalid frames,
+    so that a panel does not resend them forever.
+
+    With `dedup`, which all connections share, retransmitted frames are acked
+    and counted but not parsed or queued again. With `ack_mode` "delivered",
+    a retransmit of a frame whose message is still on its way is only acked
+    once that message is delivered.
+    """
+
     def __init__(
         self,
         listen_port: int,
-        dmp_server_host: str,
-        dmp_account_number: str,
+        dmp_server_host: Optional[str],
+        dmp_account_number: Optional[str],
+        mode: str = "stream",
+        accept: Optional[DmpFrameFilter] = None,
+        reuse_port: bool = False,
+        queue: Optional[DmpMessageQueue] = None,
+        ack_mode: str = "received",
+        ack_deadline: float = 0.05,
+        metrics: Optional[DmpMetrics] = None,
+        journal: Optional[DmpFrameJournal] = None,
+        crc_mode: str = "skip",
+        dedup: Optional[DmpFrameDeduplicator] = None,
     ) -> None:
+        if mode not in LISTENER_MODES:
+            raise ValueError(f"Unknown listener mode: {mode}")
+        if ack_mode not in ACK_MODES:
+            raise ValueError(f"Unknown ack mode: {ack_mode}")
+        if crc_mode not in CRC_MODES:
+            raise ValueError(f"Unknown CRC mode: {crc_mode}")
+
         self._listen_port = listen_port
         self._dmp_server_host = dmp_server_host
         self._dmp_account_number = dmp_account_number
-        self._queue: asyncio.Queue[DmpMessage] = asyncio.Queue()
+        self._mode = mode
+        self._accept = accept
+        self._reuse_port = reuse_port
+        self._queue = queue or DmpMessageQueue()
+        self._ack_delivered = ack_mode == "delivered"
+        self._ack_deadline = ack_deadline
+        self._metrics = metrics
+        self._journal = journal
+        self._crc_mode = crc_mode
+        self._dedup = dedup
+        self._acks: Dict[Optional[bytes], bytes] = {}
+
+    @property
+    def queue(self) -> DmpMessageQueue:
+        return self._queue
 
     async def listen(self) -> AsyncGenerator[DmpMessage, None]:
-        logging.info(f"Starting server on port {self._listen_port}")
-        await asyncio.start_server(self._on_connect, "0.0.0.0", self._listen_port)
+        logging.info(f"Starting {self._mode} server on port {self._listen_port}")
+        if self._mode == "protocol":
+            await asyncio.get_running_loop().create_server(
+                lambda: _DmpListenerProtocol(self),
+                "0.0.0.0",
+                self._listen_port,
+                reuse_port=self._reuse_port,
+            )
+        else:
+            await asyncio.start_server(
+                self._on_connect,
+                "0.0.0.0",
+                self._listen_port,
+                reuse_port=self._reuse_port,
+            )
         logging.info(f"Listening for incoming DMP message on port {self._listen_port}")
 
-        while True:
-            yield (await self._queue.get())
+        flusher = None
+        if self._journal is not None:
+            flusher = asyncio.ensure_future(_flush_journal(self._journal))
+        try:
+            while True:
+                yield (await self._queue.get())
+                self._queue.task_done()
+        finally:
+            if flusher is not None:
+                flusher.cancel()
+
+    def _decoder(self, peer) -> DmpFrameDecoder:
+        on_frame = None
+        if self._journal is not None:
+            journal = self._journal
+            source = f"{peer[0]}:{peer[1]}" if peer else ""
+
+            def on_frame(frame: bytes) -> None:
+                journal.append(frame, source)
+
+        return DmpFrameDecoder(
+            accept=self._accept,
+            on_frame=on_frame,
+            crc_mode=self._crc_mode,
+            dedup=self._dedup,
+        )
+
+    def _ack_batch(self, write: Callable[[bytes], None]) -> _DmpAckBatch:
+        return _DmpAckBatch(write, self._queue, self._ack_deadline)
+
+    def _on_done(
+        self,
+        acks: _DmpAckBatch,
+        ack: bytes,
+        received: float,
+        frame: Optional[bytes] = None,
+    ) -> Optional[Callable[[], None]]:
+        """The callback for the queue to call once a message is finished with."""
+        done = acks.on_delivery(ack) if self._ack_delivered else None
+        if done is not None and self._dedup is not None and frame is not None:
+            done = self._dedup.pending(frame, done)
+        if self._metrics is None:
+            return done
+
+        histogram = self._metrics.frame_to_publish_seconds
+
+        def finished() -> None:
+            histogram.observe(time.monotonic() - received)
+            if done:
+                done()
+
+        return finished
+
+    def _hold_duplicate_ack(
+        self, decoder: DmpFrameDecoder, acks: _DmpAckBatch, ack: bytes
+    ) -> bool:
+        """
+        In "delivered" ack mode, has the ack of the retransmitted frame just
+        decoded wait for the delivery of its first copy, if that is still on
+        its way, and returns whether it does.
+        """
+        if not (self._ack_delivered and decoder.duplicate):
+            return False
+        return self._dedup.after_delivery(decoder.frame, acks.on_delivery(ack))
+
+    def _count_frames(
+        self,
+        peer,
+        decoder: DmpFrameDecoder,
+        frames: int,
+        invalid: int,
+        crc_failures: int,
+        seconds: float,
+    ) -> None:
+        metrics = self._metrics
+        host = peer[0] if peer else "unknown"
+        metrics.frames_received.inc(host, amount=decoder.frames - frames)
+        if decoder.invalid_frames != invalid:
+            metrics.invalid_frames.inc(host, amount=decoder.invalid_frames - invalid)
+        if decoder.crc_failures != crc_failures:
+            metrics.crc_failures.inc(host, amount=decoder.crc_failures - crc_failures)
+        metrics.parse_seconds.inc(amount=seconds)
 
     async def _on_connect(self, reader, writer) -> None:
         peer = writer.get_extra_info("peername")
         logging.debug(f"Connection from {peer} on {self._listen_port}")
 
-        while True:
-            try:
-                data = (await reader.readuntil(b"\r")).decode("utf-8")
+        queue = self._queue
+        decoder = self._decoder(peer)
+        acks = self._ack_batch(writer.write)
+        try:
+            while True:
+                data = await reader.read(64 * 1024)
                 if not data:
+                    logging.debug(f"{peer} disconnected")
                     return
-            except asyncio.IncompleteReadError:
-                logging.debug(f"{peer} disconnected")
-                return
 
-            logging.debug(f"Received raw message from DMP: {repr(data)}")
+                FRAME_LOG.debug("Received raw data from DMP: %r", data)
+                received = time.monotonic() if self._metrics else 0.0
+                frames, invalid = decoder.frames, decoder.invalid_frames
+                crc_failures, waited = decoder.crc_failures, 0.0
+                for message in decoder.feed(data):
+                    ack = self._ack(decoder.account_number)
+                    if not message:
+                        if not self._hold_duplicate_ack(decoder, acks, ack):
+                            acks.add(ack)
+                        continue
+
+                    FRAME_LOG.debug("Parsed DMP message: %s", message)
+                    done = self._on_done(acks, ack, received, decoder.frame)
+                    if not queue.offer(message, done):
+                        # Time spent waiting for the queue is not parsing time.
+                        started = time.monotonic()
+                        await queue.put(message, done)
+                        waited += time.monotonic() - started
+                    if not self._ack_delivered:
+                        acks.add(ack)
+
+                if self._metrics:
+                    seconds = time.monotonic() - received - waited
+                    self._count_frames(
+                        peer, decoder, frames, invalid, crc_failures, seconds
+                    )
+                acks.flush()
+                await writer.drain()
+        finally:
+            acks.close()
+
+    def _ack(self, account_number: Optional[bytes]) -> bytes:
+        ack = self._acks.get(account_number)
+        if ack is None:
+            if account_number is None:
+                if self._dmp_account_number is None:
+                    return b""
+                account_number = self._dmp_account_number.rjust(5).encode()
+            ack = self._acks[account_number] = b"\x02" + account_number + b"\x06\x0D"
+        return ack
+
+
+class _DmpListenerProtocol(asyncio.Protocol):
+    def __init__(self, listener: DmpMessageListener) -> None:
+        self._listener = listener
+        self._decoder: Optional[DmpFrameDecoder] = None
+        self._transport: Optional[asyncio.Transport] = None
+        self._acks: Optional[_DmpAckBatch] = None
+        self._peer = None
+        # Frames, with their acks and the callbacks for when their messages are
+        # finished with, that the queue refused for now.
+        self._held: Deque[
+            Tuple[Optional[DmpMessage], bytes, Optional[Callable[[], None]]]
+        ] = collections.deque()
+        self._release_task: Optional[asyncio.Future] = None
+        self._write_paused = False
+
+    def connection_made(self, transport) -> None:
+        self._transport = transport
+        self._acks = self._listener._ack_batch(transport.write)
+        self._peer = transport.get_extra_info("peername")
+        self._decoder = self._listener._decoder(self._peer)
+        logging.debug(f"Connection from {self._peer} on {self._listener._listen_port}")
+
+    def connection_lost(self, exc) -> None:
+        logging.debug(f"{self._peer} disconnected")
+        self._transport = None
+        self._acks.close()
+        if self._release_task:
+            self._release_task.cancel()
+        # Held messages are still queued: the deduplicator already knows their
+        # frames, so the panel's retransmits would not be queued in their place.
+        messages = [(message, done) for message, _, done in self._held if message]
+        self._held.clear()
+        if messages:
+            asyncio.ensure_future(self._put_held(messages))
+
+    def data_received(self, data: bytes) -> None:
+        FRAME_LOG.debug("Received raw data from DMP: %r", data)
+        listener = self._listener
+        decoder = self._decoder
+        held = self._held
+        received = time.monotonic() if listener._metrics else 0.0
+        frames, invalid = decoder.frames, decoder.invalid_frames
+        crc_failures = decoder.crc_failures
+        for message in decoder.feed(data):
+            ack = listener._ack(decoder.account_number)
+            done = None
+            if message:
+                FRAME_LOG.debug("Parsed DMP message: %s", message)
+                done = listener._on_done(self._acks, ack, received, decoder.frame)
+            elif listener._hold_duplicate_ack(decoder, self._acks, ack):
+                continue
+            if held or not self._offer(message, ack, done):
+                held.append((message, ack, done))
+
+        if listener._metrics:
+            seconds = time.monotonic() - received
+            listener._count_frames(
+                self._peer, decoder, frames, invalid, crc_failures, seconds
+            )
+        # One write for every frame completed by this chunk.
+        self._acks.flush()
+
+        if held and not self._release_task:
+            self._release_task = asyncio.ensure_future(self._release_held())
+            self._update_reading()
+
+    def _offer(
+        self,
+        message: Optional[DmpMessage],
+        ack: bytes,
+        done: Optional[Callable[[], None]],
+    ) -> bool:
+        """Queues `message`, if any, and arranges for its frame to be acked."""
+        listener = self._listener
+        if message:
+            if not listener._queue.offer(message, done):
+                return False
+            if listener._ack_delivered:
+                return True
+        self._acks.add(ack)
+        return True
+
+    async def _release_held(self) -> None:
+        """Queues and acks held frames as the queue makes room for them."""
+        queue = self._listener._queue
+        held = self._held
+        while held:
+            await queue.wait_writable()
+            while held and self._offer(*held[0]):
+                held.popleft()
+            self._acks.flush()
+
+        self._release_task = None
+        self._update_reading()
+
+    async def _put_held(
+        self, messages: List[Tuple[DmpMessage, Optional[Callable[[], None]]]]
+    ) -> None:
+        """Queues the messages of a closed connection's held frames, unacked."""
+        queue = self._listener._queue
+        for message, done in messages:
+            await queue.put(message, done)
+
+    # Stop reading from a panel that is not taking its acks rather than
+    # buffering them without limit.
+    def pause_writing(self) -> None:
+        self._write_paused = True
+        self._update_reading()
+
+    def resume_writing(self) -> None:
+        self._write_paused = False
+        self._update_reading()
+
+    def _update_reading(self) -> None:
+        if not self._transport:
+            return
+        if self._write_paused or self._held:
+            self._transport.pause_reading()
+        else:
+            self._transport.resume_reading()
+
+
+async def _flush_journal(journal: DmpFrameJournal) -> None:
+    """Flushes `journal` even when no frame comes along to flush it."""
+    while True:
+        await asyncio.sleep(journal.flush_interval)
+        journal.flush()
+
+
+class _DmpPanelSession:
+    """An open remote link to the panel's command port."""
+
+    def __init__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._reader = reader
+        self._writer = writer
+        self._responses: asyncio.Queue[Optional[DmpCommandResponse]] = asyncio.Queue()
+        self._reader_task = asyncio.ensure_future(self._read_responses())
+
+        # Notice a panel that went away without closing the connection.
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    @property
+    def closed(self) -> bool:
+        return self._writer.is_closing() or self._reader_task.done()
+
+    async def request(self, data: str, timeout: float) -> DmpCommandResponse:
+        """Sends `data` and waits up to `timeout` seconds for the panel's reply."""
+
+        # Replies nobody waited for must not be taken for this one.
+        while not self._responses.empty():
+            stale = self._responses.get_nowait()
+            if stale is None:
+                raise ConnectionResetError("Panel closed the command connection")
+            logging.debug(f"Discarding unexpected response: {stale}")
+
+        self._writer.write(data.encode())
+        await self._writer.drain()
+
+        # After the "@" and the account number. A reply to an earlier request
+        # that timed out can still arrive, and must not be taken for this one.
+        command = data[6:]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
             try:
-                message = dmp_parse_message(data.rstrip())
-                if message:
-                    logging.debug(f"Parsed DMP message: {message}")
-                    await self._queue.put(message)
-            except DmpInvalidMessageException:
-                logging.warning(f"Invalid DMP message: {message}")
+                resp = await asyncio.wait_for(
+                    self._responses.get(), deadline - loop.time()
+                )
+            except asyncio.TimeoutError:
+                raise DmpCommandTimeoutException(f"No response in {timeout}s")
+            if resp is None:
+                raise ConnectionResetError("Panel closed the command connection")
+            if resp.answers(command):
+                return resp
+            logging.debug(f"Discarding response to another command: {resp}")
 
-            writer.write(f"\x02{self._dmp_account_number.rjust(5)}\x06\x0D".encode())
-            await writer.drain()
+    async def close(self) -> None:
+        self._reader_task.cancel()
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except OSError:
+            pass
+
+    async def _read_responses(self) -> None:
+        try:
+            while True:
+                try:
+                    line = (await self._reader.readuntil(b"\r")).decode(
+                        "utf-8", "ignore"
+                    )
+                except asyncio.IncompleteReadError:
+                    logging.debug("Panel closed the command connection")
+                    return
+
+                logging.debug(f"Received response to command: {repr(line)}")
+                try:
+                    self._responses.put_nowait(parse_command_response(line.rstrip()))
+                except DmpInvalidMessageException:
+                    logging.warning(f"Invalid response to command: {repr(line)}")
+        finally:
+            self._responses.put_nowait(None)
 
 
 class DmpMessageWriter:
+    """
+    Sends commands to the panel over a single authenticated remote link that
+    is kept open between commands and closed after `idle_timeout` seconds
+    without one. If the panel has dropped the link, the next command
+    reconnects and authenticates again before it is sent.
+
+    Every step waits for the panel's reply rather than a fixed delay: up to
+    `command_timeout` seconds for the connection, the remote key and each
+    command, and up to `hangup_timeout` seconds for the !V0 that clears any
+    previous link, which the panel need not answer. A missing or negative
+    reply raises a `DmpCommandException` and closes the link. Replies to
+    another command, such as a !V0 answered late, are discarded.
+
+    Only one link is ever open, since the panel has few remote link slots.
+    """
+
+    # Panel messages sent for each command accepted on the MQTT command topic.
+    COMMANDS = {
+        "ARM_HOME": ("!C01,YN",),
+        "ARM_AWAY": ("!C01,YN", "!C02,YN"),
+    }
+
     def __init__(
         self,
         dmp_server_host: str,
         dmp_server_port: int,
         dmp_account_number: str,
         dmp_remote_key: str,
+        idle_timeout: float = 30.0,
+        command_timeout: float = 5.0,
+        hangup_timeout: float = 2.0,
     ) -> None:
         self._dmp_server_host = dmp_server_host
         self._dmp_server_port = dmp_server_port
         self._dmp_account_number = dmp_account_number
         self._dmp_remote_key = dmp_remote_key
+        self._idle_timeout = idle_timeout
+        self._command_timeout = command_timeout
+        self._hangup_timeout = hangup_timeout
+        self._account_number_padded = dmp_account_number.rjust(5)
+        self._session: Optional[_DmpPanelSession] = None
+        self._idle_handle: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
 
-    async def arm_away(self) -> None:
+    async def arm_away(self) -> List[DmpCommandResponse]:
         logging.info("Arming alarm in 'away' mode")
-        await self._send("!C01,YN")
-        await self._send("!C02,YN")
+        return await self.send(*self.COMMANDS["ARM_AWAY"])
 
-    async def arm_home(self) -> None:
+    async def arm_home(self) -> List[DmpCommandResponse]:
         logging.info("Arming alarm in 'home' mode")
-        await self._send("!C01,YN")
+        return await self.send(*self.COMMANDS["ARM_HOME"])
 
-    async def _send(self, msg: str) -> bytes:
-        reader, writer = await asyncio.open_connection(
-            self._dmp_server_host, self._dmp_server_port
-        )
+    async def close(self) -> None:
+        async with self._lock:
+            await self._disconnect()
+
+    async def _close_idle(self, handle: asyncio.TimerHandle) -> None:
+        async with self._lock:
+            # A command that got the lock first replaced the idle timer.
+            if handle is not self._idle_handle:
+                return
+            await self._disconnect()
+
+    async def send(
+        self, *msgs: str, responses: Optional[List[DmpCommandResponse]] = None
+    ) -> List[DmpCommandResponse]:
+        """
+        Sends `msgs` in order over one session, returning the panel's replies.
+        With `responses`, an empty list, each reply is also appended to it as
+        it arrives, so that a caller can tell how far a failed call got.
 
-        account_number_padded = self._dmp_account_number.rjust(5)
+        A dropped link is reconnected once, and only the messages not yet
+        answered are sent again.
+        """
+        results = [] if responses is None else responses
+        async with self._lock:
+            if self._idle_handle:
+                self._idle_handle.cancel()
+                self._idle_handle = None
 
-        writer.write(f"@{account_number_padded}!V0\r".encode())
-        await writer.drain()
-        await asyncio.sleep(2)
+            for attempt in range(2):
+                try:
+                    session = await self._connect()
+                    for msg in msgs[len(results) :]:
+                        results.append(
+                            await self._request(session, msg, self._command_timeout)
+                        )
+                    break
+                except OSError as e:
+                    logging.warning(f"Lost connection to panel: {e}")
+                    await self._drop_session()
+                    if attempt:
+                        raise
+                except DmpCommandException:
+                    await self._drop_session()
+                    raise
 
-        writer.write(
-            f"@{account_number_padded}!V2{self._dmp_remote_key.ljust(16)}\r".encode()
+            handle = asyncio.get_running_loop().call_later(
+                self._idle_timeout,
+                lambda: asyncio.ensure_future(self._close_idle(handle)),
+            )
+            self._idle_handle = handle
+            return results
+
+    async def _request(
+        self, session: _DmpPanelSession, msg: str, timeout: float
+    ) -> DmpCommandResponse:
+        try:
+            resp = await session.request(
+                f"@{self._account_number_padded}{msg}\r", timeout
+            )
+        except DmpCommandTimeoutException:
+            # Not the full message, which may hold the remote key.
+            raise DmpCommandTimeoutException(
+                f"No response to {msg[:3]} in {timeout}s"
+            ) from None
+        if not resp.accepted:
+            raise DmpCommandRejectedException(f"Panel rejected {msg[:3]}: {resp}")
+        logging.debug(f"Panel accepted {msg[:3]}: {resp}")
+        return resp
+
+    async def _connect(self) -> _DmpPanelSession:
+        if self._session and not self._session.closed:
+            return self._session
+        await self._drop_session()
+
+        logging.debug(f"Opening remote link to {self._dmp_server_host}")
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self._dmp_server_host, self._dmp_server_port),
+                self._command_timeout,
+            )
+        except asyncio.TimeoutError:
+            raise DmpCommandTimeoutException(
+                f"No connection to {self._dmp_server_host} "
+                f"in {self._command_timeout}s"
+            ) from None
+        session = _DmpPanelSession(reader, writer)
+        self._session = session
+
+        try:
+            await session.request(
+                f"@{self._account_number_padded}!V0\r", self._hangup_timeout
+            )
+        except DmpCommandTimeoutException:
+            pass
+        await self._request(
+            session, f"!V2{self._dmp_remote_key.ljust(16)}", self._command_timeout
         )
-        await writer.drain()
-        await asyncio.sleep(0.2)
+        return session
 
-        writer.write(f"@{account_number_padded}{msg}\r".encode())
-        await writer.drain()
-        await asyncio.sleep(0.2)
+    async def _disconnect(self) -> None:
+        if self._idle_handle:
+            self._idle_handle.cancel()
+            self._idle_handle = None
 
-        writer.write("@{account_number_padded}!V0\r".encode())
-        await writer.drain()
+        session = self._session
+        if not session:
+            return
 
-        writer.close()
-        await writer.wait_closed()
+        if not session.closed:
+            logging.debug(f"Closing remote link to {self._dmp_server_host}")
+            try:
+                await session.request(
+                    f"@{self._account_number_padded}!V0\r", self._hangup_timeout
+                )
+            except (OSError, DmpCommandTimeoutException):
+                pass
+        await self._drop_session()
 
-        resp = await reader.read(256)
-        logging.debug(f"Received response to command: {resp.decode('utf-8', 'ignore')}")
-        return resp
+    async def _drop_session(self) -> None:
+        session, self._session = self._session, None
+        if session:
+            await session.close()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import array
+import collections
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dmp.dmp_message import DmpLazyMessage, message_event_key
+from dmp.dmp_types import DmpEventType
+
+
+# Event types are stored as their index in this list.
+EVENT_TYPES: List[DmpEventType] = list(DmpEventType)
+_EVENT_TYPE_CODES = {event_type: code for code, event_type in enumerate(EVENT_TYPES)}
+
+# Column names and their array typecodes, which NumPy takes as dtypes too.
+# Zone, area and device numbers are -1 for messages without one, and names
+# are codes into `DmpEventColumns.names`, where 0 is no name.
+COLUMNS: Tuple[Tuple[str, str], ...] = (
+    ("account", "I"),
+    ("event_key", "B"),
+    ("event_type", "H"),
+    ("zone", "i"),
+    ("area", "i"),
+    ("device", "i"),
+    ("minutes_ago", "I"),
+    ("occurred", "d"),
+    ("zone_name", "I"),
+    ("area_name", "I"),
+    ("device_name", "I"),
+)
+_NAME_COLUMNS = ("zone_name", "area_name", "device_name")
+
+
+def _number(section) -> int:
+    if section is None or not section.number:
+        return -1
+    try:
+        return int(section.number)
+    except ValueError:
+        # Spaces between the digits.
+        return -1
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class DmpEventColumns:
+    """
+    Parsed messages stored column by column in typed arrays, for aggregating
+    millions of events without a Python object per event.
+
+    Build one with `append` for each message, or with `event_columns`. Each
+    column is an `array.array` attribute named as in `COLUMNS`; with NumPy
+    installed, `column` copies one into a NumPy array and `to_numpy` copies
+    them all into a structured array. Aggregates read the columns in place.
+
+    `counts` and `bucket_counts` aggregate with NumPy if it is installed,
+    and otherwise with `collections.Counter`, which still counts in C.
+    """
+
+    def __init__(self) -> None:
+        for name, typecode in COLUMNS:
+            setattr(self, name, array.array(typecode))
+        # The names that the name columns hold codes of.
+        self.names: List[str] = [""]
+        self._name_codes: Dict[str, int] = {"": 0}
+
+    def __len__(self) -> int:
+        return len(self.account)
+
+    def _name_code(self, name: Optional[str]) -> int:
+        if not name:
+            return 0
+        code = self._name_codes.get(name)
+        if code is None:
+            code = self._name_codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def append(self, message, received: Optional[float] = None) -> None:
+        """Adds `message`, received at `received` (by default, now)."""
+        cls = (
+            message.message_class if type(message) is DmpLazyMessage else type(message)
+        )
+        zone = getattr(message, "zone", None)
+        area = getattr(message, "area", None)
+        device = getattr(message, "device", None)
+
+        self.account.append(int(message.account_number))
+        self.event_key.append(ord(message_event_key(cls)))
+        self.event_type.append(_EVENT_TYPE_CODES[message.event_type])
+        self.zone.append(_number(zone))
+        self.area.append(_number(area))
+        self.device.append(_number(device))
+        self.minutes_ago.append(message.minutes_ago)
+        self.occurred.append((received or time.time()) - message.minutes_ago * 60)
+        self.zone_name.append(self._name_code(zone and zone.name))
+        self.area_name.append(self._name_code(area and area.name))
+        self.device_name.append(self._name_code(device and device.name))
+
+    def column(self, name: str) -> Any:
+        """Column `name` copied into a NumPy array, or the array itself."""
+        values = getattr(self, name)
+        numpy = _numpy()
+        if numpy is None:
+            return values
+        return numpy.array(values, dtype=values.typecode)
+
+    def _view(self, name: str) -> Any:
+        # An array cannot grow while a view of it exists, so these must not
+        # outlive the call that takes them.
+        values = getattr(self, name)
+        numpy = _numpy()
+        if numpy is None:
+            return values
+        return numpy.frombuffer(values, dtype=values.typecode)
+
+    def to_numpy(self) -> Any:
+        """Every column, copied into one NumPy structured array."""
+        numpy = _numpy()
+        if numpy is None:
+            raise ImportError("DmpEventColumns.to_numpy needs NumPy")
+        result = numpy.empty(len(self), dtype=[(n, t) for n, t in COLUMNS])
+        for name, _ in COLUMNS:
+            result[name] = self._view(name)
+        return result
+
+    def decode(self, name: str, value: int) -> Any:
+        """The value that `value` stands for in column `name`."""
+        if name == "event_type":
+            return EVENT_TYPES[value]
+        if name == "event_key":
+            return chr(value)
+        if name in _NAME_COLUMNS:
+            return self.names[value] or None
+        return value
+
+    def counts(self, name: str) -> Dict[Any, int]:
+        """The number of events with each value of column `name`, decoded."""
+        return {
+            self.decode(name, value): count
+            for value, count in self._counts(self._view(name)).items()
+        }
+
+    def bucket_counts(
+        self, seconds: float, name: Optional[str] = None
+    ) -> Dict[Any, int]:
+        """
+        The number of events that occurred in each period of `seconds`, keyed
+        on the start of the period, or on it and the value of column `name`.
+        """
+        numpy = _numpy()
+        if numpy is None:
+            buckets = array.array("q", (int(t // seconds) for t in self.occurred))
+            if name is None:
+                pairs = collections.Counter(buckets)
+            else:
+                pairs = collections.Counter(zip(buckets, getattr(self, name)))
+        else:
+            buckets = numpy.floor_divide(self._view("occurred"), seconds)
+            buckets = buckets.astype(numpy.int64)
+            if name is None:
+                pairs = self._counts(buckets)
+            else:
+                pairs = self._pair_counts(numpy, buckets, self._view(name))
+
+        if name is None:
+            return {bucket * seconds: count for bucket, count in pairs.items()}
+        return {
+            (bucket * seconds, self.decode(name, value)): count
+            for (bucket, value), count in pairs.items()
+        }
+
+    @staticmethod
+    def _counts(values) -> Dict[Any, int]:
+        numpy = _numpy()
+        if numpy is None:
+            return collections.Counter(values)
+        unique, counts = numpy.unique(values, return_counts=True)
+        return dict(zip(unique.tolist(), counts.tolist()))
+
+    @staticmethod
+    def _pair_counts(numpy, first, second) -> Dict[Tuple[int, int], int]:
+        """Counts of each pair of integers, combined into one key to count."""
+        if not len(first):
+            return {}
+        first_min = int(first.min())
+        second_min = int(second.min())
+        width = int(second.max()) - second_min + 1
+        keys = (first - first_min) * width + (second.astype(numpy.int64) - second_min)
+        unique, counts = numpy.unique(keys, return_counts=True)
+        return {
+            (first_min + key // width, second_min + key % width): count
+            for key, count in zip(unique.tolist(), counts.tolist())
+        }
+
+
+def event_columns(
+    messages: Iterable[Any], received: Optional[float] = None
+) -> DmpEventColumns:
+    """The columns of every message in `messages`, all received at `received`."""
+    columns = DmpEventColumns()
+    if received is None:
+        received = time.time()
+    for message in messages:
+        if message is not None:
+            columns.append(message, received)
+    return columns
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import re
+
+from dmp.dmp_section import dmp_dataclass
+from dmp.exceptions import DmpInvalidMessageException
+
+
+RESPONSE_REGEX = re.compile(
+    r"^\x02?@?"
+    r"(?P<account_number>[ \d]{5})"
+    r"(?P<status>[+-])"
+    r"(?P<command>![A-Z])?"
+    r"(?P<data>.*)$"
+)
+
+
+@dmp_dataclass
+class DmpCommandResponse:
+    """A reply from the panel's command port: an ack ("+") or nak ("-")."""
+
+    account_number: str
+    accepted: bool
+    command: str
+    data: str
+
+    def answers(self, command: str) -> bool:
+        """
+        Whether this can be the reply to `command`, such as "!C01,YN": the
+        command letter must match, and so must the digit after it when the
+        panel echoes one, which tells the replies to !V0 and !V2 apart.
+        """
+        if self.command != command[:2]:
+            return False
+        digit = self.data[:1]
+        return not digit.isdigit() or digit == command[2:3]
+
+
+def parse_command_response(data: str) -> DmpCommandResponse:
+    """
+    Parses one CR-terminated reply, with the CR already stripped. Replies echo
+    the account number, then "+" or "-", then the letter of the command being
+    answered (e.g. "!C") and any data the command returns.
+    """
+
+    match = RESPONSE_REGEX.match(data)
+    if not match:
+        raise DmpInvalidMessageException(data)
+
+    return DmpCommandResponse(
+        account_number=match.group("account_number").lstrip(),
+        accepted=match.group("status") == "+",
+        command=match.group("command") or "",
+        data=match.group("data"),
+    )
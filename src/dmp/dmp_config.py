@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import json
+from dataclasses import dataclass
+from typing import List
+
+
+@dataclass(frozen=True)
+class DmpAccountConfig:
+    account_number: str
+    server_host: str
+    server_port: int
+    remote_key: str
+
+
+def load_accounts(path: str) -> List[DmpAccountConfig]:
+    """
+    Reads the panels to bridge from a JSON file of the form:
+
+        {
+          "accounts": [
+            {
+              "account_number": "1294",
+              "server_host": "192.168.1.20",
+              "server_port": 2001,
+              "remote_key": "12345678"
+            }
+          ]
+        }
+    """
+
+    with open(path) as fp:
+        config = json.load(fp)
+
+    accounts = [
+        DmpAccountConfig(
+            account_number=str(account["account_number"]).strip(),
+            server_host=account["server_host"],
+            server_port=int(account["server_port"]),
+            remote_key=str(account["remote_key"]),
+        )
+        for account in config["accounts"]
+    ]
+
+    numbers = [account.account_number for account in accounts]
+    duplicates = {number for number in numbers if numbers.count(number) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate account numbers in {path}: {sorted(duplicates)}")
+    return accounts
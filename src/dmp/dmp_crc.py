@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import struct
+from typing import Dict, List, Union
+
+
+CRC_MODES = ("skip", "log", "reject")
+
+# The DMP receiver CRC is CRC-16/ARC: polynomial 0x8005, reflected, zero
+# initial value and no final XOR.
+_POLY = 0xA001
+
+
+def _byte_table() -> List[int]:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ _POLY if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_TABLE = _byte_table()
+# Two bytes at a time: as the CRC is 16 bits wide, feeding it the little
+# endian word w from state c leaves it in the state that feeding two zero
+# bytes from c ^ w does, which this table holds for every c ^ w.
+_WORD_TABLE = [
+    (c >> 8) ^ _TABLE[c & 0xFF]
+    for c in ((x >> 8) ^ _TABLE[x & 0xFF] for x in range(0x10000))
+]
+_WORDS: Dict[int, struct.Struct] = {}
+
+# The CRC field follows the STX, and covers the rest of the frame, CR included.
+CRC_FIELD = slice(1, 5)
+CRC_START = 5
+
+
+def dmp_crc(data: Union[bytes, bytearray], start: int = 0, end: int = -1) -> int:
+    """The DMP CRC of `data[start:end]`, or of everything from `start`."""
+    if end < 0:
+        end = len(data)
+    count = (end - start) // 2
+    words = _WORDS.get(count)
+    if words is None:
+        words = _WORDS[count] = struct.Struct(f"<{count}H")
+
+    crc = 0
+    table = _WORD_TABLE
+    for word in words.unpack_from(data, start):
+        crc = table[crc ^ word]
+    if (end - start) & 1:
+        crc = (crc >> 8) ^ _TABLE[(crc ^ data[end - 1]) & 0xFF]
+    return crc
+
+
+def frame_crc_matches(frame: Union[bytes, bytearray], start: int, end: int) -> bool:
+    """
+    Whether the CRC field of the frame at `frame[start:end + 1]`, STX through
+    CR, matches its contents.
+    """
+    field = frame[start + CRC_FIELD.start : start + CRC_FIELD.stop]
+    try:
+        expected = int(field, 16)
+    except ValueError:
+        return False
+    return dmp_crc(frame, start + CRC_START, end + 1) == expected
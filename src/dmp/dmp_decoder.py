@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+from typing import BinaryIO, Callable, Iterator, Optional
+
+from dmp.dmp_crc import CRC_MODES, frame_crc_matches
+from dmp.dmp_dedup import DmpFrameDeduplicator
+from dmp.dmp_logging import FRAME_LOG
+from dmp.dmp_message import DmpFrameFilter, DmpMessage, parse_frame
+from dmp.exceptions import DmpInvalidMessageException
+
+
+STX = 0x02
+CR = 0x0D
+
+
+class DmpFrameDecoder:
+    """
+    Sans-IO decoder for the DMP receiver stream.
+
+    Feed it whatever chunks arrive from the socket or a capture file; it finds
+    the STX ... CR frame boundaries in a reusable buffer and yields one result
+    per complete frame: the parsed message, or None for frames that are
+    well-formed but have no registered message class, or that are invalid.
+    Invalid frames are logged and counted in `invalid_frames`.
+
+    Bytes outside of a frame are discarded, as is any frame that grows past
+    `max_frame_size` without a terminating CR.
+
+    `accept` and `lazy` are passed on to `parse_frame`, so frames that `accept`
+    rejects from their header also come out as None without their body ever
+    being decoded.
+
+    While a frame's result is being consumed, `account_number` holds the raw,
+    space-padded account number field from its header (as the ack for the
+    frame must echo it), or None if the frame is too malformed to have one.
+
+    `on_frame`, if given, is called with a copy of every complete frame, STX
+    through CR, before it is parsed.
+
+    `crc_mode` decides what is done with the CRC field of each frame: "skip"
+    ignores it, "log" checks it and logs frames that do not match but parses
+    them all the same, and "reject" also treats those frames as invalid.
+    Either way mismatches are counted in `crc_failures`.
+
+    With `dedup`, frames it has seen within its window come out as None and
+    are counted in `duplicates`.
+
+    While a frame's result is being consumed, `frame` holds a copy of it if
+    there is `on_frame` or `dedup`, and `duplicate` says whether `dedup`
+    found it a retransmit.
+    """
+
+    def __init__(
+        self,
+        max_frame_size: int = 4096,
+        accept: Optional[DmpFrameFilter] = None,
+        lazy: bool = False,
+        on_frame: Optional[Callable[[bytes], None]] = None,
+        crc_mode: str = "skip",
+        dedup: Optional[DmpFrameDeduplicator] = None,
+    ) -> None:
+        if crc_mode not in CRC_MODES:
+            raise ValueError(f"Unknown CRC mode: {crc_mode}")
+        self._max_frame_size = max_frame_size
+        self._accept = accept
+        self._lazy = lazy
+        self._on_frame = on_frame
+        self._check_crc = crc_mode != "skip"
+        self._reject_crc = crc_mode == "reject"
+        self._dedup = dedup
+        self._buffer = bytearray()
+        self.frames = 0
+        self.invalid_frames = 0
+        self.crc_failures = 0
+        self.duplicates = 0
+        self.account_number: Optional[bytes] = None
+        self.frame: Optional[bytes] = None
+        self.duplicate = False
+
+    def feed(self, data: bytes) -> Iterator[Optional[DmpMessage]]:
+        """
+        Buffers `data` and returns an iterator over the frames it completes.
+        Exhaust the iterator before feeding the next chunk.
+        """
+        self._buffer += data
+        return self._frames()
+
+    def _frames(self) -> Iterator[Optional[DmpMessage]]:
+        buffer = self._buffer
+        pos = 0
+        try:
+            while True:
+                start = buffer.find(STX, pos)
+                if start < 0:
+                    pos = len(buffer)
+                    return
+
+                end = buffer.find(CR, start + 1)
+                if end < 0:
+                    pos = start
+                    if len(buffer) - start > self._max_frame_size:
+                        FRAME_LOG.warning(
+                            "Discarding DMP frame over %d bytes", self._max_frame_size
+                        )
+                        self.invalid_frames += 1
+                        pos = start + 1
+                        continue
+                    return
+
+                pos = end + 1
+                self.frames += 1
+                # Fixed offset: STX, four characters of CRC and two spaces.
+                account_number = bytes(buffer[start + 7 : start + 12])
+                self.account_number = (
+                    account_number
+                    if len(account_number) == 5 and account_number.strip().isdigit()
+                    else None
+                )
+                frame = (
+                    bytes(buffer[start : end + 1])
+                    if self._on_frame or self._dedup is not None
+                    else None
+                )
+                self.frame = frame
+                self.duplicate = False
+                if self._on_frame:
+                    self._on_frame(frame)
+                if self._check_crc and not frame_crc_matches(buffer, start, end):
+                    FRAME_LOG.warning(
+                        "DMP frame CRC mismatch: %r", bytes(buffer[start : end + 1])
+                    )
+                    self.crc_failures += 1
+                    if self._reject_crc:
+                        self.invalid_frames += 1
+                        yield None
+                        continue
+                if self._dedup is not None and self._dedup.is_duplicate(frame):
+                    FRAME_LOG.debug("Dropping duplicate DMP frame: %r", frame)
+                    self.duplicates += 1
+                    self.duplicate = True
+                    yield None
+                    continue
+                try:
+                    message = parse_frame(buffer, start, end, self._accept, self._lazy)
+                except DmpInvalidMessageException as e:
+                    FRAME_LOG.warning("Invalid DMP message: %s", e)
+                    self.invalid_frames += 1
+                    message = None
+                yield message
+        finally:
+            del buffer[:pos]
+
+    @property
+    def buffered(self) -> int:
+        """Number of bytes held for a frame that is not yet complete."""
+        return len(self._buffer)
+
+
+def decode_file(
+    fp: BinaryIO, chunk_size: int = 64 * 1024
+) -> Iterator[Optional[DmpMessage]]:
+    """Decodes every frame of a raw capture read from a binary file object."""
+    decoder = DmpFrameDecoder()
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            return
+        yield from decoder.feed(chunk)
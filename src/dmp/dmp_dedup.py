@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import collections
+import time
+from typing import Callable, Dict, List
+
+
+class DmpFrameDeduplicator:
+    """
+    Recognizes frames a panel sends again because it missed the ack for the
+    first copy, so that the retransmits are acked but not published again.
+
+    A frame is a duplicate of one seen within the last `window` seconds with
+    the same bytes, that is the same account number, CRC and body. Frames
+    are remembered in the order they were first seen and forgotten once
+    older than `window`, or, oldest first, when more than `max_entries`
+    would be remembered.
+
+    Share one between all the connections of a listener, since a panel
+    usually retransmits after reconnecting.
+
+    When frames are only acked once their message is delivered, a panel
+    retransmits a frame whose first copy is still on its way. `pending` and
+    `after_delivery` let the ack of the retransmit wait for that delivery,
+    so that acking it cannot stand in for a delivery that never happens.
+    """
+
+    def __init__(self, window: float, max_entries: int = 100000) -> None:
+        self._window = window
+        self._max_entries = max_entries
+        self._seen: "collections.OrderedDict[bytes, float]" = collections.OrderedDict()
+        # What waits for each frame whose first copy is not delivered yet.
+        self._undelivered: Dict[bytes, List[Callable[[], None]]] = {}
+        self.duplicates = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def is_duplicate(self, frame: bytes) -> bool:
+        """Returns whether `frame` was seen within the window, remembering it if not."""
+        now = time.monotonic()
+        seen = self._seen
+        expired = now - self._window
+        while seen and next(iter(seen.values())) <= expired:
+            self._forget(seen.popitem(last=False)[0])
+
+        if frame in seen:
+            self.duplicates += 1
+            return True
+
+        seen[frame] = now
+        if len(seen) > self._max_entries:
+            self._forget(seen.popitem(last=False)[0])
+            self.evicted += 1
+        return False
+
+    def pending(self, frame: bytes, done: Callable[[], None]) -> Callable[[], None]:
+        """
+        Marks the first copy of `frame` as not delivered yet, returning the
+        callback to call instead of `done` once it is.
+        """
+        self._undelivered.setdefault(frame, [])
+
+        def delivered() -> None:
+            done()
+            for callback in self._undelivered.pop(frame, ()):
+                callback()
+
+        return delivered
+
+    def after_delivery(self, frame: bytes, callback: Callable[[], None]) -> bool:
+        """
+        Calls `callback` once the first copy of `frame` is delivered, if it is
+        not yet, returning whether it will.
+        """
+        waiting = self._undelivered.get(frame)
+        if waiting is None:
+            return False
+        waiting.append(callback)
+        return True
+
+    def _forget(self, frame: bytes) -> None:
+        # A retransmit still waiting goes unacked, so the panel sends it again
+        # and, now that the frame is forgotten, it is delivered itself.
+        self._undelivered.pop(frame, None)
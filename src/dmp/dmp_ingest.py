@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+import collections
+import concurrent.futures
+import csv
+import io
+import json
+import os
+import time
+from typing import (
+    Any,
+    Callable,
+    Counter,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    TextIO,
+)
+
+from dmp.dmp_decoder import STX, DmpFrameDecoder
+from dmp.dmp_message import unknown_subsections
+
+
+INGEST_FORMATS = ("jsonl", "csv")
+
+# The columns of every record; those a message has no field for are empty.
+FIELDS = (
+    "file",
+    "account_number",
+    "message",
+    "event_type",
+    "minutes_ago",
+    "crc",
+    "zone",
+    "zone_name",
+    "area",
+    "area_name",
+    "device",
+    "device_name",
+    "equipment_id",
+    "service_code",
+)
+
+
+class DmpIngestChunk(NamedTuple):
+    path: str
+    start: int
+    end: int
+
+
+class DmpIngestResult(NamedTuple):
+    # The records of the chunk, already formatted, one per line.
+    text: str
+    bytes: int
+    frames: int
+    messages: int
+    invalid_frames: int
+    unknown_subsections: Counter[str]
+
+
+class DmpIngestStats:
+    """Totals over the chunks ingested so far."""
+
+    def __init__(self) -> None:
+        self.files = 0
+        self.bytes = 0
+        self.frames = 0
+        self.messages = 0
+        self.invalid_frames = 0
+        self.unknown_subsections: Counter[str] = collections.Counter()
+        self.seconds = 0.0
+
+    def add(self, result: DmpIngestResult) -> None:
+        self.bytes += result.bytes
+        self.frames += result.frames
+        self.messages += result.messages
+        self.invalid_frames += result.invalid_frames
+        self.unknown_subsections.update(result.unknown_subsections)
+
+
+def split_file(path: str, chunk_bytes: int) -> List[DmpIngestChunk]:
+    """
+    Splits the capture at `path` into chunks of about `chunk_bytes`, each
+    starting at the STX of a frame, so that no frame straddles two chunks.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as fp:
+        while bounds[-1] + chunk_bytes < size:
+            fp.seek(bounds[-1] + chunk_bytes)
+            pos = fp.tell()
+            while True:
+                block = fp.read(64 * 1024)
+                if not block:
+                    pos = size
+                    break
+                found = block.find(STX)
+                if found >= 0:
+                    pos += found
+                    break
+                pos += len(block)
+            if pos >= size:
+                break
+            bounds.append(pos)
+    bounds.append(size)
+    return [
+        DmpIngestChunk(path, start, end)
+        for start, end in zip(bounds, bounds[1:])
+        if end > start
+    ]
+
+
+def message_record(message, path: str = "") -> Dict[str, Any]:
+    """The columns of `FIELDS` for `message`, None where it has no such field."""
+    record: Dict[str, Any] = dict.fromkeys(FIELDS)
+    record["file"] = path
+    record["account_number"] = message.account_number
+    record["message"] = type(message).__name__
+    record["event_type"] = message.event_type.name
+    record["minutes_ago"] = message.minutes_ago
+    record["crc"] = message.crc
+    for section in ("zone", "area", "device"):
+        value = getattr(message, section, None)
+        if value is not None:
+            record[section] = value.number
+            record[f"{section}_name"] = value.name
+    for field in ("equipment_id", "service_code"):
+        record[field] = getattr(message, field, None)
+    return record
+
+
+def _jsonl(records: Iterable[Dict[str, Any]]) -> str:
+    return "".join(json.dumps(record) + "\n" for record in records)
+
+
+def _csv(records: Iterable[Dict[str, Any]]) -> str:
+    out = io.StringIO()
+    csv.DictWriter(out, FIELDS, lineterminator="\n").writerows(records)
+    return out.getvalue()
+
+
+_FORMATTERS: Dict[str, Callable[[Iterable[Dict[str, Any]]], str]] = {
+    "jsonl": _jsonl,
+    "csv": _csv,
+}
+
+
+def ingest_chunk(chunk: DmpIngestChunk, fmt: str = "jsonl") -> DmpIngestResult:
+    """Decodes the frames of one chunk and formats their messages as `fmt`."""
+    with open(chunk.path, "rb") as fp:
+        fp.seek(chunk.start)
+        data = fp.read(chunk.end - chunk.start)
+
+    unknown_before = collections.Counter(unknown_subsections)
+    decoder = DmpFrameDecoder()
+    records = [
+        message_record(message, chunk.path)
+        for message in decoder.feed(data)
+        if message is not None
+    ]
+    invalid_frames = decoder.invalid_frames
+    if decoder.buffered:
+        # The capture ends in the middle of a frame.
+        invalid_frames += 1
+    return DmpIngestResult(
+        text=_FORMATTERS[fmt](records),
+        bytes=len(data),
+        frames=decoder.frames,
+        messages=len(records),
+        invalid_frames=invalid_frames,
+        unknown_subsections=unknown_subsections - unknown_before,
+    )
+
+
+def _ingest_chunks(
+    chunks: Iterable[DmpIngestChunk],
+    fmt: str,
+    workers: int,
+    initializer: Optional[Callable[[], None]],
+) -> Iterator[DmpIngestResult]:
+    if workers <= 1:
+        for chunk in chunks:
+            yield ingest_chunk(chunk, fmt)
+        return
+
+    # A few chunks per worker in flight keeps them all busy while results
+    # come back in order, without holding the whole output in memory.
+    pending: Deque[concurrent.futures.Future] = collections.deque()
+    with concurrent.futures.ProcessPoolExecutor(
+        workers, initializer=initializer
+    ) as executor:
+        for chunk in chunks:
+            pending.append(executor.submit(ingest_chunk, chunk, fmt))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def ingest_files(
+    paths: Iterable[str],
+    output: TextIO,
+    fmt: str = "jsonl",
+    workers: int = 1,
+    chunk_bytes: int = 16 * 1024 * 1024,
+    initializer: Optional[Callable[[], None]] = None,
+) -> DmpIngestStats:
+    """
+    Decodes every frame of the raw receiver captures at `paths` and writes a
+    record of each message to `output`, in JSON Lines or CSV with a header
+    as `fmt` says, in the order of the files and of the frames in them.
+
+    Files are split into chunks of about `chunk_bytes` on frame boundaries,
+    which `workers` processes decode and format in parallel, each first
+    calling `initializer` if given.
+    """
+    if fmt not in INGEST_FORMATS:
+        raise ValueError(f"Unknown ingest format: {fmt}")
+
+    paths = list(paths)
+    stats = DmpIngestStats()
+    stats.files = len(paths)
+    if fmt == "csv":
+        csv.writer(output, lineterminator="\n").writerow(FIELDS)
+
+    started = time.monotonic()
+    chunks = (chunk for path in paths for chunk in split_file(path, chunk_bytes))
+    for result in _ingest_chunks(chunks, fmt, workers, initializer):
+        output.write(result.text)
+        stats.add(result)
+    stats.seconds = time.monotonic() - started
+    return stats
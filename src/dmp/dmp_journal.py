@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+import asyncio
+import bisect
+import logging
+import os
+import struct
+import time
+from typing import (
+    AsyncGenerator,
+    BinaryIO,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from dmp.dmp_message import DmpFrameFilter, DmpMessage, parse_frame
+from dmp.dmp_logging import FRAME_LOG
+from dmp.exceptions import DmpInvalidMessageException
+
+
+SEGMENT_SUFFIX = ".journal"
+INDEX_SUFFIX = ".index"
+
+# Entry length, receive time, peer length, account number and event key; the
+# peer and the raw frame follow.
+_ENTRY = struct.Struct("<IdB5sc")
+# First receive time, start and end offsets and number of account numbers of
+# a block of entries; the account numbers follow.
+_BLOCK = struct.Struct("<dQQH")
+# The header's fixed offsets of the account number and event key.
+_ACCOUNT = slice(7, 12)
+_EVENT_KEY = 20
+
+
+class DmpJournalEntry(NamedTuple):
+    received: float
+    peer: str
+    account_number: str
+    event_key: str
+    frame: bytes
+
+
+class _DmpIndexBlock(NamedTuple):
+    received: float
+    offset: int
+    end: int
+    accounts: Set[bytes]
+
+
+def _segment_time(name: str) -> float:
+    return int(name[: -len(SEGMENT_SUFFIX)]) / 1e6
+
+
+class DmpFrameJournal:
+    """
+    Append-only journal of raw panel frames under `directory`, for
+    reprocessing history, e.g. after a change of topic mapping.
+
+    Entries go to segment files named after the receive time, in
+    microseconds, of their first entry, and a new segment is started once
+    one reaches `segment_bytes`. Each segment has a sparse index alongside,
+    with the receive time, offset and account numbers of every block of
+    `index_interval` entries, so that `read_journal` skips what is outside
+    the time range or of other accounts without reading it.
+
+    Writes are buffered, and flushed by `append` once `flush_interval`
+    seconds have passed since the last flush. A listener journaling frames
+    also flushes it every `flush_interval` seconds, so that a crash, or
+    `read_journal` on the live journal, misses at most that much even after
+    the frames stop coming.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        index_interval: int = 256,
+        flush_interval: float = 1.0,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._segment_bytes = segment_bytes
+        self._index_interval = index_interval
+        self._flush_interval = flush_interval
+        self._segment: Optional[BinaryIO] = None
+        self._index: Optional[BinaryIO] = None
+        self._size = 0
+        self._flushed_at = time.monotonic()
+
+        self._block_count = 0
+        self._block_received = 0.0
+        self._block_offset = 0
+        self._block_accounts: Set[bytes] = set()
+
+        self.entries = 0
+        self.segments = 0
+
+    @property
+    def flush_interval(self) -> float:
+        return self._flush_interval
+
+    def append(
+        self, frame: bytes, peer: str = "", received: Optional[float] = None
+    ) -> None:
+        """Journals one raw frame, STX through CR, received from `peer`."""
+        if received is None:
+            received = time.time()
+        account = frame[_ACCOUNT] if len(frame) > _EVENT_KEY else b""
+        event_key = frame[_EVENT_KEY : _EVENT_KEY + 1] if account else b""
+        peer_bytes = peer.encode()[:255]
+        size = _ENTRY.size + len(peer_bytes) + len(frame)
+
+        if self._segment is None or self._size + size > self._segment_bytes:
+            self._rotate(received)
+        if not self._block_count:
+            self._block_received = received
+            self._block_offset = self._size
+        self._block_accounts.add(account)
+        self._block_count += 1
+
+        self._segment.write(
+            _ENTRY.pack(size, received, len(peer_bytes), account, event_key or b" ")
+            + peer_bytes
+            + frame
+        )
+        self._size += size
+        self.entries += 1
+
+        if self._block_count >= self._index_interval:
+            self._write_block()
+        if time.monotonic() - self._flushed_at >= self._flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._segment is not None:
+            self._segment.flush()
+            self._index.flush()
+        self._flushed_at = time.monotonic()
+
+    def close(self) -> None:
+        if self._segment is None:
+            return
+        self._write_block()
+        self._segment.close()
+        self._index.close()
+        self._segment = self._index = None
+
+    def _rotate(self, received: float) -> None:
+        self.close()
+        name = f"{int(received * 1e6):016d}"
+        path = os.path.join(self._directory, name)
+        while os.path.exists(path + SEGMENT_SUFFIX):
+            # Two segments started within the same microsecond.
+            name = f"{int(name) + 1:016d}"
+            path = os.path.join(self._directory, name)
+        logging.info(f"Starting journal segment {path}{SEGMENT_SUFFIX}")
+        self._segment = open(path + SEGMENT_SUFFIX, "wb")
+        self._index = open(path + INDEX_SUFFIX, "wb")
+        self._size = 0
+        self.segments += 1
+
+    def _write_block(self) -> None:
+        if not self._block_count:
+            return
+        accounts = sorted(self._block_accounts)
+        self._index.write(
+            _BLOCK.pack(
+                self._block_received, self._block_offset, self._size, len(accounts)
+            )
+            + b"".join(account.ljust(5) for account in accounts)
+        )
+        self._block_count = 0
+        self._block_accounts = set()
+
+
+def _read_index(path: str) -> List[_DmpIndexBlock]:
+    blocks = []
+    try:
+        with open(path, "rb") as fp:
+            data = fp.read()
+    except FileNotFoundError:
+        return blocks
+
+    pos = 0
+    while pos + _BLOCK.size <= len(data):
+        received, offset, end, count = _BLOCK.unpack_from(data, pos)
+        pos += _BLOCK.size
+        accounts = {data[pos + 5 * i : pos + 5 * i + 5] for i in range(count)}
+        pos += 5 * count
+        blocks.append(_DmpIndexBlock(received, offset, end, accounts))
+    return blocks
+
+
+def _read_entries(
+    data: bytes,
+    start: Optional[float],
+    end: Optional[float],
+    account: Optional[bytes],
+) -> Iterator[DmpJournalEntry]:
+    pos = 0
+    while pos + _ENTRY.size <= len(data):
+        size, received, peer_length, entry_account, event_key = _ENTRY.unpack_from(
+            data, pos
+        )
+        if pos + size > len(data):
+            # The end of a segment that was still being written.
+            return
+        entry, pos = pos, pos + size
+        if start is not None and received < start:
+            continue
+        if end is not None and received >= end:
+            return
+        if account is not None and entry_account != account:
+            continue
+        peer_start = entry + _ENTRY.size
+        yield DmpJournalEntry(
+            received=received,
+            peer=data[peer_start : peer_start + peer_length].decode(),
+            account_number=entry_account.decode().strip(),
+            event_key=event_key.decode().strip(),
+            frame=data[peer_start + peer_length : entry + size],
+        )
+
+
+def _segments(directory: str) -> List[str]:
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.endswith(SEGMENT_SUFFIX)
+    )
+
+
+def read_journal(
+    directory: str,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    account_number: Optional[str] = None,
+) -> Iterator[DmpJournalEntry]:
+    """
+    Yields the entries of the journal in `directory` received from `start`
+    up to `end` (seconds since the epoch), and only those for
+    `account_number` if given, in the order they were journaled.
+    """
+
+    account = account_number.rjust(5).encode() if account_number else None
+    segments = _segments(directory)
+    names = [os.path.basename(path) for path in segments]
+    for i, path in enumerate(segments):
+        # A segment ends where the next one starts.
+        if (
+            start is not None
+            and i + 1 < len(names)
+            and _segment_time(names[i + 1]) < start
+        ):
+            continue
+        if end is not None and _segment_time(names[i]) >= end:
+            return
+
+        blocks = _read_index(path[: -len(SEGMENT_SUFFIX)] + INDEX_SUFFIX)
+        # Each block ends where the next one starts, so all but the last
+        # block starting before `start` can be skipped.
+        first = 0
+        if start is not None:
+            times = [block.received for block in blocks]
+            first = max(bisect.bisect_left(times, start) - 1, 0)
+
+        with open(path, "rb") as fp:
+            for block in blocks[first:]:
+                if end is not None and block.received >= end:
+                    return
+                if account is not None and account not in block.accounts:
+                    continue
+                fp.seek(block.offset)
+                data = fp.read(block.end - block.offset)
+                yield from _read_entries(data, start, end, account)
+
+            # Entries after the last block, which the index does not cover yet.
+            fp.seek(blocks[-1].end if blocks else 0)
+            yield from _read_entries(fp.read(), start, end, account)
+
+
+def journal_accounts(directory: str) -> Set[str]:
+    """The account numbers of every frame in the journal in `directory`."""
+    accounts = set()
+    for path in _segments(directory):
+        blocks = _read_index(path[: -len(SEGMENT_SUFFIX)] + INDEX_SUFFIX)
+        for block in blocks:
+            accounts.update(account.decode().strip() for account in block.accounts)
+        with open(path, "rb") as fp:
+            fp.seek(blocks[-1].end if blocks else 0)
+            accounts.update(
+                entry.account_number
+                for entry in _read_entries(fp.read(), None, None, None)
+            )
+    accounts.discard("")
+    return accounts
+
+
+class DmpJournalListener:
+    """
+    Stands in for `DmpMessageListener` to replay what `read_journal` yields
+    for the same arguments through `translate_dmp_to_mqtt`: as fast as
+    possible, or, with a `speed`, at that multiple of the pace the frames
+    were received at.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        account_number: Optional[str] = None,
+        speed: Optional[float] = None,
+        accept: Optional[DmpFrameFilter] = None,
+    ) -> None:
+        self._directory = directory
+        self._start = start
+        self._end = end
+        self._account_number = account_number
+        self._speed = speed
+        self._accept = accept
+        self.frames = 0
+        self.invalid_frames = 0
+
+    async def listen(self) -> AsyncGenerator[DmpMessage, None]:
+        loop = asyncio.get_running_loop()
+        first: Optional[Tuple[float, float]] = None
+        for entry in read_journal(
+            self._directory, self._start, self._end, self._account_number
+        ):
+            self.frames += 1
+            if self._speed:
+                if first is None:
+                    first = (entry.received, loop.time())
+                delay = first[1] + (entry.received - first[0]) / self._speed
+                if delay > loop.time():
+                    await asyncio.sleep(delay - loop.time())
+            elif self.frames % 1000 == 0:
+                # Let the MQTT client send what has been published so far.
+                await asyncio.sleep(0)
+
+            try:
+                message = parse_frame(
+                    entry.frame, 0, len(entry.frame) - 1, self._accept
+                )
+            except DmpInvalidMessageException as e:
+                FRAME_LOG.warning("Invalid DMP message: %s", e)
+                self.invalid_frames += 1
+                continue
+            if message:
+                yield message
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import atexit
+import logging
+import logging.handlers
+import queue
+import time
+
+
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+
+class DmpSampledLogger(logging.Logger):
+    """
+    A logger that lets through at most `rate` records a second, in bursts of
+    up to `rate`, or all of them while `rate` is 0. Sampling happens in
+    `isEnabledFor`, so a dropped record is never even created. The first
+    record let through after some were dropped says how many.
+
+    Records below WARNING and the rest are sampled separately, each up to
+    `rate`, so that a flood of debug records never drops a warning, nor is
+    counted as dropped by one.
+    """
+
+    rate = 0.0
+
+    def __init__(self, name: str, level: int = logging.NOTSET) -> None:
+        super().__init__(name, level)
+        # Indexed by whether the level is WARNING or above.
+        self._tokens = [0.0, 0.0]
+        self._counted = [0.0, 0.0]
+        self._unreported = [0, 0]
+        self.dropped = 0
+
+    def isEnabledFor(self, level: int) -> bool:
+        if not super().isEnabledFor(level):
+            return False
+        if not self.rate:
+            return True
+
+        band = int(level >= logging.WARNING)
+        now = time.monotonic()
+        tokens = min(
+            self.rate, self._tokens[band] + (now - self._counted[band]) * self.rate
+        )
+        self._counted[band] = now
+        if tokens < 1:
+            self._tokens[band] = tokens
+            self._unreported[band] += 1
+            self.dropped += 1
+            return False
+        self._tokens[band] = tokens - 1
+        return True
+
+    def makeRecord(self, *args, **kwargs) -> logging.LogRecord:
+        record = super().makeRecord(*args, **kwargs)
+        band = int(record.levelno >= logging.WARNING)
+        unreported = self._unreported[band]
+        if unreported:
+            record.msg = f"{record.getMessage()} ({unreported} similar dropped)"
+            record.args = None
+            self._unreported[band] = 0
+        return record
+
+
+def _sampled_logger(name: str) -> DmpSampledLogger:
+    manager = logging.Logger.manager
+    logger_class = manager.loggerClass
+    manager.setLoggerClass(DmpSampledLogger)
+    try:
+        logger = logging.getLogger(name)
+    finally:
+        manager.loggerClass = logger_class
+    assert isinstance(logger, DmpSampledLogger)
+    return logger
+
+
+# Records logged for every frame or publish, which are sampled. Their
+# arguments are only formatted if the record is emitted.
+FRAME_LOG = _sampled_logger("dmp.frames")
+PUBLISH_LOG = _sampled_logger("dmp.publish")
+SAMPLED_LOGGERS = (FRAME_LOG, PUBLISH_LOG)
+
+
+def configure_logging(level: str = "INFO", sample_rate: float = 100.0) -> None:
+    """
+    Logs at `level` and above to stderr from a background thread, so that
+    the event loop only ever puts records on a queue. With a `sample_rate`,
+    the per-frame and per-publish records of `SAMPLED_LOGGERS` are capped at
+    that many a second each.
+    """
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        logging.Formatter(
+            "%(asctime)s %(levelname)-8s %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+        )
+    )
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    # Only merges the arguments into the message; `handler` does the rest.
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    # Replaces the handlers a worker process inherits from its supervisor.
+    logging.basicConfig(level=level, handlers=[queue_handler], force=True)
+    logging.getLogger("gmqtt").setLevel(max(logging.INFO, logging.getLevelName(level)))
+    for logger in SAMPLED_LOGGERS:
+        logger.rate = sample_rate
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+import json
+import operator
+import string
+from dataclasses import fields
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from dmp.dmp_message import DmpLazyMessage, message_classes, message_event_key
+from dmp.dmp_types import DmpEventType
+
+
+# The topics the bridge has always published, in the format of a mapping
+# file's "mappings" list.
+DEFAULT_MAPPING: List[Dict[str, Any]] = [
+    {
+        "message": "DmpZoneAlarmMessage",
+        "topic": "dmp/{account}/alarm",
+        "payload": "triggered",
+        "retain": True,
+    },
+    {
+        "message": "DmpLowBatteryMessage",
+        "topic": "dmp/{account}/low_battery",
+        "payload": "{zone_name}",
+    },
+    {
+        "message": "DmpArmingStatusMessage",
+        "event_type": "AREA_DISARMED",
+        "topic": "dmp/{account}/alarm",
+        "payload": "disarmed",
+        "retain": True,
+    },
+    {
+        "message": "DmpArmingStatusMessage",
+        "event_type": "AREA_ARMED",
+        "area": "001",
+        "topic": "dmp/{account}/alarm",
+        "payload": "armed_home",
+        "retain": True,
+    },
+    {
+        "message": "DmpArmingStatusMessage",
+        "event_type": "AREA_ARMED",
+        "topic": "dmp/{account}/alarm",
+        "payload": "armed_away",
+        "retain": True,
+    },
+    {
+        "message": "DmpDeviceStatusMessage",
+        "event_type": [
+            "DOOR_STATUS_OPEN",
+            "DOOR_STATUS_HELD_OPEN",
+            "DOOR_STATUS_FORCED_OPEN",
+            "OUTPUT_STATUS_ON",
+            "OUTPUT_STATUS_PULSE",
+            "OUTPUT_STATUS_TEMPORAL",
+        ],
+        "topic": "dmp/{account}/status/{zone}",
+        "payload": "on",
+        "retain": True,
+    },
+    {
+        "message": "DmpDeviceStatusMessage",
+        "topic": "dmp/{account}/status/{zone}",
+        "payload": "off",
+        "retain": True,
+    },
+]
+
+
+class DmpPublication(NamedTuple):
+    topic: str
+    payload: str
+    qos: int
+    retain: bool
+
+
+def _name(section) -> str:
+    return section.name or section.number
+
+
+# Placeholders available in topic and payload templates: the attribute they
+# read and whether they are a name that falls back to the number.
+_FIELDS: Dict[str, Tuple[str, bool]] = {
+    "account": ("account_number", False),
+    "event": ("event_type.name", False),
+    "zone": ("zone.number", False),
+    "zone_name": ("zone", True),
+    "area": ("area.number", False),
+    "area_name": ("area", True),
+    "device": ("device.number", False),
+    "device_name": ("device", True),
+}
+
+_RULE_KEYS = frozenset(
+    ("message", "event_type", "zone", "area", "topic", "payload", "qos", "retain")
+)
+
+# Rendered topics and payloads kept per rule, by the values of their fields.
+_RENDER_CACHE_SIZE = 4096
+
+
+def _strings(value) -> Optional[FrozenSet[str]]:
+    if value is None:
+        return None
+    return frozenset([value] if isinstance(value, str) else value)
+
+
+class _DmpTopicRule:
+    __slots__ = ("_zones", "_areas", "_names", "_key", "_templates", "_rendered")
+
+    def __init__(self, rule: Mapping[str, Any], message_fields: FrozenSet[str]):
+        self._zones = _strings(rule.get("zone"))
+        self._areas = _strings(rule.get("area"))
+
+        topic, payload = rule["topic"], rule["payload"]
+        names = [name for name in ("zone", "area") if name in rule]
+        for template in (topic, payload):
+            for _, name, _, _ in string.Formatter().parse(template):
+                if name is not None and name not in _FIELDS:
+                    raise ValueError(f"Unknown field {{{name}}} in {template!r}")
+                if name is not None and name not in names:
+                    names.append(name)
+
+        for name in names:
+            section = _FIELDS[name][0].split(".")[0]
+            if section in ("zone", "area", "device") and section not in message_fields:
+                raise ValueError(f"{rule['message']} has no {section}")
+
+        # The values of all the fields used, as a tuple unless there is only
+        # one, in as few calls as possible.
+        self._names = tuple(names)
+        attributes = [_FIELDS[name][0] for name in names]
+        if any(_FIELDS[name][1] for name in names):
+            getters = [
+                _name_getter(attribute) if is_name else operator.attrgetter(attribute)
+                for attribute, is_name in (_FIELDS[name] for name in names)
+            ]
+            if len(getters) == 1:
+                self._key = getters[0]
+            else:
+                self._key = lambda message: tuple([get(message) for get in getters])
+        elif attributes:
+            self._key = operator.attrgetter(*attributes)
+        else:
+            self._key = lambda message: None
+
+        self._templates = (
+            topic,
+            payload,
+            int(rule.get("qos", 0)),
+            bool(rule.get("retain", False)),
+        )
+        # False for values that the zone or area filter rejects.
+        self._rendered: Dict[Any, Any] = {}
+
+    def publication(self, message) -> Optional[DmpPublication]:
+        """Returns None if `message` is filtered out or lacks a field."""
+        try:
+            key = self._key(message)
+        except AttributeError:
+            # An optional section such as the zone of a device status is missing.
+            return None
+
+        publication = self._rendered.get(key)
+        if publication is None:
+            publication = self._render(key)
+            if len(self._rendered) < _RENDER_CACHE_SIZE:
+                self._rendered[key] = publication
+        return publication or None
+
+    def _render(self, key) -> Any:
+        values = (key,) if len(self._names) == 1 else key or ()
+        fields = dict(zip(self._names, values))
+        if self._zones is not None and fields["zone"] not in self._zones:
+            return False
+        if self._areas is not None and fields["area"] not in self._areas:
+            return False
+
+        topic, payload, qos, retain = self._templates
+        return DmpPublication(
+            topic.format(**fields), payload.format(**fields), qos, retain
+        )
+
+    @property
+    def retained_topic_filter(self) -> Optional[str]:
+        """The topic as an MQTT subscription filter, if published retained."""
+        topic, _, _, retain = self._templates
+        if not retain:
+            return None
+        return "/".join("+" if "{" in level else level for level in topic.split("/"))
+
+
+def _name_getter(attribute: str) -> Callable[[Any], str]:
+    return lambda message: _name(getattr(message, attribute))
+
+
+class DmpTopicMapping:
+    """
+    Decides which MQTT topic and payload, if any, each message is published
+    to, from a list of rules such as those in `DEFAULT_MAPPING`. Each rule has:
+
+    - "message": the name of a message class, such as "DmpZoneAlarmMessage".
+    - "event_type": optionally, a `DmpEventType` name or list of them.
+    - "zone", "area": optionally, a zone or area number or list of them.
+    - "topic", "payload": templates that may use {account}, {event}, {zone},
+      {zone_name}, {area}, {area_name}, {device} and {device_name}, where a
+      name falls back to the number. A message without one of the fields
+      used does not match.
+    - "qos", "retain": publish options, 0 and false by default.
+
+    The first rule to match a message wins. Rules are compiled into a table
+    keyed on message class and event type, so a message costs one lookup.
+    """
+
+    def __init__(self, rules: Iterable[Mapping[str, Any]]) -> None:
+        classes = {cls.__name__: cls for cls in message_classes().values()}
+
+        # Keyed on the class rather than its event key, which saves reading
+        # the key off each message.
+        self._table: Dict[Tuple[type, DmpEventType], List[_DmpTopicRule]] = {}
+        self._event_keys = set()
+        self._retained_topic_filters: List[str] = []
+        for rule in rules:
+            unknown = set(rule) - _RULE_KEYS
+            if unknown:
+                raise ValueError(f"Unknown keys in topic mapping: {sorted(unknown)}")
+            if rule["message"] not in classes:
+                raise ValueError(f"Unknown message class: {rule['message']}")
+            cls = classes[rule["message"]]
+
+            event_types = _strings(rule.get("event_type"))
+            try:
+                types = (
+                    list(DmpEventType)
+                    if event_types is None
+                    else [DmpEventType[name] for name in sorted(event_types)]
+                )
+            except KeyError as e:
+                raise ValueError(f"Unknown event type: {e.args[0]}") from None
+
+            compiled = _DmpTopicRule(rule, frozenset(f.name for f in fields(cls)))
+            for event_type in types:
+                self._table.setdefault((cls, event_type), []).append(compiled)
+                self._event_keys.add((message_event_key(cls), event_type))
+
+            topic_filter = compiled.retained_topic_filter
+            if topic_filter and topic_filter not in self._retained_topic_filters:
+                self._retained_topic_filters.append(topic_filter)
+
+    @property
+    def retained_topic_filters(self) -> Tuple[str, ...]:
+        """Subscription filters covering every topic published retained."""
+        return tuple(self._retained_topic_filters)
+
+    def accepts(self, event_key: str, event_type: DmpEventType) -> bool:
+        """A `DmpFrameFilter` passing only frames some rule may publish."""
+        return (event_key, event_type) in self._event_keys
+
+    def publication(self, message) -> Optional[DmpPublication]:
+        cls = type(message)
+        if cls is DmpLazyMessage:
+            cls = message.message_class
+
+        for rule in self._table.get((cls, message.event_type), ()):
+            publication = rule.publication(message)
+            if publication is not None:
+                return publication
+        return None
+
+
+def load_mapping(path: str) -> DmpTopicMapping:
+    """Reads a topic mapping from a JSON file of the form {"mappings": [...]}."""
+    with open(path) as fp:
+        return DmpTopicMapping(json.load(fp)["mappings"])
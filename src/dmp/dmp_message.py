@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
-import dataclasses
-import logging
+import collections
 import re
-from typing import Optional
+import sys
+from types import MappingProxyType
+from typing import Any, Callable, Counter, Mapping, NamedTuple, Optional, Pattern
 
+from dmp.dmp_logging import FRAME_LOG
 from dmp.dmp_section import (
     DmpArea,
     DmpDevice,
@@ -15,13 +17,14 @@ from dmp.dmp_section import (
     _DmpProgrammingSection,
     _DmpServiceCodeSection,
     _DmpZoneSection,
+    dmp_dataclass,
 )
 from dmp.dmp_types import DmpEventType, parse_event_type
 from dmp.exceptions import DmpInvalidMessageException
 
 
-HEADER_REGEX = re.compile(
-    r"^\x02(?P<crc>.{4})"
+_HEADER_PATTERN = (
+    r"\x02(?P<crc>.{4})"
     r"  "
     r"(?P<account_number>[ \d]{5})"
     r" &"
@@ -31,26 +34,133 @@ HEADER_REGEX = re.compile(
     r'\\t (?P<event_type>"[A-Z][A-Z0-9]|\d{3})\\'
 )
 
+HEADER_REGEX = re.compile("^" + _HEADER_PATTERN)
 
-def parse_message(data: str) -> Optional["DmpMessage"]:
+# Same header, matched in place against raw bytes at an arbitrary offset.
+_HEADER_BYTES_REGEX = re.compile(_HEADER_PATTERN.encode())
+
+
+# Subsections skipped by the parser for not being known, by their code.
+unknown_subsections: Counter[str] = collections.Counter()
+
+
+# Decides from the header alone whether a frame is worth parsing, given its
+# event key (the character after "Z") and event type.
+DmpFrameFilter = Callable[[str, DmpEventType], bool]
+
+
+def parse_message(
+    data: str, accept: Optional[DmpFrameFilter] = None, lazy: bool = False
+) -> Optional["DmpMessage"]:
     """
     See https://buy.dmp.com/dmp/products/documents/LT-1035.pdf for spec.
+
+    Returns None for event keys without a registered message class and for
+    frames rejected by `accept`. With `lazy`, returns a `DmpLazyMessage`
+    whose body is only parsed once a body field is read.
     """
 
     match = HEADER_REGEX.match(data)
     if not match:
         raise DmpInvalidMessageException(data)
 
-    cls = _events.get(match.group("event_key"))
+    event_key = match.group("event_key")
+    cls = _events.get(event_key)
     if not cls:
         return None
 
+    try:
+        event_type = parse_event_type(match.group("event_type"))
+    except KeyError:
+        raise DmpInvalidMessageException(data) from None
+    if accept and not accept(event_key, event_type):
+        return None
+
+    crc = match.group("crc")
+    account_number = sys.intern(match.group("account_number").lstrip())
+    try:
+        minutes_ago = int(match.group("minutes_ago").lstrip())
+    except ValueError:
+        raise DmpInvalidMessageException(data) from None
+    if lazy:
+        return DmpLazyMessage(
+            cls, data, match.end(), crc, account_number, minutes_ago, event_type
+        )
+
     return cls._parse(
-        data[len(match.group(0)) :],
-        crc=match.group("crc"),
-        account_number=match.group("account_number").lstrip(),
-        minutes_ago=int(match.group("minutes_ago").lstrip()),
-        event_type=parse_event_type(match.group("event_type")),
+        data,
+        match.end(),
+        crc=crc,
+        account_number=account_number,
+        minutes_ago=minutes_ago,
+        event_type=event_type,
+    )
+
+
+def parse_frame(
+    buffer,
+    start: int,
+    end: int,
+    accept: Optional[DmpFrameFilter] = None,
+    lazy: bool = False,
+) -> Optional["DmpMessage"]:
+    """
+    Parses the raw frame held in `buffer[start:end]`, where `buffer[start]` is
+    the STX byte and `buffer[end]` is the terminating CR, without copying the
+    frame out of the buffer. Only the body following the header is decoded to
+    `str`, and only for frames that have a registered message class and pass
+    `accept`. See `parse_message` for `accept` and `lazy`.
+
+    The header's `message_length`, which counts from the "Z" through the CR,
+    is checked against the actual frame length. Frames with an unknown event
+    type, fields that are not UTF-8, a malformed minutes field or a missing
+    section raise `DmpInvalidMessageException` too.
+    """
+
+    match = _HEADER_BYTES_REGEX.match(buffer, start, end)
+    if not match:
+        raise DmpInvalidMessageException(bytes(buffer[start:end]))
+
+    # The "Z" precedes the event key.
+    if int(match.group("message_length")) != end + 2 - match.start("event_key"):
+        raise DmpInvalidMessageException(bytes(buffer[start:end]))
+
+    event_key = chr(buffer[match.start("event_key")])
+    cls = _events.get(event_key)
+    if not cls:
+        return None
+
+    try:
+        event_type = parse_event_type(match.group("event_type").decode())
+    except KeyError:
+        raise DmpInvalidMessageException(bytes(buffer[start:end])) from None
+    if accept and not accept(event_key, event_type):
+        return None
+
+    try:
+        with memoryview(buffer) as view:
+            body = str(view[match.end() : end], "utf-8")
+        crc = match.group("crc").decode()
+    except UnicodeDecodeError:
+        raise DmpInvalidMessageException(bytes(buffer[start:end])) from None
+
+    account_number = sys.intern(match.group("account_number").decode().lstrip())
+    try:
+        minutes_ago = int(match.group("minutes_ago"))
+    except ValueError:
+        # Spaces between the digits.
+        raise DmpInvalidMessageException(bytes(buffer[start:end])) from None
+    if lazy:
+        return DmpLazyMessage(
+            cls, body, 0, crc, account_number, minutes_ago, event_type
+        )
+
+    return cls._parse(
+        body,
+        crc=crc,
+        account_number=account_number,
+        minutes_ago=minutes_ago,
+        event_type=event_type,
     )
 
 
@@ -59,20 +169,46 @@ _events = {}
 
 def dmp_event_character(char: str):
     def decorator(cls):
+        cls._event_key = char
+        cls._parse_plan = _build_parse_plan(cls)
         _events[char] = cls
         return cls
 
     return decorator
 
 
-def _get_section_regex(section_cls) -> str:
+class _SectionPlan(NamedTuple):
+    match: Callable[[str, int], Any]
+    field: str
+    extract: Callable[[Any], Any]
+
+
+def _build_parse_plan(cls) -> Mapping[str, _SectionPlan]:
+    """
+    Builds the immutable dispatch table used by `DmpMessage._parse`, keyed on
+    the first character of each section the message class is composed of.
+    """
+    plan = {}
+    for base in cls.__bases__:
+        if base is DmpMessage:
+            continue
+        regex = _get_section_regex(base)
+        plan[regex.pattern[0]] = _SectionPlan(
+            match=regex.match,
+            field=base._field,
+            extract=base._extract,
+        )
+    return MappingProxyType(plan)
+
+
+def _get_section_regex(section_cls) -> Pattern:
     if not hasattr(section_cls, "_regex"):
         raise Exception("Class is not annotated with @dmp_section")
 
-    return str(section_cls._regex)
+    return section_cls._regex
 
 
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpMessage:
     crc: str
     account_number: str
@@ -80,100 +216,178 @@ class DmpMessage:
     event_type: DmpEventType
 
     @classmethod
-    def _parse(cls, data: str, **kwargs):
-        mapping = {
-            _get_section_regex(base)[0]: base
-            for base in cls.__bases__
-            if base is not DmpMessage
-        }
-
-        remaining_data = data
-        while remaining_data:
-            key = remaining_data[0]
-            section_cls = mapping.get(key)
-            if not section_cls:
-                section, remaining_data = remaining_data.split("\\", 1)
-                logging.warning(f"Unknown message subsection: {section}\\")
+    def _parse(cls, data: str, pos: int = 0, **kwargs):
+        plan = cls._parse_plan  # type: ignore
+        end = len(data)
+        while pos < end:
+            section = plan.get(data[pos])
+            if not section:
+                section_end = data.find("\\", pos) + 1
+                if not section_end:
+                    raise DmpInvalidMessageException(data)
+                FRAME_LOG.warning(
+                    "Unknown message subsection: %s", data[pos:section_end]
+                )
+                unknown_subsections[data[pos]] += 1
+                pos = section_end
                 continue
 
-            match = re.match(_get_section_regex(section_cls), remaining_data)
+            match = section.match(data, pos)
             if not match:
                 raise DmpInvalidMessageException(data)
 
-            remaining_data = remaining_data[len(match.group(0)) :]
-            construct = section_cls._construct  # type: ignore
-            kwargs.update(construct(section_cls, match).__dict__)
-        return cls(**kwargs)
+            pos = match.end()
+            kwargs[section.field] = section.extract(match)
+        try:
+            return cls(**kwargs)
+        except TypeError:
+            # A section the message class requires is missing.
+            raise DmpInvalidMessageException(data) from None
+
+
+class DmpLazyMessage:
+    """
+    A message with only its header parsed. The body is parsed into the full
+    `message_class` instance the first time `message` or any body field such
+    as `zone`, `area` or `device` is read.
+    """
+
+    __slots__ = (
+        "message_class",
+        "crc",
+        "account_number",
+        "minutes_ago",
+        "event_type",
+        "_data",
+        "_pos",
+        "_message",
+    )
+
+    def __init__(
+        self,
+        message_class,
+        data: str,
+        pos: int,
+        crc: str,
+        account_number: str,
+        minutes_ago: int,
+        event_type: DmpEventType,
+    ) -> None:
+        self.message_class = message_class
+        self.crc = crc
+        self.account_number = account_number
+        self.minutes_ago = minutes_ago
+        self.event_type = event_type
+        self._data: Optional[str] = data
+        self._pos = pos
+        self._message: Optional[DmpMessage] = None
+
+    @property
+    def message(self) -> DmpMessage:
+        if self._message is None:
+            self._message = self.message_class._parse(
+                self._data,
+                self._pos,
+                crc=self.crc,
+                account_number=self.account_number,
+                minutes_ago=self.minutes_ago,
+                event_type=self.event_type,
+            )
+            self._data = None
+        return self._message
+
+    def __getattr__(self, name: str):
+        # Only reached for attributes that are not header fields.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.message, name)
+
+    def __repr__(self) -> str:
+        return (
+            f"DmpLazyMessage({self.message_class.__name__}, crc={self.crc!r}, "
+            f"account_number={self.account_number!r}, "
+            f"minutes_ago={self.minutes_ago!r}, event_type={self.event_type})"
+        )
+
+
+def message_event_key(message_class) -> str:
+    """The event key (the character after "Z") a message class is parsed from."""
+    return message_class._event_key
+
+
+def message_classes() -> Mapping[str, Any]:
+    """Every registered message class, by event key."""
+    return MappingProxyType(_events)
 
 
 @dmp_event_character("a")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpZoneAlarmMessage(_DmpAreaOptionalSection, _DmpZoneSection, DmpMessage):
     pass
 
 
 @dmp_event_character("b")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpZoneForceMessage(_DmpZoneSection, _DmpAreaSection, DmpMessage):
     pass
 
 
 @dmp_event_character("d")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpLowBatteryMessage(_DmpAreaOptionalSection, _DmpZoneSection, DmpMessage):
     pass
 
 
 @dmp_event_character("f")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpZoneFailMessage(_DmpZoneSection, DmpMessage):
     pass
 
 
 @dmp_event_character("h")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpZoneMissingMessage(_DmpAreaOptionalSection, _DmpZoneSection, DmpMessage):
     pass
 
 
 @dmp_event_character("k")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpZoneVerifyMessage(_DmpZoneSection, DmpMessage):
     pass
 
 
 @dmp_event_character("r")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpZoneRestoreMessage(_DmpAreaOptionalSection, _DmpZoneSection, DmpMessage):
     pass
 
 
 @dmp_event_character("t")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpZoneTroubleMessage(_DmpAreaOptionalSection, _DmpZoneSection, DmpMessage):
     pass
 
 
 @dmp_event_character("w")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpZoneFaultMessage(_DmpAreaOptionalSection, _DmpZoneSection, DmpMessage):
     pass
 
 
 @dmp_event_character("x")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpZoneBypassMessage(_DmpAreaOptionalSection, _DmpZoneSection, DmpMessage):
     pass
 
 
 @dmp_event_character("y")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpZoneResetMessage(_DmpAreaOptionalSection, _DmpZoneSection, DmpMessage):
     pass
 
 
 @dmp_event_character("j")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpDoorAccessMessage(_DmpDeviceSection, DmpMessage):
     pass
 
@@ -182,7 +396,7 @@ class DmpDoorAccessMessage(_DmpDeviceSection, DmpMessage):
 
 
 @dmp_event_character("q")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpArmingStatusMessage(_DmpAreaSection, DmpMessage):
     pass
 
@@ -193,18 +407,18 @@ class DmpArmingStatusMessage(_DmpAreaSection, DmpMessage):
 
 
 @dmp_event_character("m")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpServiceCodeMessage(_DmpServiceCodeSection, DmpMessage):
     pass
 
 
 @dmp_event_character("s")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpSystemMessageMessage(_DmpProgrammingSection, DmpMessage):
     pass
 
 
 @dmp_event_character("c")
-@dataclasses.dataclass(frozen=True)
+@dmp_dataclass
 class DmpDeviceStatusMessage(_DmpDeviceSection, _DmpOptionalZoneSection, DmpMessage):
     pass
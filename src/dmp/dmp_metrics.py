@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+import asyncio
+import bisect
+import logging
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+from dmp.dmp_message import unknown_subsections
+
+
+# Latency buckets in seconds, from well under a millisecond to several
+# seconds of backlog.
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _label_value(value: Any) -> str:
+    if isinstance(value, type):
+        return value.__name__
+    if isinstance(value, Enum):
+        return value.name
+    return str(value)
+
+
+def _labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        text = _label_value(value)
+        text = text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{text}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class DmpCounter:
+    """A counter per combination of label values, which may be any objects."""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple[Any, ...], float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class DmpHistogram:
+    def __init__(
+        self, name: str, doc: str, buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        self.name = name
+        self.doc = doc
+        self.buckets = tuple(buckets)
+        # Not cumulative; the last count is for values above every bucket.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} histogram"
+        total = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            total += count
+            yield f'{self.name}_bucket{{le="{bucket}"}} {total}'
+        total += self.counts[-1]
+        yield f'{self.name}_bucket{{le="+Inf"}} {total}'
+        yield f"{self.name}_sum {self.sum}"
+        yield f"{self.name}_count {total}"
+
+
+# Yields (name, labels, value) samples when scraped.
+DmpGaugeCollector = Callable[[], Iterable[Tuple[str, Dict[str, Any], float]]]
+
+
+class DmpMetrics:
+    """
+    The bridge's metrics, served in the Prometheus text format by
+    `serve_metrics`. Counters and histograms are updated as events happen;
+    values already kept elsewhere, such as queue depth and command latency,
+    are read by gauge collectors added with `add_collector` when scraped.
+    """
+
+    def __init__(self) -> None:
+        self.frames_received = DmpCounter(
+            "dmp_frames_received_total", "Frames received, by panel", ("peer",)
+        )
+        self.invalid_frames = DmpCounter(
+            "dmp_invalid_frames_total",
+            "Frames that failed to parse, by panel",
+            ("peer",),
+        )
+        self.crc_failures = DmpCounter(
+            "dmp_crc_failures_total",
+            "Frames whose CRC did not match, by panel",
+            ("peer",),
+        )
+        self.parse_seconds = DmpCounter(
+            "dmp_parse_seconds_total", "Time spent decoding and queueing frames"
+        )
+        self.messages = DmpCounter(
+            "dmp_messages_total",
+            "Parsed messages, by message class and event type",
+            ("message_class", "event_type"),
+        )
+        self.mqtt_publishes = DmpCounter(
+            "dmp_mqtt_publishes_total", "Messages published to MQTT", ("retain",)
+        )
+        self.frame_to_publish_seconds = DmpHistogram(
+            "dmp_frame_to_publish_seconds",
+            "Time from reading a frame to publishing its message",
+        )
+        self._collectors: List[Tuple[str, str, DmpGaugeCollector]] = []
+
+    def add_collector(self, kind: str, doc: str, collect: DmpGaugeCollector) -> None:
+        """
+        Adds samples of Prometheus type `kind` ("gauge", "counter" or
+        "summary") from `collect`, documented by `doc`.
+        """
+        self._collectors.append((kind, doc, collect))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in (
+            self.frames_received,
+            self.invalid_frames,
+            self.crc_failures,
+            self.parse_seconds,
+            self.messages,
+            self.mqtt_publishes,
+        ):
+            lines.extend(metric.render())
+
+        lines.append(
+            "# HELP dmp_unknown_subsections_total "
+            "Message subsections skipped as unknown, by code"
+        )
+        lines.append("# TYPE dmp_unknown_subsections_total counter")
+        for code, count in unknown_subsections.items():
+            lines.append(
+                f"dmp_unknown_subsections_total{_labels(('code',), (code,))} {count}"
+            )
+
+        lines.extend(self.frame_to_publish_seconds.render())
+
+        for kind, doc, collect in self._collectors:
+            documented = set()
+            for name, labels, value in collect():
+                family = name
+                for suffix in ("_sum", "_count"):
+                    if kind == "summary" and name.endswith(suffix):
+                        family = name[: -len(suffix)]
+                if family not in documented:
+                    documented.add(family)
+                    lines.append(f"# HELP {family} {doc}")
+                    lines.append(f"# TYPE {family} {kind}")
+                lines.append(
+                    f"{name}{_labels(tuple(labels), tuple(labels.values()))} {value}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+async def serve_metrics(
+    metrics: DmpMetrics, port: int, host: str = "0.0.0.0"
+) -> asyncio.AbstractServer:
+    """Serves `metrics` at http://<host>:<port>/metrics."""
+
+    async def handle(reader, writer) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+            path = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+            if path.split(b"?")[0] == b"/metrics":
+                status, body = "200 OK", metrics.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, OSError) as e:
+            logging.debug(f"Metrics request failed: {e!r}")
+        finally:
+            writer.close()
+
+    logging.info(f"Serving metrics on port {port}")
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+import time
+from typing import Dict, Optional, Tuple
+
+
+class DmpPublishCache:
+    """
+    Last payload of each retained topic, so that publishing the value the
+    broker already holds can be skipped.
+
+    An unchanged value is still published again once `refresh_interval`
+    seconds have passed since it last was, if given. Values retained on the
+    broker from before startup can be loaded with `seed`.
+    """
+
+    def __init__(self, refresh_interval: Optional[float] = None) -> None:
+        self._refresh_interval = refresh_interval
+        self._values: Dict[str, Tuple[str, float]] = {}
+        self.emitted = 0
+        self.suppressed = 0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def seed(self, topic: str, payload: str) -> None:
+        self._values[topic] = (payload, time.monotonic())
+
+    def should_publish(self, topic: str, payload: str) -> bool:
+        """Returns whether to publish `payload`, which is then taken as published."""
+        now = time.monotonic()
+        cached = self._values.get(topic)
+        if (
+            cached is not None
+            and cached[0] == payload
+            and (
+                self._refresh_interval is None
+                or now - cached[1] < self._refresh_interval
+            )
+        ):
+            self.suppressed += 1
+            return False
+
+        self._values[topic] = (payload, now)
+        self.emitted += 1
+        return True
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import asyncio
+import collections
+import itertools
+import logging
+import os
+import pickle
+import struct
+import tempfile
+from typing import BinaryIO, Callable, Deque, Optional, Tuple
+
+from dmp.dmp_message import (
+    DmpDeviceStatusMessage,
+    DmpMessage,
+    DmpSystemMessageMessage,
+)
+
+
+OVERLOAD_POLICIES = ("delay", "drop", "spill")
+
+_Done = Callable[[], None]
+_Entry = Tuple[int, DmpMessage, Optional[_Done]]
+
+
+def is_status_message(message: DmpMessage) -> bool:
+    """Door/output status and system messages, the first to go under load."""
+    return isinstance(message, (DmpDeviceStatusMessage, DmpSystemMessageMessage))
+
+
+class DmpMessageQueue:
+    """
+    Bounded queue between the listener and the translator.
+
+    The queue becomes overloaded when it reaches `maxsize` (the high
+    watermark) and stays so until it drains below `low_watermark`. While
+    overloaded, `policy` decides what happens to new messages:
+
+    - "delay": `offer` refuses them and `put` waits, so the listener holds
+      back the panel's ack and the panel keeps the events buffered.
+    - "drop": messages for which `droppable` is true are dropped, oldest
+      queued first; all others, such as alarms, are always kept, even past
+      `maxsize`.
+    - "spill": messages go to a file at `spill_path` (or an anonymous
+      temporary file) and are read back in order once the queue drains.
+
+    A message may be queued with a `done` callback, which is called once the
+    consumer has finished with it, that is when it calls `task_done` after
+    the matching `get`, or when the message is dropped.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        policy: str = "delay",
+        low_watermark: Optional[int] = None,
+        droppable: Callable[[DmpMessage], bool] = is_status_message,
+        spill_path: Optional[str] = None,
+    ) -> None:
+        if policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy: {policy}")
+
+        self.maxsize = maxsize
+        self.low_watermark = maxsize // 2 if low_watermark is None else low_watermark
+        self.policy = policy
+        self._droppable = droppable
+        self._spill_path = spill_path
+
+        # Droppable and other messages are kept apart so the oldest droppable
+        # one can be evicted without a scan; the sequence numbers restore the
+        # order between them.
+        self._seq = itertools.count()
+        self._kept: Deque[_Entry] = collections.deque()
+        self._droppables: Deque[_Entry] = collections.deque()
+        self._unfinished: Deque[Optional[_Done]] = collections.deque()
+
+        self._spill: Optional[BinaryIO] = None
+        # Callbacks cannot be pickled, so those of spilled messages stay here.
+        self._spill_done: Deque[Optional[_Done]] = collections.deque()
+        self._spill_read = 0
+        self._spilled = 0
+
+        self._overloaded = False
+        self._not_empty = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+        self.high_watermark_hits = 0
+        self.low_watermark_hits = 0
+        self.max_depth = 0
+        self.dropped = 0
+        self.spilled = 0
+
+    def qsize(self) -> int:
+        return len(self._kept) + len(self._droppables) + self._spilled
+
+    @property
+    def overloaded(self) -> bool:
+        return self._overloaded
+
+    def offer(self, message: DmpMessage, done: Optional[_Done] = None) -> bool:
+        """
+        Queues `message` without waiting. Returns False, and does not queue
+        it, only under the "delay" policy while the queue is overloaded.
+        """
+
+        full = self.qsize() >= self.maxsize
+        if full and not self._overloaded:
+            self._overloaded = True
+            self._writable.clear()
+            self.high_watermark_hits += 1
+            logging.warning(
+                f"Listener queue reached {self.maxsize} messages, "
+                f"applying '{self.policy}' policy"
+            )
+
+        if self.policy == "delay":
+            if self._overloaded:
+                return False
+        elif full and self.policy == "drop":
+            if self._droppables:
+                _, _, dropped_done = self._droppables.popleft()
+                self.dropped += 1
+                if dropped_done:
+                    dropped_done()
+            elif self._droppable(message):
+                self.dropped += 1
+                if done:
+                    done()
+                return True
+
+        if self._spilled or (full and self.policy == "spill"):
+            # Nothing overtakes what is already on disk.
+            self._write_spill(message, done)
+            return True
+
+        self._append(message, done)
+        return True
+
+    async def put(self, message: DmpMessage, done: Optional[_Done] = None) -> None:
+        while not self.offer(message, done):
+            await self._writable.wait()
+
+    async def wait_writable(self) -> None:
+        await self._writable.wait()
+
+    async def get(self) -> DmpMessage:
+        while not (self._kept or self._droppables or self._spilled):
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        if not (self._kept or self._droppables):
+            self._read_spill()
+
+        if not self._droppables or (
+            self._kept and self._kept[0][0] < self._droppables[0][0]
+        ):
+            _, message, done = self._kept.popleft()
+        else:
+            _, message, done = self._droppables.popleft()
+        self._unfinished.append(done)
+
+        if self._overloaded and self.qsize() < self.low_watermark:
+            self._overloaded = False
+            self._writable.set()
+            self.low_watermark_hits += 1
+            logging.info(f"Listener queue drained below {self.low_watermark} messages")
+        return message
+
+    def task_done(self) -> None:
+        """Marks the oldest message returned by `get` as finished with."""
+        done = self._unfinished.popleft()
+        if done:
+            done()
+
+    def _append(self, message: DmpMessage, done: Optional[_Done]) -> None:
+        entry = (next(self._seq), message, done)
+        if self.policy == "drop" and self._droppable(message):
+            self._droppables.append(entry)
+        else:
+            self._kept.append(entry)
+        self.max_depth = max(self.max_depth, self.qsize())
+        self._not_empty.set()
+
+    def _write_spill(self, message: DmpMessage, done: Optional[_Done]) -> None:
+        if self._spill is None:
+            if self._spill_path:
+                self._spill = open(self._spill_path, "w+b")
+            else:
+                self._spill = tempfile.TemporaryFile()
+        data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+        self._spill.seek(0, os.SEEK_END)
+        self._spill.write(struct.pack("<I", len(data)) + data)
+        self._spill_done.append(done)
+        self._spilled += 1
+        self.spilled += 1
+        self.max_depth = max(self.max_depth, self.qsize())
+        self._not_empty.set()
+
+    def _read_spill(self) -> None:
+        """Moves up to half of `maxsize` spilled messages back into memory."""
+        assert self._spill is not None
+        self._spill.seek(self._spill_read)
+        for _ in range(min(self._spilled, max(self.maxsize // 2, 1))):
+            (size,) = struct.unpack("<I", self._spill.read(4))
+            message = pickle.loads(self._spill.read(size))
+            self._kept.append((next(self._seq), message, self._spill_done.popleft()))
+            self._spilled -= 1
+        self._spill_read = self._spill.tell()
+
+        if not self._spilled:
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._spill_read = 0
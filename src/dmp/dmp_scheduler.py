@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+
+PRIORITY_ARMING = 0
+PRIORITY_DEFAULT = 10
+
+
+@dataclass
+class DmpCommandStats:
+    count: int = 0
+    failures: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    last_latency: float = 0.0
+
+
+@dataclass
+class _DmpScheduledCommand:
+    name: str
+    msgs: Sequence[str]
+    group: Optional[str]
+    priority: int
+    seq: int
+    submitted: float
+    future: "asyncio.Future[List[Any]]" = field(repr=False)
+
+
+class DmpCommandScheduler:
+    """
+    Queues panel commands between MQTT and `DmpMessageWriter`.
+
+    A command submitted while the same command is still pending is merged into
+    it, and one that shares a `group` with a different pending command (e.g.
+    ARM_HOME and ARM_AWAY) replaces it. Pending commands go out lowest
+    `priority` first, and up to `max_batch` of them are sent together through
+    a single call to `send`, i.e. over one authenticated session.
+
+    `send` takes the panel messages of the whole batch and a `responses` list
+    that it appends one result to per message as the panel answers it; each
+    command's future resolves to the results of its own. If `send` raises,
+    the commands answered in full before it did still succeed, and only the
+    one that failed and those after it fail with its exception.
+    """
+
+    def __init__(
+        self,
+        send: Callable[..., Awaitable[Sequence[Any]]],
+        max_batch: int = 8,
+    ) -> None:
+        self._send = send
+        self._max_batch = max_batch
+        self._pending: List[_DmpScheduledCommand] = []
+        self._wakeup = asyncio.Event()
+        self._seq = itertools.count()
+        self.stats: Dict[str, DmpCommandStats] = {}
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def submit(
+        self,
+        name: str,
+        msgs: Sequence[str],
+        group: Optional[str] = None,
+        priority: int = PRIORITY_DEFAULT,
+    ) -> "asyncio.Future[List[Any]]":
+        for pending in self._pending:
+            if pending.name == name:
+                logging.debug(f"Merged duplicate {name} command")
+                return pending.future
+
+        loop = asyncio.get_running_loop()
+        command = _DmpScheduledCommand(
+            name=name,
+            msgs=msgs,
+            group=group,
+            priority=priority,
+            seq=next(self._seq),
+            submitted=loop.time(),
+            future=loop.create_future(),
+        )
+        # Failures are logged by run(), so nobody has to await the future.
+        command.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        if group is not None:
+            for pending in [p for p in self._pending if p.group == group]:
+                logging.info(f"{name} command replaces pending {pending.name}")
+                self._pending.remove(pending)
+                _chain(command.future, pending.future)
+
+        self._pending.append(command)
+        self._pending.sort(key=lambda c: (c.priority, c.seq))
+        self._wakeup.set()
+        return command.future
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            while self._pending:
+                batch = self._pending[: self._max_batch]
+                del self._pending[: self._max_batch]
+
+                msgs = [msg for command in batch for msg in command.msgs]
+                results: List[Any] = []
+                error: Optional[Exception] = None
+                try:
+                    await self._send(*msgs, responses=results)
+                except Exception as e:
+                    error = e
+
+                failed = []
+                for command in batch:
+                    command_results = results[: len(command.msgs)]
+                    del results[: len(command.msgs)]
+                    if error is not None and len(command_results) < len(command.msgs):
+                        failed.append(command.name)
+                        self._record(command, loop.time(), failed=True)
+                        if not command.future.done():
+                            command.future.set_exception(error)
+                        continue
+
+                    latency = self._record(command, loop.time(), failed=False)
+                    logging.info(f"{command.name} command completed in {latency:.3f}s")
+                    if not command.future.done():
+                        command.future.set_result(command_results)
+                if failed:
+                    logging.error(f"Commands {', '.join(failed)} failed: {error}")
+
+    def _record(self, command: _DmpScheduledCommand, now: float, failed: bool) -> float:
+        latency = now - command.submitted
+        stats = self.stats.setdefault(command.name, DmpCommandStats())
+        stats.count += 1
+        stats.failures += failed
+        stats.total_latency += latency
+        stats.max_latency = max(stats.max_latency, latency)
+        stats.last_latency = latency
+        return latency
+
+
+def _chain(source: asyncio.Future, target: asyncio.Future) -> None:
+    """Settles `target` with whatever `source` settles with."""
+
+    def copy(f: asyncio.Future) -> None:
+        if target.done():
+            return
+        if f.cancelled():
+            target.cancel()
+        elif f.exception() is not None:
+            target.set_exception(f.exception())
+        else:
+            target.set_result(f.result())
+
+    source.add_done_callback(copy)
@@ -1,33 +1,87 @@
 #!/usr/bin/env python3
 import re
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from functools import lru_cache
 from typing import Optional, Tuple
 
 from dmp.exceptions import DmpInvalidMessageException
 
 
-@dataclass(frozen=True)
+def dmp_dataclass(cls):
+    """
+    Equivalent to `dataclass(frozen=True, slots=True)`, which needs Python
+    3.10: instances store their fields in `__slots__` instead of a `__dict__`.
+
+    Fields that a base class already has a slot for are not redeclared, and
+    bases without slots of their own (the section mixins) must declare
+    `__slots__ = ()` for instances to stay `__dict__`-free.
+    """
+    cls = dataclass(frozen=True)(cls)
+    field_names = tuple(f.name for f in fields(cls))
+
+    inherited_slots = set()
+    for base in cls.__mro__[1:-1]:
+        inherited_slots.update(base.__dict__.get("__slots__", ()))
+
+    cls_dict = dict(cls.__dict__)
+    cls_dict["__slots__"] = tuple(
+        name for name in field_names if name not in inherited_slots
+    )
+    for name in field_names:
+        # Class attributes holding field defaults would clash with the slots.
+        cls_dict.pop(name, None)
+    cls_dict.pop("__dict__", None)
+    cls_dict.pop("__weakref__", None)
+
+    # Frozen instances reject setattr, which pickle uses to restore slots.
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in field_names)
+
+    def __setstate__(self, state):
+        for name, value in zip(field_names, state):
+            object.__setattr__(self, name, value)
+
+    cls_dict["__getstate__"] = __getstate__
+    cls_dict["__setstate__"] = __setstate__
+
+    return type(cls)(cls.__name__, cls.__bases__, cls_dict)
+
+
+@dmp_dataclass
 class DmpZone:
     number: str
     name: Optional[str] = None
 
 
-@dataclass(frozen=True)
+@dmp_dataclass
 class DmpArea:
     number: str
     name: str
 
 
-@dataclass(frozen=True)
+@dmp_dataclass
 class DmpDevice:
     number: str
     name: Optional[str] = None
 
 
-def dmp_section(regex: str, construct):
+# A panel reports a fixed set of zones, areas and devices, so every message
+# about one of them can share a single instance.
+_intern_zone = lru_cache(maxsize=4096)(DmpZone)
+_intern_area = lru_cache(maxsize=4096)(DmpArea)
+_intern_device = lru_cache(maxsize=4096)(DmpDevice)
+
+
+def dmp_section(regex: str, field: str, extract):
+    """
+    Annotates a section mixin with the regex that matches it and an extractor
+    that turns the match straight into the value of the message field `field`.
+    """
+
     def decorator(cls):
-        cls._regex = regex
-        cls._construct = construct
+        cls._regex = re.compile(regex)
+        cls._field = field
+        cls._extract = extract
         return cls
 
     return decorator
@@ -35,87 +89,98 @@ def dmp_section(regex: str, construct):
 
 @dmp_section(
     regex=r'z (?P<number>[ \d]{1,3})(?P<name>".*?)?\\',
-    construct=lambda cls, match: cls(
-        zone=DmpZone(
-            number=match.group("number").strip(),
-            name=match.group("name")[1:].strip() if match.group("name") else None,
-        )
+    field="zone",
+    extract=lambda match: _intern_zone(
+        match.group("number").strip(),
+        match.group("name")[1:].strip() if match.group("name") else None,
     ),
 )
 @dataclass(frozen=True)
 class _DmpZoneSection:
+    __slots__ = ()
+
     zone: DmpZone
 
 
 @dmp_section(
     regex=r'z (?P<number>[ \d]{1,3})(?P<name>".*?)?\\',
-    construct=lambda cls, match: cls(
-        zone=DmpZone(
-            number=match.group("number").strip(),
-            name=match.group("name")[1:].strip() if match.group("name") else None,
-        )
+    field="zone",
+    extract=lambda match: _intern_zone(
+        match.group("number").strip(),
+        match.group("name")[1:].strip() if match.group("name") else None,
     ),
 )
 @dataclass(frozen=True)
 class _DmpOptionalZoneSection:
+    __slots__ = ()
+
     zone: Optional[DmpZone] = None
 
 
 @dmp_section(
     regex=r'a (?P<number>[ \d]{1,3})"(?P<name>.*?)\\',
-    construct=lambda cls, match: cls(
-        area=DmpArea(
-            number=match.group("number").strip(),
-            name=match.group("name").strip(),
-        )
+    field="area",
+    extract=lambda match: _intern_area(
+        match.group("number").strip(),
+        match.group("name").strip(),
     ),
 )
 @dataclass(frozen=True)
 class _DmpAreaSection:
+    __slots__ = ()
+
     area: DmpArea
 
 
 @dmp_section(
     regex=r'a (?P<number>[ \d]{1,3})"(?P<name>.*?)\\',
-    construct=lambda cls, match: cls(
-        area=DmpArea(
-            number=match.group("number").strip(),
-            name=match.group("name").strip(),
-        )
+    field="area",
+    extract=lambda match: _intern_area(
+        match.group("number").strip(),
+        match.group("name").strip(),
     ),
 )
 @dataclass(frozen=True)
 class _DmpAreaOptionalSection:
+    __slots__ = ()
+
     area: Optional[DmpArea] = None
 
 
 @dmp_section(
     regex=r'v (?P<number>[ \d]{1,3})(?P<name>".*?)?\\',
-    construct=lambda cls, match: cls(
-        device=DmpDevice(
-            number=match.group("number").strip(),
-            name=match.group("name")[1:].strip() if match.group("name") else None,
-        )
+    field="device",
+    extract=lambda match: _intern_device(
+        match.group("number").strip(),
+        match.group("name")[1:].strip() if match.group("name") else None,
     ),
 )
 @dataclass(frozen=True)
 class _DmpDeviceSection:
+    __slots__ = ()
+
     device: Optional[DmpDevice] = None
 
 
 @dmp_section(
     regex=r"g (?P<number>[ \d]{1,6})\\",
-    construct=lambda cls, match: cls(equipment_id=match.group("number").strip()),
+    field="equipment_id",
+    extract=lambda match: match.group("number").strip(),
 )
 @dataclass(frozen=True)
 class _DmpServiceCodeSection:
+    __slots__ = ()
+
     equipment_id: str
 
 
 @dmp_section(
     regex=r"m[ YN](?P<number>\d{5})\\",
-    construct=lambda cls, match: cls(service_code=match.group("number").strip()),
+    field="service_code",
+    extract=lambda match: match.group("number").strip(),
 )
 @dataclass(frozen=True)
 class _DmpProgrammingSection:
+    __slots__ = ()
+
     service_code: Optional[str] = None
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Optional, Tuple
+
+from dmp.dmp_mapping import DmpPublication
+from dmp.dmp_message import DmpLazyMessage, DmpZoneAlarmMessage
+from dmp.exceptions import DmpSpoolFullException
+
+
+_MAGIC = b"DMPSPOOL"
+# Magic, next sequence number, then the size, head, tail and record count of
+# the ring of kept publishes and of the ring of the others.
+_HEADER = struct.Struct("<8sQ4Q4Q")
+# Record length and CRC32 of the rest of the record: the sequence number,
+# QoS, retain flag and topic length, then the topic and payload.
+_PREFIX = struct.Struct("<II")
+_BODY = struct.Struct("<QBBH")
+# A zero record length marks the end of the ring before it wraps around.
+_WRAP = _PREFIX.size
+
+
+def is_alarm_message(message) -> bool:
+    """Alarms, whose publishes the spool never evicts."""
+    cls = message.message_class if type(message) is DmpLazyMessage else type(message)
+    return issubclass(cls, DmpZoneAlarmMessage)
+
+
+class _DmpSpoolRing:
+    """A FIFO of variable length records in `size` bytes of `buf` at `offset`."""
+
+    def __init__(
+        self,
+        buf: mmap.mmap,
+        offset: int,
+        size: int,
+        head: int = 0,
+        tail: int = 0,
+        count: int = 0,
+    ) -> None:
+        self._buf = buf
+        self._offset = offset
+        self.size = size
+        self.head = head
+        self.tail = tail
+        self.count = count
+
+    @property
+    def used(self) -> int:
+        if not self.count:
+            return 0
+        if self.tail > self.head:
+            return self.tail - self.head
+        return self.size - self.head + self.tail
+
+    def append(self, record: bytes) -> bool:
+        """Writes `record` at the tail, or returns False if there is no room."""
+        if not self.count:
+            self.head = self.tail = 0
+        elif self.tail == self.head:
+            return False
+
+        size = len(record)
+        if self.tail >= self.head and size > self.size - self.tail:
+            # Wrap around, if the record fits before the head.
+            if size > self.head:
+                return False
+            if self.size - self.tail >= _WRAP:
+                _PREFIX.pack_into(self._buf, self._offset + self.tail, 0, 0)
+            self.tail = 0
+        elif self.tail < self.head and size > self.head - self.tail:
+            return False
+
+        start = self._offset + self.tail
+        self._buf[start : start + size] = record
+        self.tail += size
+        self.count += 1
+        return True
+
+    def peek(self) -> Tuple[int, int]:
+        """The position and length of the oldest record."""
+        start = self._offset + self.head
+        return start, _PREFIX.unpack_from(self._buf, start)[0]
+
+    def pop(self) -> None:
+        _, length = self.peek()
+        self.head += length
+        self.count -= 1
+        if not self.count:
+            self.head = self.tail = 0
+        elif self._at_wrap():
+            self.head = 0
+
+    def _at_wrap(self) -> bool:
+        return (
+            self.head + _WRAP > self.size
+            or not _PREFIX.unpack_from(self._buf, self._offset + self.head)[0]
+        )
+
+    def seq(self) -> int:
+        """The sequence number of the oldest record."""
+        start, _ = self.peek()
+        return _BODY.unpack_from(self._buf, start + _PREFIX.size)[0]
+
+    def recover(self) -> int:
+        """
+        Checks every record after a restart and drops the first one that did
+        not reach the disk whole, and all those after it. Returns the highest
+        sequence number found.
+        """
+        last_seq = -1
+        head, count = self.head, self.count
+        for index in range(count):
+            start, length = self.peek()
+            record = self._buf[start : start + length]
+            if (
+                length < _PREFIX.size + _BODY.size
+                or start + length > self._offset + self.size
+                or zlib.crc32(record[_PREFIX.size :]) != _PREFIX.unpack_from(record)[1]
+            ):
+                logging.warning(
+                    f"Dropping {count - index} spooled publishes after a damaged one"
+                )
+                self.tail = self.head
+                count = index
+                break
+            last_seq = max(last_seq, _BODY.unpack_from(record, _PREFIX.size)[0])
+            self.head += length
+            if self._at_wrap():
+                self.head = 0
+        self.head, self.count = head, count
+        if not self.count:
+            self.head = self.tail = 0
+        return last_seq
+
+
+class DmpOutboundSpool:
+    """
+    Durable FIFO of MQTT publishes waiting for the broker, in a memory-mapped
+    file at `path`, so that they survive a restart and take no heap however
+    long the broker is away.
+
+    Publishes appended with `keep` (alarms) and all the others are held in
+    two rings, of `keep_bytes` (by default a quarter of `max_bytes`) and
+    `max_bytes`; sequence numbers restore the order between them. When the
+    ring of other publishes is full, its oldest ones are evicted to make
+    room. Kept publishes are never evicted: `append` raises
+    `DmpSpoolFullException` when their ring is full instead.
+
+    Changes reach the disk in batches: the file is synced once `sync_every`
+    changes are waiting or `sync_interval` seconds after the last sync, and
+    right after a kept publish is appended. A publish removed since the last
+    sync is replayed again after a crash; one appended since is lost, unless
+    it was kept.
+
+    An existing spool file is reopened with the ring sizes it was created
+    with, and whatever it still holds comes out first.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        keep_bytes: Optional[int] = None,
+        sync_every: int = 100,
+        sync_interval: float = 1.0,
+    ) -> None:
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._path = path
+
+        header = None
+        if os.path.exists(path) and os.path.getsize(path) >= _HEADER.size:
+            with open(path, "rb") as fp:
+                header = _HEADER.unpack(fp.read(_HEADER.size))
+            if header[0] != _MAGIC:
+                raise ValueError(f"Not a spool file: {path}")
+
+        if header:
+            _, self._next_seq, *rings = header
+            keep_bytes, max_bytes = rings[0], rings[4]
+            self._file = open(path, "r+b")
+        else:
+            self._next_seq = 0
+            keep_bytes = max_bytes // 4 if keep_bytes is None else keep_bytes
+            rings = [keep_bytes, 0, 0, 0, max_bytes, 0, 0, 0]
+            self._file = open(path, "w+b")
+            self._file.truncate(mmap.PAGESIZE + keep_bytes + max_bytes)
+
+        # The rings start on a page of their own, after the header.
+        self._buf = mmap.mmap(self._file.fileno(), 0)
+        self._kept = _DmpSpoolRing(self._buf, mmap.PAGESIZE, *rings[:4])
+        self._others = _DmpSpoolRing(self._buf, mmap.PAGESIZE + keep_bytes, *rings[4:])
+        if header:
+            last_seq = max(self._kept.recover(), self._others.recover())
+            self._next_seq = max(self._next_seq, last_seq + 1)
+            if len(self):
+                logging.info(f"Recovered {len(self)} spooled publishes from {path}")
+        self._write_header()
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+        self.appended = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return self._kept.count + self._others.count
+
+    @property
+    def used_bytes(self) -> int:
+        return self._kept.used + self._others.used
+
+    def append(self, publication: DmpPublication, keep: bool = False) -> None:
+        topic, payload, qos, retain = publication
+        topic_bytes = topic.encode()
+        body = (
+            _BODY.pack(self._next_seq, qos, retain, len(topic_bytes))
+            + topic_bytes
+            + payload.encode()
+        )
+        record = _PREFIX.pack(_PREFIX.size + len(body), zlib.crc32(body)) + body
+
+        ring = self._kept if keep else self._others
+        if len(record) > ring.size:
+            raise DmpSpoolFullException(f"Publish to {topic} is larger than the spool")
+        while not ring.append(record):
+            if keep:
+                raise DmpSpoolFullException(
+                    f"No room left for {ring.count} kept publishes in {self._path}"
+                )
+            ring.pop()
+            self.evicted += 1
+
+        self._next_seq += 1
+        self.appended += 1
+        self._changed(force=keep)
+
+    def peek(self) -> DmpPublication:
+        """The oldest publish, which stays in the spool until `pop`."""
+        start, length = self._oldest().peek()
+        body = self._buf[start + _PREFIX.size : start + length]
+        _, qos, retain, topic_length = _BODY.unpack_from(body)
+        topic_end = _BODY.size + topic_length
+        return DmpPublication(
+            topic=body[_BODY.size : topic_end].decode(),
+            payload=body[topic_end:].decode(),
+            qos=qos,
+            retain=bool(retain),
+        )
+
+    def pop(self) -> None:
+        self._oldest().pop()
+        self._changed()
+
+    def sync(self) -> None:
+        if self._unsynced:
+            self._buf.flush()
+            self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def close(self) -> None:
+        self.sync()
+        self._buf.close()
+        self._file.close()
+
+    def _oldest(self) -> _DmpSpoolRing:
+        if not self._others.count:
+            return self._kept
+        if not self._kept.count:
+            return self._others
+        return self._kept if self._kept.seq() < self._others.seq() else self._others
+
+    def _changed(self, force: bool = False) -> None:
+        self._write_header()
+        self._unsynced += 1
+        if (
+            force
+            or self._unsynced >= self.sync_every
+            or time.monotonic() - self._synced_at >= self.sync_interval
+        ):
+            self.sync()
+
+    def _write_header(self) -> None:
+        _HEADER.pack_into(
+            self._buf,
+            0,
+            _MAGIC,
+            self._next_seq,
+            *(
+                value
+                for ring in (self._kept, self._others)
+                for value in (ring.size, ring.head, ring.tail, ring.count)
+            ),
+        )
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+import time
+from dataclasses import fields
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from dmp.dmp_mapping import DmpPublication
+from dmp.dmp_message import (
+    DmpArmingStatusMessage,
+    DmpLazyMessage,
+    DmpZoneAlarmMessage,
+    DmpZoneResetMessage,
+    DmpZoneRestoreMessage,
+    message_classes,
+)
+from dmp.dmp_types import DmpEventType
+
+
+STATE_KINDS = ("zone", "area", "device")
+
+# Message classes, and event types of arming status messages, that set the
+# status of the zone or area they are about.
+_ZONE_STATUS = {
+    DmpZoneAlarmMessage: "alarm",
+    DmpZoneRestoreMessage: "normal",
+    DmpZoneResetMessage: "normal",
+}
+_AREA_STATUS = {
+    DmpEventType.AREA_ARMED: "armed",
+    DmpEventType.AREA_DISARMED: "disarmed",
+}
+
+# Event keys of the message classes about a zone, area or device.
+_STATE_EVENT_KEYS = frozenset(
+    event_key
+    for event_key, cls in message_classes().items()
+    if any(field.name in STATE_KINDS for field in fields(cls))
+)
+
+
+class DmpEntityState(NamedTuple):
+    account_number: str
+    kind: str
+    number: str
+    name: Optional[str]
+    # The name of the class of the last message about it, and its event type.
+    message: str
+    event_type: DmpEventType
+    # When the last event happened, in seconds since the epoch.
+    occurred: float
+    # "alarm" or "normal" for a zone, "armed" or "disarmed" for an area, once
+    # a message has said which.
+    status: Optional[str]
+
+
+class DmpStateStore:
+    """
+    The last known state of every zone, area and device of each account,
+    from the messages passed to `update`, for in-process consumers to query
+    with `get` and `states`.
+
+    Frames a topic mapping does not publish, such as zone restores, still
+    change states, so a listener feeding it must also parse those `accepts`
+    passes.
+
+    It also holds the last retained publish of every topic, recorded with
+    `retained`, so that `snapshot` can give a broker that lost them
+    everything subscribers would otherwise only see once each zone, area or
+    device reports again.
+    """
+
+    def __init__(self) -> None:
+        self._states: Dict[str, Dict[Tuple[str, str], DmpEntityState]] = {}
+        # The kinds of state each message class has a field for.
+        self._kinds: Dict[type, Tuple[str, ...]] = {}
+        self._retained: Dict[str, DmpPublication] = {}
+        self.updates = 0
+        self.resyncs = 0
+
+    def __len__(self) -> int:
+        return sum(len(states) for states in self._states.values())
+
+    def update(self, message, received: Optional[float] = None) -> None:
+        """Updates the state of what `message` is about, received at `received`."""
+        cls = (
+            message.message_class if type(message) is DmpLazyMessage else type(message)
+        )
+        kinds = self._kinds.get(cls)
+        if kinds is None:
+            names = {field.name for field in fields(cls)}
+            kinds = self._kinds[cls] = tuple(k for k in STATE_KINDS if k in names)
+        self.updates += 1
+        if not kinds:
+            return
+
+        account = message.account_number
+        event_type = message.event_type
+        occurred = (received or time.time()) - message.minutes_ago * 60
+        states = self._states.get(account)
+        if states is None:
+            states = self._states[account] = {}
+
+        for kind in kinds:
+            section = getattr(message, kind)
+            if section is None:
+                continue
+            if kind == "zone":
+                status = _ZONE_STATUS.get(cls)
+            elif kind == "area" and cls is DmpArmingStatusMessage:
+                status = _AREA_STATUS.get(event_type)
+            else:
+                status = None
+
+            key = (kind, section.number)
+            previous = states.get(key)
+            name = section.name
+            if previous is not None:
+                # Not every message about something carries its name.
+                name = name or previous.name
+                status = status or previous.status
+            states[key] = DmpEntityState(
+                account,
+                kind,
+                section.number,
+                name,
+                cls.__name__,
+                event_type,
+                occurred,
+                status,
+            )
+
+    def accepts(self, event_key: str, event_type: DmpEventType) -> bool:
+        """A `DmpFrameFilter` passing the frames of every message `update` uses."""
+        return event_key in _STATE_EVENT_KEYS
+
+    def retained(self, publication: DmpPublication) -> None:
+        """Records the latest retained publish to its topic."""
+        self._retained[publication.topic] = publication
+
+    def get(
+        self, account_number: str, kind: str, number: str
+    ) -> Optional[DmpEntityState]:
+        """The state of zone, area or device `number` of `account_number`."""
+        return self._states.get(account_number, {}).get((kind, number))
+
+    def states(
+        self,
+        account_number: Optional[str] = None,
+        kind: Optional[str] = None,
+        status: Optional[str] = None,
+    ) -> List[DmpEntityState]:
+        """Every state, or only those of `account_number`, `kind` or `status`."""
+        if account_number is None:
+            accounts = list(self._states.values())
+        else:
+            accounts = [self._states.get(account_number, {})]
+        return [
+            state
+            for states in accounts
+            for state in states.values()
+            if (kind is None or state.kind == kind)
+            and (status is None or state.status == status)
+        ]
+
+    def snapshot(self) -> List[DmpPublication]:
+        """The latest retained publish to every topic."""
+        return list(self._retained.values())
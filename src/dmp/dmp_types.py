@@ -4,6 +4,10 @@ from enum import Enum
 
 
 class DocEnum(Enum):
+    # Members are singletons, so identity hashing is valid and, unlike Enum's
+    # own __hash__, needs no Python-level call in dict and set lookups.
+    __hash__ = object.__hash__
+
     def __new__(cls, value, doc=None):
         self = object.__new__(cls)
         self._value_ = value
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import logging
+import multiprocessing
+import multiprocessing.connection
+import signal
+import sys
+import time
+from typing import Any, Callable, Dict, Tuple
+
+
+def run_workers(
+    workers: int,
+    target: Callable[..., None],
+    args: Tuple[Any, ...] = (),
+    restart_delay: float = 1.0,
+    max_restart_delay: float = 30.0,
+    sleep: Callable[[float], None] = time.sleep,
+) -> None:
+    """
+    Runs `target(index, *args)` in `workers` processes and restarts any that
+    exit, until this process gets SIGINT or SIGTERM, which stops them all.
+    Workers should ignore SIGINT and leave shutting down to the supervisor.
+
+    A worker that dies within `max_restart_delay` seconds of starting is
+    restarted after a delay that doubles each time, so a worker that cannot
+    start does not spin. Delays are waited out with `sleep`.
+    """
+
+    def start(index: int) -> multiprocessing.Process:
+        process = multiprocessing.Process(
+            target=target, args=(index, *args), name=f"dmp-worker-{index}"
+        )
+        process.start()
+        logging.info(f"Started worker {index} (pid {process.pid})")
+        return process
+
+    # SystemExit unwinds into the finally below, which stops the workers.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    processes: Dict[int, multiprocessing.Process] = {}
+    started: Dict[int, float] = {}
+    delays: Dict[int, float] = {}
+    try:
+        for index in range(workers):
+            processes[index] = start(index)
+            started[index] = time.monotonic()
+
+        while True:
+            multiprocessing.connection.wait(
+                [process.sentinel for process in processes.values()]
+            )
+            for index, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+
+                uptime = time.monotonic() - started[index]
+                if uptime < max_restart_delay:
+                    delay = delays.get(index, restart_delay / 2) * 2
+                    delay = min(delay, max_restart_delay)
+                else:
+                    delay = restart_delay
+                delays[index] = delay
+                logging.warning(
+                    f"Worker {index} exited with code {process.exitcode} after "
+                    f"{uptime:.1f}s, restarting in {delay:.1f}s"
+                )
+                sleep(delay)
+                processes[index] = start(index)
+                started[index] = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in processes.values():
+            process.join()
@@ -3,3 +3,19 @@
 
 class DmpInvalidMessageException(Exception):
     pass
+
+
+class DmpCommandException(Exception):
+    pass
+
+
+class DmpCommandTimeoutException(DmpCommandException):
+    pass
+
+
+class DmpCommandRejectedException(DmpCommandException):
+    pass
+
+
+class DmpSpoolFullException(Exception):
+    pass
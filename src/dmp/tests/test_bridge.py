@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import socket
+import tempfile
+import unittest
+from unittest import mock
+
+from gmqtt import Subscription
+
+from dmp.bridge import (
+    ACK_MODES,
+    DmpMessageListener,
+    DmpMessageWriter,
+    run_dmp_mqtt_bridge,
+    _DmpListenerProtocol,
+    translate_dmp_to_mqtt,
+)
+from dmp.dmp_config import DmpAccountConfig
+from dmp.dmp_dedup import DmpFrameDeduplicator
+from dmp.dmp_journal import DmpFrameJournal, read_journal
+from dmp.dmp_mapping import DEFAULT_MAPPING, DmpTopicMapping
+from dmp.dmp_message import parse_message
+from dmp.dmp_publish_cache import DmpPublishCache
+from dmp.dmp_queue import DmpMessageQueue
+from dmp.dmp_spool import DmpOutboundSpool
+from dmp.dmp_state import DmpStateStore
+from dmp.exceptions import DmpCommandRejectedException, DmpCommandTimeoutException
+
+
+DOOR_OPEN = b'\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\\r'
+DOOR_CLOSED = DOOR_OPEN.replace(b'"DO', b'"DC')
+ALARM = (
+    b'\x020000   1294 &    0Za\\060\\t "BU\\z 501"FRONT DOOR      \\'
+    b'a 001"PERIMETER       \\\r'
+)
+RESTORE = ALARM.replace(b"Za", b"Zr")
+ACK = b"\x02 1294\x06\r"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class _FakeListener:
+    def __init__(self, frames, until=None):
+        self._messages = [
+            parse_message(frame.decode().rstrip("\r")) for frame in frames
+        ]
+        self._until = until
+
+    async def listen(self):
+        for message in self._messages:
+            yield message
+        if self._until is not None:
+            await self._until
+
+
+class _FakeMQTTClient:
+    def __init__(self, is_connected=True):
+        self.published = []
+        self.is_connected = is_connected
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload, retain))
+
+
+class _FakeBridgeMQTTClient(_FakeMQTTClient):
+    def __init__(self):
+        super().__init__()
+        self.subscribed = []
+        self.unsubscribed = []
+        self.on_message = None
+
+    def set_auth_credentials(self, username, password):
+        pass
+
+    async def connect(self, host):
+        pass
+
+    def subscribe(self, subscription_or_topic, qos=0, **kwargs):
+        # As gmqtt's, which takes a list only of Subscriptions.
+        if isinstance(subscription_or_topic, (list, tuple)):
+            self.subscribed.extend(s.topic for s in subscription_or_topic)
+        elif isinstance(subscription_or_topic, Subscription):
+            self.subscribed.append(subscription_or_topic.topic)
+        else:
+            self.subscribed.append(subscription_or_topic)
+
+    def unsubscribe(self, topic, **kwargs):
+        if isinstance(topic, (list, tuple)):
+            self.unsubscribed.extend(topic)
+        else:
+            self.unsubscribed.append(topic)
+
+
+class _FakePanelCommandPort:
+    """
+    Acks the remote link handshake and every command, as a panel would,
+    except for those in `naks`, `silent` and `delays` by their first three
+    characters, and hangs up once instead of answering the commands in
+    `drops`.
+    """
+
+    def __init__(self):
+        self.connections = 0
+        self.closed = 0
+        self.lines = []
+        self.writers = []
+        self.naks = set()
+        self.silent = set()
+        self.delays = {}
+        self.drops = set()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.writers.append(writer)
+        while True:
+            try:
+                line = (await reader.readuntil(b"\r")).decode()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            # @<account><command>
+            account, command = line[1:6], line[6:]
+            self.lines.append(command.rstrip("\r"))
+            code = command[:3]
+            if code in self.silent:
+                continue
+            if self.lines[-1] in self.drops:
+                self.drops.remove(self.lines[-1])
+                break
+            if code in self.delays:
+                await asyncio.sleep(self.delays[code])
+            status = "-" if code in self.naks else "+"
+            writer.write(f"\x02@{account}{status}{code}\r".encode())
+        writer.close()
+        self.closed += 1
+
+
+class TestTranslateDmpToMqtt(unittest.IsolatedAsyncioTestCase):
+    async def testPublishCache(self):
+        listener = _FakeListener([DOOR_OPEN, DOOR_OPEN, DOOR_CLOSED, DOOR_CLOSED])
+        client = _FakeMQTTClient()
+        cache = DmpPublishCache()
+
+        await translate_dmp_to_mqtt(listener, client, ["1294"], publish_cache=cache)
+
+        self.assertEqual(
+            client.published,
+            [
+                ("dmp/1294/status/501", "on", True),
+                ("dmp/1294/status/501", "off", True),
+            ],
+        )
+        self.assertEqual(cache.suppressed, 2)
+
+    async def testSpoolWhileDisconnected(self):
+        done = asyncio.get_running_loop().create_future()
+        listener = _FakeListener([DOOR_OPEN, ALARM, DOOR_CLOSED], until=done)
+        client = _FakeMQTTClient(is_connected=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            spool = DmpOutboundSpool(os.path.join(tmp, "spool"), sync_interval=0.01)
+            translator = asyncio.ensure_future(
+                translate_dmp_to_mqtt(listener, client, ["1294"], spool=spool)
+            )
+
+            await asyncio.sleep(0.05)
+            self.assertEqual(client.published, [])
+            self.assertEqual(len(spool), 3)
+
+            client.is_connected = True
+            await asyncio.sleep(0.05)
+            done.set_result(None)
+            await translator
+            spool.close()
+
+        self.assertEqual(
+            client.published,
+            [
+                ("dmp/1294/status/501", "on", True),
+                ("dmp/1294/alarm", "triggered", True),
+                ("dmp/1294/status/501", "off", True),
+            ],
+        )
+
+    async def testResyncAfterReconnect(self):
+        done = asyncio.get_running_loop().create_future()
+        listener = _FakeListener([DOOR_OPEN, ALARM, DOOR_CLOSED], until=done)
+        client = _FakeMQTTClient()
+        state = DmpStateStore()
+        translator = asyncio.ensure_future(
+            translate_dmp_to_mqtt(listener, client, ["1294"], state=state)
+        )
+
+        await asyncio.sleep(0.15)
+        self.assertEqual(len(client.published), 3)
+        client.is_connected = False
+        await asyncio.sleep(0.15)
+        client.is_connected = True
+        await asyncio.sleep(0.15)
+        done.set_result(None)
+        await translator
+
+        self.assertEqual(
+            client.published[3:],
+            [
+                ("dmp/1294/status/501", "off", True),
+                ("dmp/1294/alarm", "triggered", True),
+            ],
+        )
+        self.assertEqual(state.resyncs, 1)
+        self.assertEqual(state.get("1294", "zone", "501").name, "FRONT DOOR")
+
+
+class TestRunDmpMqttBridge(unittest.IsolatedAsyncioTestCase):
+    async def start(self, account_numbers, **kwargs):
+        """Runs the bridge for `account_numbers`, each with a fake command port."""
+        self.client = _FakeBridgeMQTTClient()
+        self.ports = {}
+        accounts = []
+        for account_number in account_numbers:
+            port = self.ports[account_number] = _FakePanelCommandPort()
+            server = await asyncio.start_server(port.handle, "127.0.0.1", 0)
+            self.addAsyncCleanup(server.wait_closed)
+            self.addCleanup(server.close)
+            accounts.append(
+                DmpAccountConfig(
+                    account_number,
+                    "127.0.0.1",
+                    server.sockets[0].getsockname()[1],
+                    "KEY",
+                )
+            )
+
+        listen_port = free_port()
+        patch = mock.patch("dmp.bridge.MQTTClient", lambda client_id: self.client)
+        patch.start()
+        self.addCleanup(patch.stop)
+        bridge = asyncio.ensure_future(
+            run_dmp_mqtt_bridge(
+                listen_port, accounts, "broker", "user", "password", **kwargs
+            )
+        )
+        self.addAsyncCleanup(self.stop, bridge)
+        await asyncio.sleep(0.05)
+        reader, writer = await asyncio.open_connection("127.0.0.1", listen_port)
+        self.addCleanup(writer.close)
+        return reader, writer
+
+    async def stop(self, bridge):
+        bridge.cancel()
+        try:
+            await bridge
+        except asyncio.CancelledError:
+            pass
+
+    async def testAccountsPublishUnderTheirOwnTopics(self):
+        reader, writer = await self.start(["1294", "98765"], publish_cache=False)
+
+        writer.write(DOOR_OPEN + DOOR_CLOSED.replace(b"   1294 ", b"  98765 "))
+        await asyncio.wait_for(reader.readexactly(2 * len(ACK)), 1)
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(
+            self.client.published,
+            [
+                ("dmp/1294/status/501", "on", True),
+                ("dmp/98765/status/501", "off", True),
+            ],
+        )
+
+    async def testPublishCacheIsSeeded(self):
+        reader, writer = await self.start(["1294"], seed_timeout=0.01)
+        filters = list(DmpTopicMapping(DEFAULT_MAPPING).retained_topic_filters)
+        self.assertEqual(self.client.subscribed, ["dmp/+/alarm/set"] + filters)
+        self.assertEqual(self.client.unsubscribed, filters)
+
+        writer.write(DOOR_OPEN + DOOR_OPEN)
+        await asyncio.wait_for(reader.readexactly(2 * len(ACK)), 1)
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(self.client.published, [("dmp/1294/status/501", "on", True)])
+
+    async def testCommandsGoToTheirOwnPanel(self):
+        await self.start(["1294", "98765"], publish_cache=False)
+        self.assertIn("dmp/+/alarm/set", self.client.subscribed)
+
+        on_message = self.client.on_message
+        await on_message(self.client, "dmp/98765/alarm/set", b"ARM_AWAY", 0, None)
+        await on_message(self.client, "dmp/1294/alarm/set", b"ARM_HOME", 0, None)
+        await on_message(self.client, "dmp/4321/alarm/set", b"ARM_HOME", 0, None)
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(self.ports["98765"].lines[2:], ["!C01,YN", "!C02,YN"])
+        self.assertEqual(self.ports["1294"].lines[2:], ["!C01,YN"])
+
+    async def testStateFollowsUnpublishedMessages(self):
+        state = DmpStateStore()
+        reader, writer = await self.start(
+            ["1294"], publish_cache=False, state_store=True, state=state
+        )
+
+        writer.write(ALARM + RESTORE)
+        await asyncio.wait_for(reader.readexactly(2 * len(ACK)), 1)
+        await asyncio.sleep(0.05)
+
+        # Only the alarm is published, but the restore still clears it.
+        self.assertEqual(self.client.published, [("dmp/1294/alarm", "triggered", True)])
+        zone = state.get("1294", "zone", "501")
+        self.assertEqual(zone.status, "normal")
+        self.assertEqual(zone.message, "DmpZoneRestoreMessage")
+
+
+class TestDmpMessageListener(unittest.IsolatedAsyncioTestCase):
+    async def connect(self, mode: str, ack_mode: str, **kwargs):
+        port = free_port()
+        listener = DmpMessageListener(
+            listen_port=port,
+            dmp_server_host=None,
+            dmp_account_number=None,
+            mode=mode,
+            ack_mode=ack_mode,
+            **kwargs,
+        )
+        messages = listener.listen()
+        # Starts the server, which then waits for the first message.
+        first = asyncio.ensure_future(messages.__anext__())
+        await asyncio.sleep(0.05)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        self.addAsyncCleanup(messages.aclose)
+        self.addCleanup(writer.close)
+        return messages, first, reader, writer
+
+    async def testReceivedAcksBatched(self):
+        for mode in ("stream", "protocol"):
+            with self.subTest(mode=mode):
+                _, first, reader, writer = await self.connect(mode, "received")
+
+                writer.write(DOOR_OPEN * 3)
+                acks = await asyncio.wait_for(reader.read(1024), 1)
+
+                self.assertEqual(acks, ACK * 3)
+                await first
+
+    async def testDeliveredAcks(self):
+        for mode in ("stream", "protocol"):
+            with self.subTest(mode=mode):
+                messages, first, reader, writer = await self.connect(mode, "delivered")
+
+                writer.write(DOOR_OPEN * 3)
+                await first
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(reader.read(1024), 0.1)
+
+                # Asking for the next message finishes with the previous one;
+                # with more still queued their acks wait for the deadline.
+                await messages.__anext__()
+                await messages.__anext__()
+                self.assertEqual(
+                    await asyncio.wait_for(reader.readexactly(2 * len(ACK)), 1),
+                    ACK * 2,
+                )
+
+                # Once the queue is empty the ack goes out at once.
+                second = asyncio.ensure_future(messages.__anext__())
+                self.assertEqual(await asyncio.wait_for(reader.read(1024), 0.02), ACK)
+                second.cancel()
+
+    async def testDeliveredAcksOfRetransmits(self):
+        for mode in ("stream", "protocol"):
+            with self.subTest(mode=mode):
+                dedup = DmpFrameDeduplicator(window=60)
+                messages, first, reader, writer = await self.connect(
+                    mode, "delivered", dedup=dedup
+                )
+
+                # The panel resends a frame whose ack is still pending.
+                writer.write(DOOR_OPEN)
+                await first
+                writer.write(DOOR_OPEN)
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(reader.read(1024), 0.1)
+                self.assertEqual(dedup.duplicates, 1)
+
+                # Both are acked once the first copy is delivered.
+                second = asyncio.ensure_future(messages.__anext__())
+                self.assertEqual(
+                    await asyncio.wait_for(reader.readexactly(2 * len(ACK)), 1),
+                    ACK * 2,
+                )
+
+                # Later retransmits are acked at once.
+                writer.write(DOOR_OPEN)
+                self.assertEqual(await asyncio.wait_for(reader.read(1024), 1), ACK)
+                self.assertFalse(second.done())
+                second.cancel()
+
+    async def testHeldFramesQueuedAfterConnectionLost(self):
+        for ack_mode in ACK_MODES:
+            with self.subTest(ack_mode=ack_mode):
+                queue = DmpMessageQueue(maxsize=2)
+                listener = DmpMessageListener(
+                    listen_port=0,
+                    dmp_server_host=None,
+                    dmp_account_number=None,
+                    mode="protocol",
+                    queue=queue,
+                    ack_mode=ack_mode,
+                    dedup=DmpFrameDeduplicator(window=60),
+                )
+                transports = [mock.Mock(), mock.Mock()]
+                protocols = []
+                for transport in transports:
+                    transport.get_extra_info.return_value = ("127.0.0.1", 1)
+                    protocols.append(_DmpListenerProtocol(listener))
+                    protocols[-1].connection_made(transport)
+
+                # The last frame is held for the full queue when the panel
+                # hangs up, and it sends that frame again on a new connection.
+                protocols[0].data_received(DOOR_OPEN + DOOR_CLOSED + ALARM)
+                protocols[0].connection_lost(None)
+                protocols[1].data_received(ALARM)
+                # In "delivered" mode the retransmit's ack waits for the held
+                # copy to be delivered.
+                self.assertEqual(transports[1].write.called, ack_mode == "received")
+
+                received = []
+                for _ in range(3):
+                    received.append((await queue.get()).event_type.name)
+                    queue.task_done()
+                self.assertEqual(
+                    received,
+                    ["DOOR_STATUS_OPEN", "DOOR_STATUS_CLOSED", "ZONE_BURGLARY"],
+                )
+                self.assertEqual(queue.qsize(), 0)
+                transports[1].write.assert_called_once_with(ACK)
+
+    async def testJournalFlushedWhenIdle(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = DmpFrameJournal(tmp, flush_interval=0.2)
+            _, first, reader, writer = await self.connect(
+                "stream", "received", journal=journal
+            )
+
+            writer.write(DOOR_OPEN * 2)
+            await first
+            self.assertEqual(len(list(read_journal(tmp))), 0)
+
+            await asyncio.sleep(0.3)
+            self.assertEqual(len(list(read_journal(tmp))), 2)
+            journal.close()
+
+
+class TestDmpMessageWriter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.port = _FakePanelCommandPort()
+        server = await asyncio.start_server(self.port.handle, "127.0.0.1", 0)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        self.writer = DmpMessageWriter(
+            "127.0.0.1",
+            server.sockets[0].getsockname()[1],
+            "1294",
+            "KEY",
+            idle_timeout=0.1,
+            command_timeout=0.5,
+            hangup_timeout=0.05,
+        )
+        self.addAsyncCleanup(self.writer.close)
+
+    async def testSessionReused(self):
+        await self.writer.arm_home()
+        responses = await self.writer.arm_away()
+
+        self.assertEqual([r.command for r in responses], ["!C", "!C"])
+        self.assertEqual(self.port.connections, 1)
+        self.assertEqual(
+            self.port.lines,
+            ["!V0", "!V2KEY             ", "!C01,YN", "!C01,YN", "!C02,YN"],
+        )
+
+    async def testIdleClose(self):
+        await self.writer.arm_home()
+        await asyncio.sleep(0.2)
+
+        self.assertEqual(self.port.lines[-1], "!V0")
+        self.assertEqual(self.port.closed, 1)
+
+        await self.writer.arm_home()
+        self.assertEqual(self.port.connections, 2)
+        self.assertEqual(self.port.lines.count("!V2KEY             "), 2)
+
+    async def testIdleCloseAfterAnotherCommand(self):
+        await self.writer.arm_home()
+        stale = self.writer._idle_handle
+        await self.writer.arm_home()
+
+        # The first timer fired just as the second command took the session.
+        await self.writer._close_idle(stale)
+
+        self.assertEqual(self.port.closed, 0)
+        await self.writer.arm_home()
+        self.assertEqual(self.port.connections, 1)
+
+    async def testReconnectAfterDrop(self):
+        await self.writer.arm_home()
+        self.port.writers[0].close()
+        await asyncio.sleep(0.05)
+
+        await self.writer.arm_home()
+
+        self.assertEqual(self.port.connections, 2)
+        self.assertEqual(
+            self.port.lines[-3:], ["!V0", "!V2KEY             ", "!C01,YN"]
+        )
+
+    async def testRetryAfterDropSendsOnlyUnanswered(self):
+        self.port.drops.add("!C02,YN")
+        responses = []
+
+        await self.writer.send("!C01,YN", "!C02,YN", responses=responses)
+
+        self.assertEqual(len(responses), 2)
+        self.assertEqual(self.port.lines.count("!C01,YN"), 1)
+        self.assertEqual(self.port.lines.count("!C02,YN"), 2)
+        self.assertEqual(self.port.connections, 2)
+
+    async def testNoReplyToHangup(self):
+        self.port.silent.add("!V0")
+
+        responses = await self.writer.arm_home()
+
+        self.assertTrue(responses[0].accepted)
+        self.assertEqual(self.port.lines, ["!V0", "!V2KEY             ", "!C01,YN"])
+
+    async def testRemoteKeyRejected(self):
+        self.port.naks.add("!V2")
+
+        with self.assertRaises(DmpCommandRejectedException):
+            await self.writer.arm_home()
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.port.closed, 1)
+        self.assertNotIn("!C01,YN", self.port.lines)
+
+    async def testLateReplyToHangup(self):
+        # The !V0 ack only comes once the writer has sent the !V2.
+        self.port.delays["!V0"] = 0.1
+        self.port.naks.add("!V2")
+
+        with self.assertRaises(DmpCommandRejectedException):
+            await self.writer.arm_home()
+
+        self.port.naks.clear()
+        responses = await self.writer.arm_home()
+        self.assertEqual(responses[0].command, "!C")
+        self.assertEqual(responses[0].data, "0")
+
+    async def testConnectTimeout(self):
+        async def open_connection(*args):
+            await asyncio.sleep(1)
+
+        with mock.patch("asyncio.open_connection", open_connection):
+            with self.assertRaises(DmpCommandTimeoutException):
+                await self.writer.arm_home()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+import unittest
+from unittest import mock
+
+from dmp.dmp_columns import DmpEventColumns, _numpy, event_columns
+from dmp.dmp_message import parse_message
+from dmp.dmp_types import DmpEventType
+
+
+FRAMES = [
+    '\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\',
+    '\x02E65A   1294 &    0Zc\\020\\t "DC\\z 501\\',
+    '\x02159C   1294 &    1Zq\\062\\t "OP\\u 00107"JEFF FOB        \\a 001"PERIMETER       \\',
+    '\x026565   1294 &    0Zd\\060\\t "A1\\z 630"REPEATER LAUNDRY\\a 001"PERIMETER       \\',
+    "\x0227F7   1294 &    0Zs\\014\\t 071\\",
+    '\x02E60F  12345 &    3Zc\\020\\t "DO\\z 501\\',
+]
+
+
+class TestDmpEventColumns(unittest.TestCase):
+    def setUp(self):
+        with self.assertLogs(level="WARNING"):
+            messages = [parse_message(frame) for frame in FRAMES]
+        self.columns = event_columns(messages, received=3600.0)
+
+    def testColumns(self):
+        columns = self.columns
+
+        self.assertEqual(len(columns), 6)
+        self.assertEqual(list(columns.account), [1294] * 5 + [12345])
+        self.assertEqual(bytes(columns.event_key), b"ccqdsc")
+        self.assertEqual(list(columns.zone), [501, 501, -1, 630, -1, 501])
+        self.assertEqual(list(columns.area), [-1, -1, 1, 1, -1, -1])
+        self.assertEqual(
+            list(columns.occurred), [3600.0] * 2 + [3540.0] + [3600.0] * 2 + [3420.0]
+        )
+        self.assertEqual(
+            columns.decode("event_type", columns.event_type[2]),
+            DmpEventType.AREA_DISARMED,
+        )
+        self.assertEqual(
+            [columns.decode("area_name", code) for code in columns.area_name],
+            [None, None, "PERIMETER", "PERIMETER", None, None],
+        )
+        self.assertEqual(columns.names, ["", "PERIMETER", "REPEATER LAUNDRY"])
+
+    def testAggregates(self):
+        for numpy in (_numpy(), None):
+            with mock.patch("dmp.dmp_columns._numpy", return_value=numpy):
+                self.assertEqual(self.columns.counts("zone"), {501: 3, 630: 1, -1: 2})
+                self.assertEqual(
+                    self.columns.counts("event_type")[DmpEventType.DOOR_STATUS_OPEN],
+                    2,
+                )
+                self.assertEqual(self.columns.bucket_counts(3600), {0.0: 2, 3600.0: 4})
+                self.assertEqual(
+                    self.columns.bucket_counts(3600, "event_key"),
+                    {
+                        (0.0, "c"): 1,
+                        (0.0, "q"): 1,
+                        (3600.0, "c"): 2,
+                        (3600.0, "d"): 1,
+                        (3600.0, "s"): 1,
+                    },
+                )
+
+    def testMalformedNumber(self):
+        columns = event_columns(
+            [parse_message('\x02E60F   1294 &    0Zc\\020\\t "DO\\z 5 1\\')]
+        )
+
+        self.assertEqual(list(columns.zone), [-1])
+
+    @unittest.skipIf(_numpy() is None, "NumPy is not installed")
+    def testColumnIsACopy(self):
+        zone = self.columns.column("zone")
+        self.columns.append(parse_message(FRAMES[0]))
+
+        self.assertEqual(zone.tolist(), [501, 501, -1, 630, -1, 501])
+        self.assertEqual(len(self.columns.column("zone")), 7)
+
+    @unittest.skipIf(_numpy() is None, "NumPy is not installed")
+    def testToNumpy(self):
+        array = self.columns.to_numpy()
+
+        self.assertEqual(array["zone"].tolist(), [501, 501, -1, 630, -1, 501])
+        self.assertEqual(array["minutes_ago"].tolist(), [0, 0, 1, 0, 0, 3])
+        self.assertEqual(len(DmpEventColumns().to_numpy()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
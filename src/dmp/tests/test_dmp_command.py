@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+import unittest
+
+from dmp.dmp_command import parse_command_response
+from dmp.exceptions import DmpInvalidMessageException
+
+
+class TestDmpCommandResponse(unittest.TestCase):
+    def testAck(self):
+        resp = parse_command_response("\x02@ 1294+!C")
+
+        self.assertEqual(resp.account_number, "1294")
+        self.assertTrue(resp.accepted)
+        self.assertEqual(resp.command, "!C")
+        self.assertEqual(resp.data, "")
+
+    def testNak(self):
+        resp = parse_command_response("\x02@ 1294-!V")
+
+        self.assertFalse(resp.accepted)
+        self.assertEqual(resp.command, "!V")
+
+    def testAnswers(self):
+        self.assertTrue(parse_command_response("@ 1294+!C").answers("!C01,YN"))
+        self.assertTrue(parse_command_response("@ 1294+!V2").answers("!V2KEY"))
+        self.assertFalse(parse_command_response("@ 1294+!V0").answers("!V2KEY"))
+        self.assertFalse(parse_command_response("@ 1294+!V").answers("!C01,YN"))
+
+    def testInvalid(self):
+        with self.assertRaises(DmpInvalidMessageException):
+            parse_command_response("garbage")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+import unittest
+
+from dmp.dmp_crc import dmp_crc, frame_crc_matches
+
+
+FRAMES = [
+    b'\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\\r',
+    b'\x02159C   1294 &    1Zq\\062\\t "OP\\u 00107"JEFF FOB        \\'
+    b'a 001"PERIMETER       \\\r',
+    b"\x0227F7   1294 &    0Zs\\014\\t 071\\\r",
+]
+
+
+class TestDmpCrc(unittest.TestCase):
+    def testCheckValue(self):
+        self.assertEqual(dmp_crc(b"123456789"), 0xBB3D)
+        self.assertEqual(dmp_crc(b"x123456789x", 1, 10), 0xBB3D)
+        self.assertEqual(dmp_crc(b"12345678", 0, 8), dmp_crc(b"12345678"))
+        self.assertEqual(dmp_crc(b""), 0)
+
+    def testFrames(self):
+        for frame in FRAMES:
+            buffer = bytearray(b"junk" + frame)
+            self.assertTrue(frame_crc_matches(buffer, 4, len(buffer) - 1))
+
+            buffer[-3] ^= 1
+            self.assertFalse(frame_crc_matches(buffer, 4, len(buffer) - 1))
+
+        self.assertFalse(frame_crc_matches(b"\x02ZZZZ  \r", 0, 7))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+import io
+import unittest
+
+from dmp.dmp_decoder import DmpFrameDecoder, decode_file
+from dmp.dmp_dedup import DmpFrameDeduplicator
+from dmp.dmp_message import DmpDeviceStatusMessage, DmpLowBatteryMessage
+from dmp.dmp_types import DmpEventType
+
+
+DOOR_OPEN = b'\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\\r'
+LOW_BATTERY = (
+    b'\x026565   1294 &    0Zd\\060\\t "A1\\z 630"REPEATER LAUNDRY\\'
+    b'a 001"PERIMETER       \\\r'
+)
+
+
+class TestDmpFrameDecoder(unittest.TestCase):
+    def testSplitAcrossChunks(self):
+        decoder = DmpFrameDecoder()
+        data = DOOR_OPEN + LOW_BATTERY
+
+        messages = []
+        for i in range(0, len(data), 7):
+            messages.extend(decoder.feed(data[i : i + 7]))
+
+        self.assertEqual(len(messages), 2)
+        assert isinstance(
+            messages[0], DmpDeviceStatusMessage
+        ), "Expecting a DmpDeviceStatusMessage"
+        self.assertEqual(messages[0].zone.number, "501")
+        self.assertEqual(messages[0].event_type, DmpEventType.DOOR_STATUS_OPEN)
+        assert isinstance(
+            messages[1], DmpLowBatteryMessage
+        ), "Expecting a DmpLowBatteryMessage"
+        self.assertEqual(messages[1].zone.name, "REPEATER LAUNDRY")
+        self.assertEqual(messages[1].area.name, "PERIMETER")
+        self.assertEqual(decoder.buffered, 0)
+
+    def testPartialFrameIsBuffered(self):
+        decoder = DmpFrameDecoder()
+
+        self.assertEqual(list(decoder.feed(DOOR_OPEN[:-1])), [])
+        self.assertEqual(decoder.buffered, len(DOOR_OPEN) - 1)
+        self.assertEqual(len(list(decoder.feed(b"\r"))), 1)
+
+    def testGarbageBetweenFrames(self):
+        decoder = DmpFrameDecoder()
+
+        messages = list(decoder.feed(b"\n\x00" + DOOR_OPEN + b"\n" + DOOR_OPEN))
+
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(decoder.invalid_frames, 0)
+
+    def testMessageLengthMismatch(self):
+        decoder = DmpFrameDecoder()
+
+        messages = list(decoder.feed(DOOR_OPEN.replace(b"\\020\\", b"\\021\\")))
+
+        self.assertEqual(messages, [None])
+        self.assertEqual(decoder.invalid_frames, 1)
+
+    def testUnknownEventKey(self):
+        decoder = DmpFrameDecoder()
+
+        messages = list(decoder.feed(b"\x02E60F   1294 &    0Zl\\014\\t 071\\\r"))
+
+        self.assertEqual(messages, [None])
+        self.assertEqual(decoder.invalid_frames, 0)
+
+    def testUnknownEventType(self):
+        decoder = DmpFrameDecoder()
+
+        messages = list(decoder.feed(DOOR_OPEN.replace(b'"DO', b'"QQ') + DOOR_OPEN))
+
+        self.assertEqual([m is None for m in messages], [True, False])
+        self.assertEqual(decoder.invalid_frames, 1)
+        self.assertEqual(decoder.account_number, b" 1294")
+
+    def testFieldsThatAreNotUtf8(self):
+        decoder = DmpFrameDecoder()
+        data = (
+            LOW_BATTERY.replace(b"LAUNDRY", b"LAUNDR\xff")
+            + DOOR_OPEN.replace(b"E60F", b"E6\xff\xfe")
+            + DOOR_OPEN
+        )
+
+        messages = list(decoder.feed(data))
+
+        self.assertEqual([m is None for m in messages], [True, True, False])
+        self.assertEqual(decoder.invalid_frames, 2)
+
+    def testMalformedMinutesAndMissingSection(self):
+        decoder = DmpFrameDecoder()
+        data = (
+            DOOR_OPEN.replace(b"&    0", b"& 0  0")
+            + LOW_BATTERY.replace(b"\\z 630", b"\\x 630")
+            + DOOR_OPEN
+        )
+
+        messages = list(decoder.feed(data))
+
+        self.assertEqual([m is None for m in messages], [True, True, False])
+        self.assertEqual(decoder.invalid_frames, 2)
+
+    def testOversizedFrameIsDiscarded(self):
+        decoder = DmpFrameDecoder(max_frame_size=64)
+
+        messages = list(decoder.feed(b"\x02" + b"x" * 100 + DOOR_OPEN))
+
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(decoder.invalid_frames, 1)
+
+    def testAccountNumber(self):
+        decoder = DmpFrameDecoder()
+        other = DOOR_OPEN.replace(b"   1294 ", b"  98765 ")
+
+        accounts = [decoder.account_number for _ in decoder.feed(DOOR_OPEN + other)]
+        self.assertEqual(accounts, [b" 1294", b"98765"])
+
+        accounts = [decoder.account_number for _ in decoder.feed(b"\x02junk\r")]
+        self.assertEqual(accounts, [None])
+
+    def testCrcModes(self):
+        corrupt = DOOR_OPEN.replace(b"501", b"502")
+        data = DOOR_OPEN + LOW_BATTERY + corrupt
+
+        decoder = DmpFrameDecoder()
+        self.assertNotIn(None, list(decoder.feed(data)))
+        self.assertEqual(decoder.crc_failures, 0)
+
+        decoder = DmpFrameDecoder(crc_mode="log")
+        messages = list(decoder.feed(data))
+        self.assertEqual(messages[2].zone.number, "502")
+        self.assertEqual(decoder.crc_failures, 1)
+        self.assertEqual(decoder.invalid_frames, 0)
+
+        decoder = DmpFrameDecoder(crc_mode="reject")
+        messages = list(decoder.feed(data + DOOR_OPEN.replace(b"E60F", b"junk")))
+        self.assertEqual([m is None for m in messages], [False, False, True, True])
+        self.assertEqual(decoder.crc_failures, 2)
+        self.assertEqual(decoder.invalid_frames, 2)
+        self.assertEqual(decoder.account_number, b" 1294")
+
+    def testDuplicatesAcrossConnections(self):
+        dedup = DmpFrameDeduplicator(window=60)
+        first = DmpFrameDecoder(dedup=dedup)
+        second = DmpFrameDecoder(dedup=dedup)
+
+        messages = list(first.feed(DOOR_OPEN + LOW_BATTERY + DOOR_OPEN))
+        self.assertEqual([m is None for m in messages], [False, False, True])
+        accounts = [second.account_number for _ in second.feed(LOW_BATTERY)]
+        self.assertEqual(accounts, [b" 1294"])
+
+        self.assertEqual((first.duplicates, second.duplicates), (1, 1))
+        self.assertEqual(dedup.duplicates, 2)
+        self.assertEqual(first.invalid_frames, 0)
+
+    def testDecodeFile(self):
+        fp = io.BytesIO((DOOR_OPEN + LOW_BATTERY) * 3)
+
+        messages = list(decode_file(fp, chunk_size=16))
+
+        self.assertEqual(len(messages), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+import unittest
+from unittest import mock
+
+from dmp.dmp_dedup import DmpFrameDeduplicator
+
+
+DOOR_OPEN = b'\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\\r'
+DOOR_CLOSED = b'\x02E65A   1294 &    0Zc\\020\\t "DC\\z 501\\\r'
+OTHER_ACCOUNT = DOOR_OPEN.replace(b"  1294", b" 12345")
+
+
+class TestDmpFrameDeduplicator(unittest.TestCase):
+    def testWindow(self):
+        dedup = DmpFrameDeduplicator(window=10)
+
+        with mock.patch("time.monotonic", return_value=1000.0):
+            self.assertFalse(dedup.is_duplicate(DOOR_OPEN))
+            self.assertFalse(dedup.is_duplicate(OTHER_ACCOUNT))
+        with mock.patch("time.monotonic", return_value=1005.0):
+            self.assertFalse(dedup.is_duplicate(DOOR_CLOSED))
+            self.assertTrue(dedup.is_duplicate(DOOR_OPEN))
+        with mock.patch("time.monotonic", return_value=1010.0):
+            self.assertFalse(dedup.is_duplicate(DOOR_OPEN))
+            self.assertTrue(dedup.is_duplicate(DOOR_CLOSED))
+
+        self.assertEqual(dedup.duplicates, 2)
+        self.assertEqual(len(dedup), 2)
+
+    def testMaxEntries(self):
+        dedup = DmpFrameDeduplicator(window=10, max_entries=2)
+
+        for frame in (DOOR_OPEN, DOOR_CLOSED, OTHER_ACCOUNT):
+            self.assertFalse(dedup.is_duplicate(frame))
+        self.assertFalse(dedup.is_duplicate(DOOR_OPEN))
+        self.assertTrue(dedup.is_duplicate(OTHER_ACCOUNT))
+
+        self.assertEqual(len(dedup), 2)
+        self.assertEqual(dedup.evicted, 2)
+
+    def testAfterDelivery(self):
+        dedup = DmpFrameDeduplicator(window=10)
+        calls = []
+
+        self.assertFalse(dedup.is_duplicate(DOOR_OPEN))
+        delivered = dedup.pending(DOOR_OPEN, lambda: calls.append("first"))
+        self.assertTrue(dedup.is_duplicate(DOOR_OPEN))
+        self.assertTrue(dedup.after_delivery(DOOR_OPEN, lambda: calls.append("copy")))
+        self.assertFalse(dedup.after_delivery(DOOR_CLOSED, lambda: None))
+        self.assertEqual(calls, [])
+
+        delivered()
+        self.assertEqual(calls, ["first", "copy"])
+        self.assertFalse(dedup.after_delivery(DOOR_OPEN, lambda: None))
+
+    def testUndeliveredForgotten(self):
+        dedup = DmpFrameDeduplicator(window=10)
+
+        with mock.patch("time.monotonic", return_value=1000.0):
+            dedup.is_duplicate(DOOR_OPEN)
+            dedup.pending(DOOR_OPEN, lambda: None)
+        with mock.patch("time.monotonic", return_value=1010.0):
+            self.assertFalse(dedup.is_duplicate(DOOR_OPEN))
+        self.assertFalse(dedup.after_delivery(DOOR_OPEN, lambda: None))
+
+
+if __name__ == "__main__":
+    unittest.main()
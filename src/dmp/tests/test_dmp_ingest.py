@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from dmp.dmp_ingest import FIELDS, ingest_files, split_file
+
+
+DOOR_OPEN = b'\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\\r'
+DISARMED = (
+    b'\x02159C   1294 &    1Zq\\062\\t "OP\\u 00107"JEFF FOB        \\'
+    b'a 001"PERIMETER       \\\r'
+)
+INVALID = DOOR_OPEN.replace(b"\\020\\", b"\\021\\")
+UNKNOWN_TYPE = DOOR_OPEN.replace(b'"DO', b'"QQ')
+NOT_UTF8 = DOOR_OPEN.replace(b"501", b"5\xff1")
+
+
+class TestDmpIngest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.paths = []
+        for name in ("a.raw", "b.raw"):
+            path = os.path.join(tmp.name, name)
+            with open(path, "wb") as fp:
+                fp.write(
+                    (DOOR_OPEN + DISARMED) * 50
+                    + INVALID
+                    + UNKNOWN_TYPE
+                    + NOT_UTF8
+                    + DOOR_OPEN[:-5]
+                )
+            self.paths.append(path)
+
+    def testSplitFile(self):
+        chunks = split_file(self.paths[0], chunk_bytes=500)
+
+        self.assertGreater(len(chunks), 5)
+        with open(self.paths[0], "rb") as fp:
+            data = fp.read()
+        self.assertEqual(b"".join(data[c.start : c.end] for c in chunks), data)
+        self.assertTrue(all(data[c.start] == 0x02 for c in chunks))
+
+    def testIngestInOrder(self):
+        serial = io.StringIO()
+        stats = ingest_files(self.paths, serial, chunk_bytes=500)
+        parallel = io.StringIO()
+        ingest_files(self.paths, parallel, workers=2, chunk_bytes=500)
+
+        self.assertEqual(parallel.getvalue(), serial.getvalue())
+        records = [json.loads(line) for line in serial.getvalue().splitlines()]
+        self.assertEqual(len(records), 200)
+        self.assertEqual(records[0]["file"], self.paths[0])
+        self.assertEqual(records[0]["zone"], "501")
+        self.assertEqual(records[1]["event_type"], "AREA_DISARMED")
+        self.assertEqual(records[1]["area_name"], "PERIMETER")
+        self.assertEqual(records[199]["file"], self.paths[1])
+
+        self.assertEqual(stats.frames, 206)
+        self.assertEqual(stats.messages, 200)
+        # The three invalid frames and the truncated one at the end of each file.
+        self.assertEqual(stats.invalid_frames, 8)
+        self.assertEqual(stats.unknown_subsections["u"], 100)
+
+    def testCsv(self):
+        output = io.StringIO()
+        ingest_files(self.paths[:1], output, fmt="csv")
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], ",".join(FIELDS))
+        self.assertEqual(len(lines), 101)
+        self.assertIn(",DmpDeviceStatusMessage,DOOR_STATUS_OPEN,", lines[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
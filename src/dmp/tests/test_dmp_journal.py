@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+import unittest
+
+from dmp.dmp_journal import (
+    DmpFrameJournal,
+    DmpJournalListener,
+    journal_accounts,
+    read_journal,
+)
+from dmp.dmp_message import DmpDeviceStatusMessage
+
+
+DOOR_OPEN = b'\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\\r'
+OTHER_ACCOUNT = DOOR_OPEN.replace(b"  1294", b" 12345")
+
+
+class TestDmpFrameJournal(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "journal")
+
+    def write(self, count: int, close: bool = True) -> DmpFrameJournal:
+        journal = DmpFrameJournal(self.path, segment_bytes=2048, index_interval=4)
+        for i in range(count):
+            frame = OTHER_ACCOUNT if i % 10 == 0 else DOOR_OPEN
+            journal.append(frame, "10.0.0.2:4000", received=1000.0 + i)
+        if close:
+            journal.close()
+        else:
+            journal.flush()
+        return journal
+
+    def testReadTimeRange(self):
+        journal = self.write(100)
+        self.assertGreater(journal.segments, 1)
+
+        entries = list(read_journal(self.path, start=1020.0, end=1070.0))
+        self.assertEqual([e.received for e in entries], [1020.0 + i for i in range(50)])
+        self.assertEqual(entries[1].peer, "10.0.0.2:4000")
+        self.assertEqual(entries[1].account_number, "1294")
+        self.assertEqual(entries[1].event_key, "c")
+        self.assertEqual(entries[1].frame, DOOR_OPEN)
+
+    def testReadAccount(self):
+        self.write(100)
+
+        entries = list(read_journal(self.path, account_number="12345"))
+        self.assertEqual(
+            [e.received for e in entries], [1000.0 + i for i in range(0, 100, 10)]
+        )
+        self.assertEqual(journal_accounts(self.path), {"1294", "12345"})
+
+    def testReadUnindexedTail(self):
+        journal = self.write(7, close=False)
+
+        self.assertEqual(len(list(read_journal(self.path))), 7)
+        self.assertEqual(journal_accounts(self.path), {"1294", "12345"})
+        journal.close()
+
+    async def testReplay(self):
+        self.write(20)
+        listener = DmpJournalListener(self.path, start=1005.0, account_number="1294")
+
+        messages = [message async for message in listener.listen()]
+        self.assertEqual(len(messages), 14)
+        self.assertIsInstance(messages[0], DmpDeviceStatusMessage)
+        self.assertEqual(messages[0].zone.number, "501")
+
+    async def testReplaySkipsInvalidFrames(self):
+        journal = DmpFrameJournal(self.path)
+        for frame in (
+            DOOR_OPEN,
+            DOOR_OPEN.replace(b'"DO', b'"QQ'),
+            DOOR_OPEN.replace(b"501", b"5\xff1"),
+            DOOR_OPEN,
+        ):
+            journal.append(frame)
+        journal.close()
+        listener = DmpJournalListener(self.path)
+
+        messages = [message async for message in listener.listen()]
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(listener.frames, 4)
+        self.assertEqual(listener.invalid_frames, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
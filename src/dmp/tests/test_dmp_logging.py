@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+import logging
+import unittest
+from unittest import mock
+
+from dmp.dmp_logging import _sampled_logger
+
+
+class TestDmpSampledLogger(unittest.TestCase):
+    def testCapsRecords(self):
+        logger = _sampled_logger("dmp.tests.sampled")
+        logger.rate = 10
+
+        with self.assertLogs(logger, logging.DEBUG) as logs:
+            with mock.patch("time.monotonic", return_value=100.0):
+                for i in range(30):
+                    logger.debug("Frame %d", i)
+            with mock.patch("time.monotonic", return_value=100.5):
+                for i in range(30, 40):
+                    logger.debug("Frame %d", i)
+
+        self.assertEqual(len(logs.records), 15)
+        self.assertEqual(logs.records[10].getMessage(), "Frame 30 (20 similar dropped)")
+        self.assertEqual(logger.dropped, 25)
+
+    def testWarningsSampledApart(self):
+        logger = _sampled_logger("dmp.tests.warnings")
+        logger.rate = 10
+
+        with self.assertLogs(logger, logging.DEBUG) as logs:
+            with mock.patch("time.monotonic", return_value=100.0):
+                for i in range(30):
+                    logger.debug("Frame %d", i)
+                logger.warning("CRC mismatch")
+                logger.debug("Frame 30")
+
+        self.assertEqual(len(logs.records), 11)
+        self.assertEqual(logs.records[10].getMessage(), "CRC mismatch")
+        self.assertEqual(logger.dropped, 21)
+
+    def testUnsampled(self):
+        logger = _sampled_logger("dmp.tests.unsampled")
+
+        with self.assertLogs(logger, logging.DEBUG) as logs:
+            for i in range(30):
+                logger.debug("Frame %d", i)
+        self.assertEqual(len(logs.records), 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
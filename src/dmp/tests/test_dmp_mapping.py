@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import unittest
+
+from dmp.dmp_mapping import DEFAULT_MAPPING, DmpPublication, DmpTopicMapping
+from dmp.dmp_message import parse_message
+from dmp.dmp_types import DmpEventType
+
+
+DISARMED = parse_message(
+    '\x02159C   1294 &    1Zq\\062\\t "OP\\u 00107"JEFF FOB        \\a 001"PERIMETER       \\'
+)
+ARMED_HOME = parse_message(
+    '\x027E0E   1294 &    0Zq\\062\\t "CL\\u 00000"NO CODE REQUIRED\\a 001"PERIMETER       \\'
+)
+ARMED_AWAY = parse_message(
+    '\x027E0E   1294 &    0Zq\\062\\t "CL\\u 00000"NO CODE REQUIRED\\a 002"INTERIOR        \\'
+)
+DOOR_OPEN = parse_message('\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\')
+DOOR_CLOSED = parse_message('\x02E65A   1294 &    0Zc\\020\\t "DC\\z 501\\')
+LOW_BATTERY = parse_message(
+    '\x026565   1294 &    0Zd\\060\\t "A1\\z 630"REPEATER LAUNDRY\\a 001"PERIMETER       \\'
+)
+TROUBLE = parse_message(
+    '\x026565   1294 &    0Zt\\060\\t "BU\\z 005"FRONT DOOR\\a 001"PERIMETER       \\'
+)
+
+
+class TestDmpTopicMapping(unittest.TestCase):
+    def testDefaultMapping(self):
+        mapping = DmpTopicMapping(DEFAULT_MAPPING)
+
+        self.assertEqual(
+            [
+                mapping.publication(message)
+                for message in (
+                    DISARMED,
+                    ARMED_HOME,
+                    ARMED_AWAY,
+                    DOOR_OPEN,
+                    DOOR_CLOSED,
+                    LOW_BATTERY,
+                )
+            ],
+            [
+                DmpPublication("dmp/1294/alarm", "disarmed", 0, True),
+                DmpPublication("dmp/1294/alarm", "armed_home", 0, True),
+                DmpPublication("dmp/1294/alarm", "armed_away", 0, True),
+                DmpPublication("dmp/1294/status/501", "on", 0, True),
+                DmpPublication("dmp/1294/status/501", "off", 0, True),
+                DmpPublication("dmp/1294/low_battery", "REPEATER LAUNDRY", 0, False),
+            ],
+        )
+        self.assertIsNone(mapping.publication(TROUBLE))
+        self.assertEqual(
+            mapping.retained_topic_filters, ("dmp/+/alarm", "dmp/+/status/+")
+        )
+
+    def testCustomRule(self):
+        mapping = DmpTopicMapping(
+            [
+                {
+                    "message": "DmpZoneTroubleMessage",
+                    "zone": ["005", "006"],
+                    "topic": "dmp/{account}/trouble/{zone}",
+                    "payload": "{event} in {area_name}",
+                    "qos": 1,
+                }
+            ]
+        )
+
+        self.assertEqual(
+            mapping.publication(TROUBLE),
+            DmpPublication(
+                "dmp/1294/trouble/005", "ZONE_BURGLARY in PERIMETER", 1, False
+            ),
+        )
+        self.assertTrue(mapping.accepts("t", DmpEventType.ZONE_FIRE))
+        self.assertFalse(mapping.accepts("c", DmpEventType.DOOR_STATUS_OPEN))
+        self.assertEqual(mapping.retained_topic_filters, ())
+
+    def testInvalidRules(self):
+        rule = {"message": "DmpZoneAlarmMessage", "topic": "t", "payload": "p"}
+
+        for invalid in (
+            {"message": "DmpNoSuchMessage"},
+            {"event_type": "NO_SUCH_EVENT"},
+            {"topic": "dmp/{no_such_field}"},
+            {"message": "DmpArmingStatusMessage", "topic": "dmp/{zone}"},
+            {"retian": True},
+        ):
+            with self.subTest(invalid=invalid):
+                with self.assertRaises(ValueError):
+                    DmpTopicMapping([{**rule, **invalid}])
+
+
+if __name__ == "__main__":
+    unittest.main()
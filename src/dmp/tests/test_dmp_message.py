@@ -3,6 +3,7 @@ import unittest
 
 from dmp.dmp_message import (
     parse_message,
+    DmpLazyMessage,
     DmpDeviceStatusMessage,
     DmpArmingStatusMessage,
     DmpSystemMessageMessage,
@@ -77,6 +78,48 @@ class TestDmpMessage(unittest.TestCase):
         ), "Expecting a DmpSystemMessageMessage"
         self.assertEqual(msg.event_type, DmpEventType.SYSTEM_TIME_REQUEST)
 
+    def testLazy(self):
+        msg = parse_message(
+            '\x026565   1294 &    0Zd\\060\\t "A1\\z 630"REPEATER LAUNDRY\\a 001"PERIMETER       \\',
+            lazy=True,
+        )
+
+        assert isinstance(msg, DmpLazyMessage), "Expecting a DmpLazyMessage"
+        self.assertIs(msg.message_class, DmpLowBatteryMessage)
+        self.assertEqual(msg.account_number, "1294")
+        self.assertEqual(msg.event_type, DmpEventType.ZONE_AUXILIARY_1)
+        self.assertIsNone(msg._message, "Body not parsed before it is read")
+        self.assertEqual(msg.zone.name, "REPEATER LAUNDRY")
+        self.assertEqual(msg.area.number, "001")
+        assert isinstance(
+            msg.message, DmpLowBatteryMessage
+        ), "Expecting a DmpLowBatteryMessage"
+
+    def testFilter(self):
+        seen = []
+
+        def accept(event_key, event_type):
+            seen.append((event_key, event_type))
+            return event_key != "c"
+
+        self.assertIsNone(
+            parse_message(
+                '\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\', accept=accept
+            )
+        )
+        msg = parse_message("\x0227F7   1294 &    0Zs\\014\\t 071\\", accept=accept)
+
+        assert isinstance(
+            msg, DmpSystemMessageMessage
+        ), "Expecting a DmpSystemMessageMessage"
+        self.assertEqual(
+            seen,
+            [
+                ("c", DmpEventType.DOOR_STATUS_OPEN),
+                ("s", DmpEventType.SYSTEM_TIME_REQUEST),
+            ],
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import asyncio
+import socket
+import unittest
+
+from dmp.dmp_metrics import DmpCounter, DmpHistogram, DmpMetrics, serve_metrics
+from dmp.dmp_message import DmpDeviceStatusMessage
+from dmp.dmp_types import DmpEventType
+
+
+class TestDmpMetrics(unittest.TestCase):
+    def testCounter(self):
+        counter = DmpCounter("dmp_messages_total", "Messages", ("cls", "event"))
+        counter.inc(DmpDeviceStatusMessage, DmpEventType.DOOR_STATUS_OPEN)
+        counter.inc(DmpDeviceStatusMessage, DmpEventType.DOOR_STATUS_OPEN, amount=2)
+
+        self.assertEqual(
+            list(counter.render())[-1],
+            'dmp_messages_total{cls="DmpDeviceStatusMessage",'
+            'event="DOOR_STATUS_OPEN"} 3',
+        )
+
+    def testHistogram(self):
+        histogram = DmpHistogram("latency", "Latency", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        self.assertEqual(
+            list(histogram.render())[2:],
+            [
+                'latency_bucket{le="0.1"} 2',
+                'latency_bucket{le="1.0"} 3',
+                'latency_bucket{le="+Inf"} 4',
+                "latency_sum 2.65",
+                "latency_count 4",
+            ],
+        )
+
+    def testCollector(self):
+        metrics = DmpMetrics()
+        metrics.add_collector(
+            "gauge", "Queue depth", lambda: [("dmp_queue_depth", {}, 7)]
+        )
+
+        self.assertIn(
+            "# TYPE dmp_queue_depth gauge\ndmp_queue_depth 7\n", metrics.render()
+        )
+
+
+class TestServeMetrics(unittest.IsolatedAsyncioTestCase):
+    async def testServe(self):
+        metrics = DmpMetrics()
+        metrics.frames_received.inc("10.0.0.5", amount=3)
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        server = await serve_metrics(metrics, port, "127.0.0.1")
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK\r\n"))
+        self.assertIn(b'dmp_frames_received_total{peer="10.0.0.5"} 3', response)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+import unittest
+from unittest import mock
+
+from dmp.dmp_publish_cache import DmpPublishCache
+
+
+class TestDmpPublishCache(unittest.TestCase):
+    def testSuppressUnchanged(self):
+        cache = DmpPublishCache()
+
+        self.assertTrue(cache.should_publish("dmp/1294/status/501", "on"))
+        self.assertFalse(cache.should_publish("dmp/1294/status/501", "on"))
+        self.assertTrue(cache.should_publish("dmp/1294/status/502", "on"))
+        self.assertTrue(cache.should_publish("dmp/1294/status/501", "off"))
+
+        self.assertEqual(cache.emitted, 3)
+        self.assertEqual(cache.suppressed, 1)
+
+    def testSeed(self):
+        cache = DmpPublishCache()
+        cache.seed("dmp/1294/alarm", "disarmed")
+
+        self.assertFalse(cache.should_publish("dmp/1294/alarm", "disarmed"))
+        self.assertTrue(cache.should_publish("dmp/1294/alarm", "armed_away"))
+
+    def testRefreshInterval(self):
+        cache = DmpPublishCache(refresh_interval=60)
+
+        with mock.patch("time.monotonic", return_value=1000.0):
+            self.assertTrue(cache.should_publish("dmp/1294/alarm", "disarmed"))
+        with mock.patch("time.monotonic", return_value=1059.0):
+            self.assertFalse(cache.should_publish("dmp/1294/alarm", "disarmed"))
+        with mock.patch("time.monotonic", return_value=1060.0):
+            self.assertTrue(cache.should_publish("dmp/1294/alarm", "disarmed"))
+
+
+if __name__ == "__main__":
+    unittest.main()
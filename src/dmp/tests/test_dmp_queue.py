@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import unittest
+
+from dmp.dmp_message import parse_message
+from dmp.dmp_queue import DmpMessageQueue
+
+
+DOOR_OPEN = parse_message('\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\')
+LOW_BATTERY = parse_message(
+    '\x026565   1294 &    0Zd\\060\\t "A1\\z 630"REPEATER LAUNDRY\\a 001"PERIMETER       \\'
+)
+
+
+class TestDmpMessageQueue(unittest.IsolatedAsyncioTestCase):
+    async def testDelay(self):
+        queue = DmpMessageQueue(maxsize=2, low_watermark=1, policy="delay")
+
+        self.assertTrue(queue.offer(DOOR_OPEN))
+        self.assertTrue(queue.offer(DOOR_OPEN))
+        self.assertFalse(queue.offer(LOW_BATTERY))
+        self.assertTrue(queue.overloaded)
+
+        await queue.get()
+        self.assertFalse(queue.offer(LOW_BATTERY), "Still above the low watermark")
+        await queue.get()
+        self.assertTrue(queue.offer(LOW_BATTERY))
+        self.assertEqual(queue.high_watermark_hits, 1)
+        self.assertEqual(queue.low_watermark_hits, 1)
+
+    async def testDropKeepsAlarms(self):
+        queue = DmpMessageQueue(maxsize=2, policy="drop")
+
+        queue.offer(DOOR_OPEN)
+        queue.offer(LOW_BATTERY)
+        queue.offer(LOW_BATTERY)
+        queue.offer(LOW_BATTERY)
+        queue.offer(DOOR_OPEN)
+
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual(
+            [await queue.get() for _ in range(queue.qsize())],
+            [LOW_BATTERY, LOW_BATTERY, LOW_BATTERY],
+        )
+
+    async def testSpillKeepsOrder(self):
+        queue = DmpMessageQueue(maxsize=2, policy="spill")
+        messages = [DOOR_OPEN, LOW_BATTERY] * 5
+
+        for message in messages:
+            self.assertTrue(queue.offer(message))
+        self.assertEqual(queue.spilled, 8)
+
+        received = [await queue.get() for _ in range(5)]
+        queue.offer(DOOR_OPEN)
+        received += [await queue.get() for _ in range(queue.qsize())]
+
+        self.assertEqual(received, messages + [DOOR_OPEN])
+        self.assertEqual(queue.qsize(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
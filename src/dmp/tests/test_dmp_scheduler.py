@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import asyncio
+import unittest
+
+from dmp.dmp_scheduler import PRIORITY_ARMING, DmpCommandScheduler
+from dmp.exceptions import DmpCommandRejectedException
+
+
+class TestDmpCommandScheduler(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.batches = []
+
+        async def send(*msgs, responses):
+            self.batches.append(msgs)
+            responses.extend(f"ok {msg}" for msg in msgs)
+            return responses
+
+        self.scheduler = DmpCommandScheduler(send)
+
+    async def run_pending(self):
+        task = asyncio.ensure_future(self.scheduler.run())
+        await asyncio.sleep(0)
+        task.cancel()
+
+    async def testDuplicatesAreMerged(self):
+        first = self.scheduler.submit("ARM_AWAY", ("!C01,YN", "!C02,YN"))
+        second = self.scheduler.submit("ARM_AWAY", ("!C01,YN", "!C02,YN"))
+        self.assertIs(first, second)
+        self.assertEqual(self.scheduler.queue_depth, 1)
+
+        await self.run_pending()
+
+        self.assertEqual(self.batches, [("!C01,YN", "!C02,YN")])
+        self.assertEqual(await first, ["ok !C01,YN", "ok !C02,YN"])
+
+    async def testConflictingCommandReplacesPending(self):
+        away = self.scheduler.submit("ARM_AWAY", ("!C01,YN", "!C02,YN"), group="arming")
+        home = self.scheduler.submit("ARM_HOME", ("!C01,YN",), group="arming")
+
+        await self.run_pending()
+
+        self.assertEqual(self.batches, [("!C01,YN",)])
+        self.assertEqual(await away, ["ok !C01,YN"])
+        self.assertEqual(await home, ["ok !C01,YN"])
+
+    async def testPriorityAndBatching(self):
+        other = self.scheduler.submit("OTHER", ("!X",))
+        home = self.scheduler.submit(
+            "ARM_HOME", ("!C01,YN",), group="arming", priority=PRIORITY_ARMING
+        )
+
+        await self.run_pending()
+
+        self.assertEqual(self.batches, [("!C01,YN", "!X")])
+        self.assertEqual(await home, ["ok !C01,YN"])
+        self.assertEqual(await other, ["ok !X"])
+        self.assertEqual(self.scheduler.stats["ARM_HOME"].count, 1)
+        self.assertEqual(self.scheduler.queue_depth, 0)
+
+    async def testFailure(self):
+        async def send(*msgs, responses):
+            raise ConnectionRefusedError()
+
+        scheduler = DmpCommandScheduler(send)
+        future = scheduler.submit("ARM_HOME", ("!C01,YN",))
+        task = asyncio.ensure_future(scheduler.run())
+        await asyncio.sleep(0)
+        task.cancel()
+
+        with self.assertRaises(ConnectionRefusedError):
+            await future
+        self.assertEqual(scheduler.stats["ARM_HOME"].failures, 1)
+
+    async def testFailureInBatch(self):
+        async def send(*msgs, responses):
+            for msg in msgs:
+                if msg == "!X":
+                    raise DmpCommandRejectedException(msg)
+                responses.append(f"ok {msg}")
+            return responses
+
+        scheduler = DmpCommandScheduler(send)
+        away = scheduler.submit("ARM_AWAY", ("!C01,YN", "!C02,YN"), priority=0)
+        other = scheduler.submit("OTHER", ("!Y", "!X"), priority=1)
+        last = scheduler.submit("LAST", ("!Z",), priority=2)
+        task = asyncio.ensure_future(scheduler.run())
+        await asyncio.sleep(0)
+        task.cancel()
+
+        self.assertEqual(await away, ["ok !C01,YN", "ok !C02,YN"])
+        with self.assertRaises(DmpCommandRejectedException):
+            await other
+        with self.assertRaises(DmpCommandRejectedException):
+            await last
+        self.assertEqual(scheduler.stats["ARM_AWAY"].failures, 0)
+        self.assertEqual(scheduler.stats["OTHER"].failures, 1)
+        self.assertEqual(scheduler.stats["LAST"].failures, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
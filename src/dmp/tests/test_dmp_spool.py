@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+import mmap
+import os
+import tempfile
+import unittest
+
+from dmp.dmp_mapping import DmpPublication
+from dmp.dmp_spool import DmpOutboundSpool
+from dmp.exceptions import DmpSpoolFullException
+
+
+ALARM = DmpPublication("dmp/1294/alarm", "triggered", 0, True)
+
+
+def door(zone: int) -> DmpPublication:
+    return DmpPublication(f"dmp/1294/status/{zone}", "on", 0, True)
+
+
+class TestDmpOutboundSpool(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "spool")
+
+    def drain(self, spool: DmpOutboundSpool):
+        result = []
+        while spool:
+            result.append(spool.peek())
+            spool.pop()
+        return result
+
+    def testReplaysInOrder(self):
+        spool = DmpOutboundSpool(self.path, max_bytes=4096)
+        published = [door(1), ALARM, door(2), door(3), ALARM]
+
+        for _ in range(10):
+            for publication in published:
+                spool.append(publication, keep=publication is ALARM)
+            self.assertEqual(self.drain(spool), published)
+        spool.close()
+
+    def testEvictsOldestButKeepsAlarms(self):
+        spool = DmpOutboundSpool(self.path, max_bytes=400, keep_bytes=200)
+
+        spool.append(ALARM, keep=True)
+        for zone in range(100, 120):
+            spool.append(door(zone))
+
+        remaining = self.drain(spool)
+        self.assertEqual(remaining[0], ALARM)
+        self.assertEqual(remaining[-1], door(119))
+        self.assertEqual(spool.evicted, 21 - len(remaining))
+        self.assertGreater(spool.evicted, 0)
+
+        with self.assertRaises(DmpSpoolFullException):
+            for _ in range(10):
+                spool.append(ALARM, keep=True)
+        spool.close()
+
+    def testReopen(self):
+        spool = DmpOutboundSpool(self.path, max_bytes=4096)
+        for zone in range(10):
+            spool.append(door(zone), keep=zone == 5)
+        spool.pop()
+        spool.close()
+
+        spool = DmpOutboundSpool(self.path)
+        self.assertEqual(self.drain(spool), [door(zone) for zone in range(1, 10)])
+        spool.close()
+
+    def testDropsDamagedRecords(self):
+        spool = DmpOutboundSpool(self.path, max_bytes=4096, keep_bytes=1024)
+        for zone in range(10):
+            spool.append(door(zone))
+        spool.close()
+
+        # The topic of the fourth record in the ring of unkept publishes.
+        with open(self.path, "r+b") as fp:
+            data = fp.read()
+            start = mmap.PAGESIZE + 1024
+            fp.seek(data.index(b"status/3", start))
+            fp.write(b"STATUS")
+
+        spool = DmpOutboundSpool(self.path)
+        self.assertEqual(self.drain(spool), [door(zone) for zone in range(3)])
+        spool.append(door(10))
+        self.assertEqual(self.drain(spool), [door(10)])
+        spool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import unittest
+
+from dmp.dmp_mapping import DmpPublication
+from dmp.dmp_message import parse_message
+from dmp.dmp_state import DmpStateStore
+from dmp.dmp_types import DmpEventType
+
+
+ALARM = (
+    '\x020000   1294 &    2Za\\060\\t "BU\\z 005"FRONT DOOR      \\'
+    'a 001"PERIMETER       \\'
+)
+RESTORE = '\x020000   1294 &    0Zr\\023\\t "BU\\z 005\\'
+DISARMED = (
+    '\x02159C   1294 &    1Zq\\062\\t "OP\\u 00107"JEFF FOB        \\'
+    'a 001"PERIMETER       \\'
+)
+DOOR_OPEN = '\x02E60F   1294 &    0Zc\\020\\t "DO\\z 501\\'
+OTHER_ACCOUNT = DOOR_OPEN.replace("  1294", " 12345")
+
+
+class TestDmpStateStore(unittest.TestCase):
+    def setUp(self):
+        self.state = DmpStateStore()
+        for frame in (ALARM, DISARMED, DOOR_OPEN, OTHER_ACCOUNT):
+            self.state.update(parse_message(frame), received=10000.0)
+
+    def testZone(self):
+        zone = self.state.get("1294", "zone", "005")
+        self.assertEqual(zone.name, "FRONT DOOR")
+        self.assertEqual(zone.message, "DmpZoneAlarmMessage")
+        self.assertEqual(zone.event_type, DmpEventType.ZONE_BURGLARY)
+        self.assertEqual(zone.occurred, 10000.0 - 120)
+        self.assertEqual(zone.status, "alarm")
+        self.assertEqual(
+            [s.number for s in self.state.states("1294", status="alarm")], ["005"]
+        )
+
+        # The restore has neither the zone's name nor its area.
+        self.state.update(parse_message(RESTORE))
+        zone = self.state.get("1294", "zone", "005")
+        self.assertEqual((zone.name, zone.status), ("FRONT DOOR", "normal"))
+        self.assertEqual(self.state.states(status="alarm"), [])
+
+    def testArea(self):
+        area = self.state.get("1294", "area", "001")
+        self.assertEqual(area.name, "PERIMETER")
+        self.assertEqual(area.status, "disarmed")
+        self.assertEqual(area.event_type, DmpEventType.AREA_DISARMED)
+
+        # An alarm in the area does not change whether it is armed.
+        self.state.update(parse_message(ALARM))
+        area = self.state.get("1294", "area", "001")
+        self.assertEqual(
+            (area.message, area.status), ("DmpZoneAlarmMessage", "disarmed")
+        )
+
+    def testIndexes(self):
+        self.assertEqual(len(self.state), 4)
+        self.assertEqual(len(self.state.states("1294")), 3)
+        self.assertEqual(len(self.state.states(kind="zone")), 3)
+        self.assertEqual(self.state.states(kind="device"), [])
+        self.assertIsNone(self.state.get("12345", "zone", "005"))
+        self.assertIsNotNone(self.state.get("12345", "zone", "501"))
+
+    def testSnapshot(self):
+        self.state.retained(DmpPublication("dmp/1294/alarm", "triggered", 0, True))
+        self.state.retained(DmpPublication("dmp/1294/status/501", "on", 0, True))
+        self.state.retained(DmpPublication("dmp/1294/alarm", "disarmed", 0, True))
+
+        self.assertEqual(
+            self.state.snapshot(),
+            [
+                DmpPublication("dmp/1294/alarm", "disarmed", 0, True),
+                DmpPublication("dmp/1294/status/501", "on", 0, True),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
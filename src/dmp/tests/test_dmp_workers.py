@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import functools
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+from dmp.dmp_workers import run_workers
+
+
+def _record(path, *fields):
+    with open(path, "a") as fp:
+        fp.write(" ".join(str(field) for field in fields) + "\n")
+
+
+def _exit_at_once(index, path):
+    _record(path, "start", index, os.getpid())
+
+
+def _run_forever(index, path):
+    _record(path, "start", index, os.getpid())
+    while True:
+        time.sleep(1)
+
+
+def _lines(path, kind):
+    with open(path) as fp:
+        return [line.split()[1:] for line in fp if line.startswith(kind + " ")]
+
+
+class TestRunWorkers(unittest.TestCase):
+    def supervise(self, workers, target, until, **kwargs):
+        """
+        Runs the supervisor until `until(path)` is true of the file its workers
+        record their starts in, then stops it with SIGTERM. The restart delays
+        are recorded there too instead of being waited out.
+        """
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "record")
+        open(path, "w").close()
+
+        supervisor = multiprocessing.Process(
+            target=run_workers,
+            args=(workers, target, (path,)),
+            kwargs=dict(kwargs, sleep=functools.partial(_record, path, "sleep")),
+        )
+        supervisor.start()
+        deadline = time.monotonic() + 30
+        while not until(path):
+            self.assertLess(time.monotonic(), deadline, "Workers did not start")
+            time.sleep(0.01)
+        supervisor.terminate()
+        supervisor.join(30)
+        self.assertEqual(supervisor.exitcode, 0)
+        return path
+
+    def testRestartWithBackoff(self):
+        path = self.supervise(
+            1,
+            _exit_at_once,
+            lambda path: len(_lines(path, "start")) >= 6,
+            restart_delay=1.0,
+            max_restart_delay=8.0,
+        )
+
+        # Doubling from restart_delay, up to max_restart_delay, since every
+        # worker exits well within max_restart_delay of starting.
+        delays = [float(delay) for delay, in _lines(path, "sleep")]
+        self.assertGreaterEqual(len(delays), 5)
+        self.assertEqual(delays[:5], [1.0, 2.0, 4.0, 8.0, 8.0])
+
+    def testShutdownStopsWorkers(self):
+        path = self.supervise(
+            2, _run_forever, lambda path: len(_lines(path, "start")) >= 2
+        )
+
+        starts = _lines(path, "start")
+        self.assertEqual(sorted(index for index, _ in starts), ["0", "1"])
+        self.assertEqual(_lines(path, "sleep"), [])
+        for _, pid in starts:
+            with self.assertRaises(ProcessLookupError):
+                os.kill(int(pid), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()